@@ -1,9 +1,14 @@
+import asyncio
+import functools
 import logging
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone, date as DateObject
-from typing import List, Dict, Optional, Tuple, Any
+from typing import List, Dict, Optional, Tuple, Any, AsyncIterator, Awaitable, Callable, FrozenSet, Iterable, Sequence, TypeVar, Union
 import pandas as pd
 import time # For custom credential default expiry
+import uuid
 
 from azure.core.credentials import AccessToken, TokenCredential # For custom credential
 from azure.mgmt.costmanagement import CostManagementClient
@@ -15,12 +20,26 @@ from azure.mgmt.costmanagement.models import (
     QueryGrouping,
     ExportType, TimeframeType, QueryFilter, # Added QueryFilter
     QueryComparisonExpression, # Added QueryComparisonExpression
-    ForecastDefinition  # Import ForecastDefinition
+    ForecastDefinition,  # Import ForecastDefinition
+    QueryColumn,
+    QueryResult
 )
 from azure.mgmt.subscription import SubscriptionClient
 from azure.mgmt.resource.resources import ResourceManagementClient # New import for tags
 from azure.core.exceptions import HttpResponseError, ClientAuthenticationError
+from azure.core.rest import HttpRequest
 from app.core.config import settings
+from app.core.cost_entries import CostEntryTable, gzip_chunks, iter_entries_csv
+from app.core.cost_parser import ColumnarCostAccumulator, DATE_COLUMN_NAMES_PRIORITY, parse_query_result_columnar, parse_usage_date
+from app.core.cost_warehouse import WarehouseRow, contiguous_windows, cost_warehouse
+from app.core.query_planner import (
+    ShardRowMerger, finer_grouping, month_shards, plan_window, query_planner_stats, slice_rows, superset_grouping
+)
+from app.core.cost_forecast import CostProjection, cross_check, forecast_stats, projection_window
+from app.core.cost_cache import build_cost_cache_key, cost_cache_ttl_for_period, cost_result_cache
+from app.core.client_pool import azure_client_pool
+from app.core.rate_limiter import azure_request_scheduler
+from app.core.security import get_identity_hash, get_token_expiry, get_token_tenant_id, get_verified_identity_hash, scope_permissions
 from app.models.cost import AzureSubscription # Pydantic model
 from fastapi import HTTPException
 
@@ -65,29 +84,535 @@ class CustomBearerTokenCredential(TokenCredential):
             # raise ClientAuthenticationError(message="The wrapped token is expired.")
         return AccessToken(self._token_string, self._expires_on)
 
+# Clients come from azure_client_pool (client_pool.py): one client per caller token, reused across requests
+# and sharing one keep-alive HTTP session, instead of a new client, pipeline and TLS connection per request.
+def _token_expires_on(user_access_token: str, user_token_expires_on: Optional[int]) -> Optional[int]:
+    """The caller-provided expiry, else the token's exp claim (pooled clients must not outlive their token)."""
+    if user_token_expires_on is not None:
+        return user_token_expires_on
+    expires_at = get_token_expiry(user_access_token)
+    return int(expires_at) if expires_at is not None else None
+
 def get_cost_management_client(user_access_token: str, user_token_expires_on: Optional[int] = None) -> CostManagementClient:
-    """Initializes CostManagementClient with a user-provided Bearer token via custom credential."""
+    """Returns the pooled CostManagementClient for a user-provided Bearer token (custom credential)."""
     if not audience:
         raise ValueError("AZURE_RESOURCE_MANAGER_AUDIENCE must be configured.")
-    credential = CustomBearerTokenCredential(user_access_token, user_token_expires_on)
-    return CostManagementClient(credential=credential, base_url=endpoint, credential_scopes=[f"{audience}/.default"])
+    expires_on = _token_expires_on(user_access_token, user_token_expires_on)
+    return azure_client_pool.get("cost-management", user_access_token, expires_on, lambda transport: CostManagementClient(
+        credential=CustomBearerTokenCredential(user_access_token, expires_on),
+        base_url=endpoint, credential_scopes=[f"{audience}/.default"], transport=transport
+    ))
 
 def get_subscription_client(user_access_token: str, user_token_expires_on: Optional[int] = None) -> SubscriptionClient:
-    """Initializes SubscriptionClient with a user-provided Bearer token via custom credential."""
-    credential = CustomBearerTokenCredential(user_access_token, user_token_expires_on)
-    return SubscriptionClient(credential=credential, base_url=endpoint, credential_scopes=[f"{audience}/.default"])
-def get_resource_management_client(user_access_token: str, user_token_expires_on: Optional[int] = None) -> ResourceManagementClient:
-    """Initializes ResourceManagementClient with a user-provided Bearer token."""
-    credential = CustomBearerTokenCredential(user_access_token, user_token_expires_on)
+    """Returns the pooled SubscriptionClient for a user-provided Bearer token (custom credential)."""
+    expires_on = _token_expires_on(user_access_token, user_token_expires_on)
+    return azure_client_pool.get("subscription", user_access_token, expires_on, lambda transport: SubscriptionClient(
+        credential=CustomBearerTokenCredential(user_access_token, expires_on),
+        base_url=endpoint, credential_scopes=[f"{audience}/.default"], transport=transport
+    ))
+
+def get_resource_management_client(
+        user_access_token: str,
+        user_token_expires_on: Optional[int] = None,
+        subscription_id: str = "dummy-will-be-overridden-by-operation"
+) -> ResourceManagementClient:
+    """Returns the pooled ResourceManagementClient for a user-provided Bearer token and subscription."""
+    expires_on = _token_expires_on(user_access_token, user_token_expires_on)
     # Note: ResourceManagementClient typically doesn't need credential_scopes specified at client level for general ARM operations
-    return ResourceManagementClient(credential=credential, subscription_id="dummy-will-be-overridden-by-operation", base_url=endpoint)
-    
+    return azure_client_pool.get("resource-management", user_access_token, expires_on, lambda transport: ResourceManagementClient(
+        credential=CustomBearerTokenCredential(user_access_token, expires_on),
+        subscription_id=subscription_id, base_url=endpoint, transport=transport
+    ), extra_key=subscription_id.lower())
+
+def close_azure_client_pool() -> None:
+    """Closes the pooled SDK clients and their shared HTTP session. Called from the application shutdown hook."""
+    azure_client_pool.close()
+
+
+# --- Blocking SDK Execution ---
+# The azure-mgmt-* clients used here are synchronous. Every SDK call (including draining paged iterators)
+# is pushed onto this bounded pool so a slow Cost Management request never stalls the event loop for other users.
+T = TypeVar("T")
+_azure_sdk_executor = ThreadPoolExecutor(max_workers=settings.AZURE_SDK_MAX_WORKERS, thread_name_prefix="azure-sdk")
+
+async def _run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Runs a blocking Azure SDK call on the shared SDK executor and awaits its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_azure_sdk_executor, functools.partial(func, *args, **kwargs))
+
+def shutdown_azure_sdk_executor() -> None:
+    """Stops the SDK executor. Called from the application shutdown hook."""
+    _azure_sdk_executor.shutdown(wait=False, cancel_futures=True)
+
+async def _call_azure(access_token: str, throttle_scope: str, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Runs an Azure SDK call through the shared rate-limit scheduler and the SDK executor.
+    The scheduler holds the call back while the tenant/scope is known to be throttled and learns
+    remaining quota from the response headers (via raw_response_hook, applied to every page of paged calls).
+    """
+    async with azure_request_scheduler.slot(get_token_tenant_id(access_token), throttle_scope) as slot:
+        try:
+            return await _run_blocking(func, *args, raw_response_hook=slot.observe_response, **kwargs)
+        except HttpResponseError as e:
+            slot.observe_error(e)
+            raise
+
+
+# --- Request Coalescing (single-flight) ---
+# Upstream calls currently in progress and the identity that started each of them. Cost queries are keyed on
+# their scope + query definition only (not the caller), so concurrent users asking for the same window share one call.
+_inflight_requests: Dict[str, "asyncio.Future[Any]"] = {}
+_inflight_owners: Dict[str, Optional[str]] = {}
+single_flight_stats = {"upstream_calls": 0, "coalesced_calls": 0, "cross_identity_coalesced_calls": 0, "cross_identity_denied": 0}
+
+COST_QUERY_ACTION = "Microsoft.CostManagement/query/read"
+COST_FORECAST_ACTION = "Microsoft.CostManagement/forecast/read"
+
+async def _single_flight(
+        key: str,
+        fetch: Callable[[], Awaitable[T]],
+        owner: Optional[str] = None,
+        authorize: Optional[Callable[[], Awaitable[bool]]] = None
+) -> T:
+    """
+    Runs `fetch` once for all concurrent callers with the same key; later callers await the shared result
+    (or exception) instead of issuing their own upstream call. The shared call keeps running if the
+    caller that started it is cancelled, so the remaining waiters still get their result.
+    A caller whose `owner` differs from the one that started the call only joins it once `authorize()` allows
+    it; otherwise it runs its own call.
+    """
+    inflight = _inflight_requests.get(key)
+    if inflight is not None and _inflight_owners.get(key) != owner:
+        if authorize is not None and await authorize():
+            single_flight_stats["cross_identity_coalesced_calls"] += 1
+        else:
+            single_flight_stats["cross_identity_denied"] += 1
+            key = f"{key}:{owner}"
+        inflight = _inflight_requests.get(key)
+    if inflight is not None:
+        single_flight_stats["coalesced_calls"] += 1
+        return await asyncio.shield(inflight)
+    single_flight_stats["upstream_calls"] += 1
+    task = asyncio.ensure_future(fetch())
+    _inflight_requests[key] = task
+    _inflight_owners[key] = owner
+
+    def forget(_: "asyncio.Future[Any]") -> None:
+        _inflight_requests.pop(key, None)
+        _inflight_owners.pop(key, None)
+
+    task.add_done_callback(forget)
+    return await asyncio.shield(task)
+
+async def _get_cached_or_fetch(
+        cache_key: str,
+        ttl_seconds: Optional[float],
+        fetch: Callable[[], Awaitable[T]],
+        access_token: Optional[str] = None,
+        shared_scope: Optional[str] = None,
+        action: str = COST_QUERY_ACTION
+) -> T:
+    """
+    Serves `cache_key` from the cost result cache, otherwise fetches it (single-flight) and stores the result.
+    With the caller's `access_token` and the query's `shared_scope`, the fetch is coalesced with the same query
+    of other identities (their results are identical): a verified caller joins another identity's call once
+    scope_permissions confirms it may run `action` on the scope. Cached results stay per identity.
+    """
+    cached = await cost_result_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"Serving {cache_key.split(':', 1)[0]} from cache.")
+        return cached
+
+    fetched = False
+
+    async def fetch_and_store():
+        nonlocal fetched
+        fetched = True
+        value = await fetch()
+        await cost_result_cache.set(cache_key, value, ttl_seconds=ttl_seconds)
+        return value
+
+    identity_hash = get_verified_identity_hash(access_token) if access_token is not None and shared_scope is not None else None
+    if identity_hash is None:
+        return await _single_flight(cache_key, fetch_and_store)
+
+    namespace, _, digest = cache_key.split(":", 2)
+    value = await _single_flight(
+        f"{namespace}:{digest}", fetch_and_store, owner=identity_hash,
+        authorize=lambda: scope_permissions.allows(access_token, shared_scope, action)
+    )
+    if not fetched:
+        await cost_result_cache.set(cache_key, value, ttl_seconds=ttl_seconds)
+    return value
+
+
+# --- Query Result Pagination ---
+def _fetch_next_query_page(cost_mgmt_client: CostManagementClient, next_link: str, parameters: Any, **kwargs: Any) -> QueryResult:
+    """
+    Fetches the page behind a QueryResult.next_link. Cost Management pages are requested by POSTing the
+    original query/forecast definition to the next link (it carries the $skiptoken); the SDK does not follow them itself.
+    The request goes through the client's pipeline (auth, retries, raw_response_hook) via send_request of its ARM
+    pipeline client. CostManagementClient only has a private _send_request, so this relies on the generated client's
+    private `_client` attribute (present in the azure-mgmt-costmanagement version pinned in requirements.txt).
+    """
+    request = HttpRequest("POST", next_link, json=parameters.serialize())
+    response = cost_mgmt_client._client.send_request(request, stream=False, **kwargs)
+    if response.status_code >= 400:
+        raise HttpResponseError(response=response)
+    return QueryResult.deserialize(response.json())
+
+async def _iter_query_result_pages(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        scope: str,
+        operation: Callable[..., QueryResult],
+        parameters: Any
+) -> AsyncIterator[QueryResult]:
+    """
+    Runs a Cost Management query (query.usage or forecast.usage) and yields its result pages in order,
+    following next_link until the last page. Each page goes through the rate-limit scheduler on its own.
+    """
+    page = await _call_azure(access_token, scope, operation, scope=scope, parameters=parameters)
+    page_count = 1
+    while page is not None:
+        yield page
+        next_link = getattr(page, "next_link", None)
+        if not next_link:
+            return
+        if page_count >= settings.COST_QUERY_MAX_PAGES:
+            raise ValueError(f"Cost query for {scope} returned more than {settings.COST_QUERY_MAX_PAGES} pages. Narrow the time range or grouping.")
+        page = await _call_azure(access_token, scope, _fetch_next_query_page, cost_mgmt_client, next_link, parameters)
+        page_count += 1
+
+async def _query_and_parse(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        scope: str,
+        operation: Callable[..., QueryResult],
+        parameters: Any,
+        include_resource_group_in_parsing: bool = True,
+        expected_granularity: str = "None",
+        entry_type: str = "actual"
+) -> Tuple[float, str, Dict[str, float], CostEntryTable]:
+    """
+    Runs a (possibly paginated) Cost Management query and parses every page as it arrives, with the
+    COST_PARSER_ENGINE accumulator, so only one page of raw rows is held at a time.
+    Returns the same tuple as _parse_cost_management_query_result.
+    """
+    accumulator = _cost_accumulator(include_resource_group_in_parsing, expected_granularity, entry_type)
+    async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, operation, parameters):
+        if page.columns and page.rows:
+            accumulator.add_page(page.columns, page.rows)
+    if accumulator.page_count > 1:
+        logger.debug(f"Parsed {accumulator.row_count} rows from {accumulator.page_count} pages for {scope}.")
+    return accumulator.result()
+
+
+async def _query_and_parse_sharded(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        scope: str,
+        query_definition: QueryDefinition,
+        include_resource_group_in_parsing: bool = True,
+        expected_granularity: str = "None"
+) -> Tuple[float, str, Dict[str, float], CostEntryTable]:
+    """
+    _query_and_parse for query.usage that splits windows longer than COST_QUERY_SHARD_MIN_DAYS into calendar-month
+    queries. Up to COST_QUERY_SHARD_CONCURRENCY shards are fetched at once (each page still goes through the
+    rate-limit scheduler) and folded into the COST_PARSER_ENGINE accumulator in date order, each as soon as it and
+    the shards before it are in; a shard's slot is only freed once it is folded, so at most that many shards are
+    buffered. Daily and Monthly shards cover disjoint dates and are parsed directly. With granularity None the
+    same group appears in several shards, so rows are summed per group (ShardRowMerger) and parsed at the end.
+    Totals and entry order do not depend on which shard finished first.
+    """
+    time_period = query_definition.time_period
+    shards = month_shards(time_period.from_property.date(), time_period.to.date(), settings.COST_QUERY_SHARD_MIN_DAYS) if settings.COST_QUERY_SHARD_MIN_DAYS > 0 else []
+    if len(shards) <= 1:
+        return await _query_and_parse(
+            access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition,
+            include_resource_group_in_parsing=include_resource_group_in_parsing, expected_granularity=expected_granularity
+        )
+
+    semaphore = asyncio.Semaphore(settings.COST_QUERY_SHARD_CONCURRENCY)
+    tzinfo = time_period.from_property.tzinfo
+
+    async def fetch_shard(first_day: DateObject, last_day: DateObject) -> List[Tuple[List[Any], List[Any]]]:
+        """The shard's non-empty pages (columns, rows). Holds a semaphore slot that the consumer releases after folding."""
+        shard_definition = QueryDefinition(
+            type=query_definition.type,
+            timeframe=query_definition.timeframe,
+            time_period=QueryTimePeriod(
+                from_property=datetime.combine(first_day, datetime.min.time(), tzinfo=tzinfo),
+                to=datetime.combine(last_day, datetime.max.time(), tzinfo=tzinfo)
+            ),
+            dataset=query_definition.dataset
+        )
+        await semaphore.acquire()
+        try:
+            query_planner_stats["shard_queries"] += 1
+            return [
+                (page.columns, page.rows)
+                async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, shard_definition)
+                if page.columns and page.rows
+            ]
+        except BaseException:
+            semaphore.release()
+            raise
+
+    logger.info(f"Splitting cost query for {scope} into {len(shards)} month shards ({shards[0][0]} to {shards[-1][1]}).")
+    query_planner_stats["sharded_queries"] += 1
+    accumulator = _cost_accumulator(include_resource_group_in_parsing, expected_granularity)
+    merger = ShardRowMerger() if expected_granularity.lower() not in ("daily", "monthly") else None
+    # Tasks take their slots in creation order (asyncio.Semaphore is FIFO), i.e. in date order.
+    # Folded shards are dropped from `pending`, which frees their pages.
+    pending = deque(asyncio.ensure_future(fetch_shard(first_day, last_day)) for first_day, last_day in shards)
+    try:
+        while pending:
+            pages = await pending[0]
+            pending.popleft()
+            try:
+                for columns, rows in pages:
+                    if merger is not None:
+                        merger.add_page([col.name for col in columns], rows)
+                    else:
+                        accumulator.add_page(columns, rows)
+            finally:
+                semaphore.release()
+            del pages
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        raise
+    if merger is not None:
+        column_names, rows = merger.result()
+        accumulator.add_page([QueryColumn(name=name) for name in column_names], rows)
+    return accumulator.result()
+
+
+# --- Local Cost Warehouse ---
+async def _register_warehouse_access(access_token: str, subscription_id: str) -> None:
+    """Records a successful subscription query so the warehouse may serve (and ingest) this subscription for the caller."""
+    if cost_warehouse is None or not cost_warehouse.is_open:
+        return
+    try:
+        await asyncio.to_thread(cost_warehouse.register_access, access_token, subscription_id)
+    except Exception as e:
+        logger.warning(f"Could not register warehouse access for subscription {subscription_id}: {e}", exc_info=True)
+
+async def _refresh_warehouse_tail(access_token: str, subscription_id: str, first_day: DateObject, last_day: DateObject) -> bool:
+    """
+    Incremental refresh for a request: re-fetches only the window's stale / missing trailing days (at most
+    COST_WAREHOUSE_INCREMENTAL_MAX_DAYS back) with the caller's token and merges them into the stored days.
+    Returns False when the gap is too large for that, so the caller queries Azure for the whole window.
+    """
+    due_days = await asyncio.to_thread(cost_warehouse.refreshable_days, access_token, subscription_id, first_day, last_day)
+    if not due_days:
+        return due_days is not None
+
+    async def fetch_and_store():
+        for window_first, window_last in contiguous_windows(due_days):
+            rows = await fetch_daily_cost_rows(access_token, subscription_id, window_first, window_last)
+            await asyncio.to_thread(cost_warehouse.store_days, subscription_id, window_first, window_last, rows)
+        cost_warehouse.incremental_refreshes += 1
+        return True
+
+    logger.info(f"Refreshing {len(due_days)} trailing days of subscription {subscription_id} in the cost warehouse ({due_days[0]} to {due_days[-1]}).")
+    # Concurrent requests for the same subscription tail share one refresh.
+    return await _single_flight(f"warehouse-refresh:{subscription_id.lower()}:{due_days[0]}:{due_days[-1]}", fetch_and_store)
+
+async def _warehouse_rows(
+        access_token: str,
+        subscription_id: str,
+        first_day: DateObject,
+        last_day: DateObject,
+        granularity: str,
+        grouping_dimensions: List[str],
+        resource_group: Optional[str] = None
+) -> Optional[Tuple[List[str], List[List[Any]]]]:
+    """
+    Aggregated warehouse rows (CostWarehouse.query_rows) for an untagged window, refreshing stale trailing days
+    first when needed. None when the warehouse cannot serve the window (the caller queries Azure instead).
+    """
+    if cost_warehouse is None or not cost_warehouse.is_open:
+        return None
+    try:
+        local_rows = await asyncio.to_thread(
+            cost_warehouse.query_rows, access_token, subscription_id, first_day, last_day, granularity, grouping_dimensions, resource_group
+        )
+        if local_rows is None and await _refresh_warehouse_tail(access_token, subscription_id, first_day, last_day):
+            local_rows = await asyncio.to_thread(
+                cost_warehouse.query_rows, access_token, subscription_id, first_day, last_day, granularity, grouping_dimensions, resource_group
+            )
+    except Exception as e:
+        logger.warning(f"Cost warehouse query failed for subscription {subscription_id}, falling back to Azure: {e}", exc_info=True)
+        return None
+    return local_rows
+
+async def _query_warehouse_actuals(
+        access_token: str,
+        subscription_id: str,
+        time_period: QueryTimePeriod,
+        granularity: str,
+        grouping_dimensions: List[str],
+        include_resource_group_in_parsing: bool,
+        resource_group: Optional[str] = None
+) -> Optional[Tuple[float, str, Dict[Any, float], CostEntryTable]]:
+    """
+    Answers an untagged actual-cost query from the local warehouse, parsed exactly like the Azure result would be.
+    Stale trailing days are refreshed incrementally first (_refresh_warehouse_tail). Returns None (query Azure
+    instead) when the warehouse is disabled, the caller has no recorded access, or the window has a larger gap.
+    """
+    local_rows = await _warehouse_rows(
+        access_token, subscription_id, time_period.from_property.date(), time_period.to.date(), granularity, grouping_dimensions, resource_group
+    )
+    if local_rows is None:
+        return None
+    column_names, rows = local_rows
+    logger.debug(f"Serving {len(rows)} aggregated rows for subscription {subscription_id} from the cost warehouse.")
+    accumulator = _cost_accumulator(include_resource_group_in_parsing, granularity)
+    accumulator.add_page([QueryColumn(name=name) for name in column_names], rows)
+    return accumulator.result()
+
+def _daily_query_definition(
+        first_day: DateObject,
+        last_day: DateObject,
+        grouping: Sequence[str],
+        tag_filters: Optional[List[dict]] = None,
+        subscription_ids: Optional[List[str]] = None
+) -> QueryDefinition:
+    time_period = QueryTimePeriod(
+        from_property=datetime.combine(first_day, datetime.min.time()),
+        to=datetime.combine(last_day, datetime.max.time())
+    )
+    return _build_query_definition(time_period, "Daily", list(grouping), tag_filters, subscription_ids)
+
+async def _query_planned_actuals(
+        access_token: str,
+        identity_hash: str,
+        subscription_id: str,
+        time_period: QueryTimePeriod,
+        granularity: str,
+        grouping: List[str],
+        include_resource_group_in_parsing: bool,
+        tag_filters: Optional[List[dict]] = None,
+        resource_group: Optional[str] = None
+) -> Optional[Tuple[float, str, Dict[Any, float], CostEntryTable]]:
+    """
+    Query planner: a window inside query_planner.superset_window (MonthToDate, BillingMonthToDate, TheLast7Days,
+    TheLast30Days, ...) is answered by slicing one canonical Daily superset query per scope and filter set, so every
+    timeframe tab and granularity shares a single upstream query. The superset is cached like other results; a
+    cached finer superset (with ResourceID) also serves coarser requests. Returns None when the window or
+    granularity is not covered (the caller queries Azure for it directly).
+    """
+    if not settings.COST_QUERY_PLANNER_ENABLED:
+        return None
+    first_day, last_day = time_period.from_property.date(), time_period.to.date()
+    window = plan_window(first_day, last_day, granularity)
+    if window is None:
+        return None
+    scope = f"/subscriptions/{subscription_id}" + (f"/resourceGroups/{resource_group}" if resource_group is not None else "")
+
+    def superset_cache_key(superset_dimensions: List[str]) -> str:
+        definition = _daily_query_definition(window[0], window[1], superset_dimensions, tag_filters)
+        return build_cost_cache_key("superset-daily", identity_hash, scope, definition.serialize(keep_readonly=True))
+
+    finer_dimensions = finer_grouping(grouping, resource_group)
+    rows = await cost_result_cache.get(superset_cache_key(finer_dimensions)) if finer_dimensions is not None else None
+    if rows is None:
+        superset_dimensions = superset_grouping(grouping, resource_group)
+
+        async def fetch_superset():
+            query_planner_stats["superset_queries"] += 1
+            logger.info(f"Querying Daily superset for scope: {scope} ({window[0]} to {window[1]}, grouped by {superset_dimensions or 'date'})")
+            superset_rows = await fetch_daily_cost_rows(access_token, subscription_id, window[0], window[1], tag_filters, resource_group, superset_dimensions)
+            return [list(row) for row in superset_rows]
+
+        superset_ttl = cost_cache_ttl_for_period(datetime.combine(window[1], datetime.max.time()))  # The superset always ends today
+        rows = await _get_cached_or_fetch(superset_cache_key(superset_dimensions), superset_ttl, fetch_superset, access_token, scope)
+    query_planner_stats["planned_queries"] += 1
+    column_names, planned_rows = await asyncio.to_thread(slice_rows, rows, first_day, last_day, granularity, grouping)
+    logger.debug(f"Serving {len(planned_rows)} aggregated rows for {scope} from the Daily superset.")
+    accumulator = _cost_accumulator(include_resource_group_in_parsing, granularity)
+    accumulator.add_page([QueryColumn(name=name) for name in column_names], planned_rows)
+    return accumulator.result()
+
+async def fetch_daily_cost_rows(
+        access_token: str,
+        subscription_id: str,
+        first_day: DateObject,
+        last_day: DateObject,
+        tag_filters: Optional[List[dict]] = None,
+        resource_group: Optional[str] = None,
+        grouping: Sequence[str] = ("ResourceGroupName", "ResourceID")
+) -> List[WarehouseRow]:
+    """
+    Fetches Daily ActualCost rows grouped by `grouping` (by default ResourceGroupName + ResourceID, untagged, for the
+    warehouse ingestion; the query planner also fetches tagged / resource group supersets with it).
+    Returns (YYYYMMDD, resource group, resource id, currency, cost) tuples, None for dimensions not grouped by;
+    raises HttpResponseError on Azure errors.
+    """
+    cost_mgmt_client = get_cost_management_client(user_access_token=access_token)
+    scope = f"/subscriptions/{subscription_id}" + (f"/resourceGroups/{resource_group}" if resource_group is not None else "")
+    query_definition = _daily_query_definition(first_day, last_day, grouping, tag_filters)
+    warehouse_rows: List[WarehouseRow] = []
+    async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition):
+        if page.columns and page.rows:
+            warehouse_rows.extend(_daily_rows_from_page([col.name for col in page.columns], page.rows))
+    return warehouse_rows
+
+def _daily_rows_from_page(column_names: List[str], rows: Iterable[Sequence[Any]]) -> List[WarehouseRow]:
+    """(YYYYMMDD, resource group, resource id, currency, cost) tuples of Daily query rows; rows without a date are skipped."""
+    column_map = {name.lower(): idx for idx, name in enumerate(column_names)}
+    cost_idx, currency_idx = column_map.get("cost"), column_map.get("currency")
+    date_idx = next((column_map[name] for name in DATE_COLUMN_NAMES_PRIORITY if name in column_map), None)
+    if cost_idx is None or currency_idx is None or date_idx is None:
+        raise ValueError(f"Essential columns missing in query result. Found: {column_names}")
+    rg_idx, resource_id_idx = column_map.get("resourcegroupname"), column_map.get("resourceid")
+    date_keys: Dict[Any, Optional[int]] = {}
+    warehouse_rows: List[WarehouseRow] = []
+    for row in rows:
+        date_val = row[date_idx]
+        if date_val not in date_keys:
+            date_str = parse_usage_date(date_val)[1]
+            date_keys[date_val] = int(date_str.replace("-", "")) if date_str else None
+        usage_date = date_keys[date_val]
+        if usage_date is None:
+            continue
+        warehouse_rows.append((
+            usage_date,
+            row[rg_idx] if rg_idx is not None else None,
+            row[resource_id_idx] if resource_id_idx is not None else None,
+            str(row[currency_idx]),
+            float(row[cost_idx])
+        ))
+    return warehouse_rows
+
 
 # --- File Storage ---
 GENERATED_REPORTS_DIR = "generated_reports"
-os.makedirs(GENERATED_REPORTS_DIR, exist_ok=True)
+# Report formats and their file extensions (compressed CSV reports use .csv.gz)
+REPORT_FILE_EXTENSIONS = {"csv": ".csv", "excel": ".xlsx", "parquet": ".parquet", "arrow": ".arrow"}
 
 # --- Helper Functions ---
+# Sections of a subscription cost response callers can ask for with `include`; sections not asked for are never queried.
+COST_SECTIONS = ("totals", "resource_groups", "detailed_entries", "yearly_forecast")
+
+def parse_cost_sections(include: Optional[Union[str, Iterable[str]]]) -> FrozenSet[str]:
+    """
+    Normalizes an `include` value (comma-separated string or list) to a set of COST_SECTIONS.
+    None or empty means every section. Raises ValueError for unknown section names.
+    """
+    if include is None:
+        return frozenset(COST_SECTIONS)
+    items = include.split(",") if isinstance(include, str) else include
+    sections = {item.strip().lower() for item in items if item and item.strip()}
+    if not sections:
+        return frozenset(COST_SECTIONS)
+    unknown = sections.difference(COST_SECTIONS)
+    if unknown:
+        raise ValueError(f"Unknown include section(s): {', '.join(sorted(unknown))}. Choose from: {', '.join(COST_SECTIONS)}.")
+    return frozenset(sections)
+
 def _determine_time_period(timeframe: str, from_date: Optional[DateObject] = None, to_date: Optional[DateObject] = None) -> QueryTimePeriod:
     """
     Determines the QueryTimePeriod object for the cost query.
@@ -160,176 +685,267 @@ def _get_current_month_period() -> QueryTimePeriod:
 
     return QueryTimePeriod(from_property=start_datetime, to=end_datetime)
 
+def _build_query_definition(
+        time_period: QueryTimePeriod,
+        granularity: str,
+        grouping_dimensions: List[str],
+        tag_filters: Optional[List[dict]] = None,
+        subscription_ids: Optional[List[str]] = None
+) -> QueryDefinition:
+    """
+    Builds the ActualCost QueryDefinition shared by the subscription / resource group / scope queries and the warehouse ingestion.
+    tag_filters is a list of dicts like [{"name": "tag_key", "operator": "In", "values": ["value1"]}], ANDed together.
+    subscription_ids restricts a management group / billing scope query to those subscriptions.
+    """
+    grouping = [QueryGrouping(name=name, type="Dimension") for name in grouping_dimensions]
+    query_definition = QueryDefinition(
+        type=ExportType.ACTUAL_COST, # "ActualCost"
+        timeframe=TimeframeType.CUSTOM, # We use custom because QueryTimePeriod is explicit
+        time_period=time_period,
+        dataset=QueryDataset(
+            granularity=granularity if granularity.lower() != "none" else None, # API expects None for total, not string "None"
+            aggregation={"totalCost": QueryAggregation(name="Cost", function="Sum")},
+            grouping=grouping if grouping else None,
+            filter=None # Initialize filter as None
+        )
+    )
+
+    # Apply tag / subscription filters if provided
+    if tag_filters or subscription_ids:
+        filter_expressions = []
+        for tf in tag_filters or []:
+            filter_expressions.append(
+                QueryFilter(tags=QueryComparisonExpression(name=tf["name"], operator=tf["operator"], values=tf["values"]))
+            )
+        if subscription_ids:
+            filter_expressions.append(
+                QueryFilter(dimensions=QueryComparisonExpression(name="SubscriptionId", operator="In", values=subscription_ids))
+            )
+
+        if len(filter_expressions) == 1:
+            query_definition.dataset.filter = filter_expressions[0]
+        elif len(filter_expressions) > 1:
+            query_definition.dataset.filter = QueryFilter(and_property=filter_expressions)
+    return query_definition
+
 def _parse_cost_management_query_result(
         query_result: Any,
         include_resource_group_in_parsing: bool = True,
         expected_granularity: str = "None",
         entry_type: str = "actual"
-) -> Tuple[float, str, Dict[str, float], List[Dict[str, Any]]]:
+) -> Tuple[float, str, Dict[str, float], CostEntryTable]:
     """
     Parses the raw result from the Cost Management API query.
+    Uses the columnar engine (cost_parser.py) when COST_PARSER_ENGINE is "columnar" and the result is regular,
+    otherwise the row-by-row parser. Both produce identical results.
     Returns: total_cost, currency, costs_by_rg (if applicable), detailed_entries
     """
-    total_overall_cost = 0.0
-    currency = "USD"
-    costs_by_rg: Dict[str, float] = {}
-    detailed_entries_list: List[Dict[str, Any]] = [] # For table/list view of costs
-    monthly_aggregated_costs: Dict[Tuple[int, int], float] = {} # For (year, month_num): cost, used for yearly breakdown
+    if settings.COST_PARSER_ENGINE.lower() == "columnar":
+        parsed = parse_query_result_columnar(query_result, include_resource_group_in_parsing, expected_granularity, entry_type)
+        if parsed is not None:
+            return parsed
+    total, currency, costs_by_rg, entries = _parse_cost_management_query_result_rows(query_result, include_resource_group_in_parsing, expected_granularity, entry_type)
+    return total, currency, costs_by_rg, CostEntryTable.from_records(entries)
+
+class RowCostAccumulator:
+    """
+    Row-by-row parser for raw Cost Management query results, fed one result page at a time like
+    cost_parser.ColumnarCostAccumulator (COST_PARSER_ENGINE="python"), so only one page of raw rows is held at once.
+    Sums run unrounded across pages and are rounded in result(), exactly as for a single combined page.
+    """
     RG_PREFIX_FILTER = "caz-"
 
-    if not query_result or not hasattr(query_result, 'rows') or not hasattr(query_result, 'columns'):
-        logger.warning("Query result is empty or malformed.")
-        return total_overall_cost, currency, costs_by_rg, detailed_entries_list
-    
-    rows = query_result.rows
-    if not rows:
-        logger.debug("Query returned no data rows for this specific parsing context.")
-        return total_overall_cost, currency, costs_by_rg, detailed_entries_list
-    
-    # Map column names to their indices for robust parsing
-    column_map = {col.name.lower(): idx for idx, col in enumerate(query_result.columns)}
-    logger.debug(f"Parsing query result with columns: {list(column_map.keys())}. include_rg_parsing: {include_resource_group_in_parsing}")
-    if not include_resource_group_in_parsing and query_result.rows: # Log first few rows for monthly/forecast data
-        if rows:
-            logger.debug(f"Sample rows for non-RG (monthly/forecast) parsing (up to 3): {rows[:3]}")
-    elif include_resource_group_in_parsing and query_result.rows:
-        if rows:
-            logger.debug(f"Sample rows for RG parsing (up to 3): {rows[:3]}")
-
-    # Expected column names
-    cost_col_name = "cost"
-    currency_col_name = "currency"
-    rg_col_name = "resourcegroupname"
-    # For monthly granularity, Azure might return 'billingmonth', 'month', 'year' or 'usagedate' as first of month.
-    # We'll try to be flexible.
-    date_col_names_priority = ["usagedate", "billingmonth"] # Add other potential date column names if observed
-
-    resource_id_col_name = "resourceid"
-    # For monthly granularity, date might be just 'Month', 'Year' or a specific date format
-
-    # Get indices safely
-    cost_idx = column_map.get(cost_col_name)
-    currency_idx = column_map.get(currency_col_name)
-    rg_idx = column_map.get(rg_col_name) if include_resource_group_in_parsing else None
+    def __init__(self, include_resource_group_in_parsing: bool = True, expected_granularity: str = "None", entry_type: str = "actual"):
+        self.include_resource_group_in_parsing = include_resource_group_in_parsing
+        self.expected_granularity = expected_granularity.lower()
+        self.entry_type = entry_type
+        self.total_overall_cost = 0.0
+        self.currency = "USD"
+        self.costs_by_rg: Dict[str, float] = {}
+        self.detailed_entries: List[Dict[str, Any]] = [] # For table/list view of costs
+        self.monthly_aggregated_costs: Dict[Tuple[int, int], float] = {} # For (year, month_num): cost, used for yearly breakdown
+        self.row_count = 0
+        self.page_count = 0
+
+    def add_page(self, columns_meta: Sequence[Any], rows: Sequence[Sequence[Any]]) -> None:
+        """Adds one page of rows. Raises ValueError if the essential Cost/Currency columns are missing."""
+        self.page_count += 1
+        if not rows:
+            return
+        self.row_count += len(rows)
+        # Map column names to their indices for robust parsing
+        column_map = {col.name.lower(): idx for idx, col in enumerate(columns_meta)}
+
+        # Expected column names
+        cost_col_name = "cost"
+        currency_col_name = "currency"
+        rg_col_name = "resourcegroupname"
+        # For monthly granularity, Azure might return 'billingmonth', 'month', 'year' or 'usagedate' as first of month.
+        # We'll try to be flexible.
+        date_col_names_priority = ["usagedate", "billingmonth"] # Add other potential date column names if observed
+
+        resource_id_col_name = "resourceid"
+        # For monthly granularity, date might be just 'Month', 'Year' or a specific date format
+
+        # Get indices safely
+        cost_idx = column_map.get(cost_col_name)
+        currency_idx = column_map.get(currency_col_name)
+        rg_idx = column_map.get(rg_col_name) if self.include_resource_group_in_parsing else None
     
-    date_idx = None
-    for name in date_col_names_priority:
-        if name in column_map:
-            date_idx = column_map[name]
-            logger.debug(f"Using date column '{name}' at index {date_idx} for parsing.")
-            break
-    resource_id_idx = column_map.get(resource_id_col_name)
-
-
-    if cost_idx is None or currency_idx is None:
-        original_column_names = [col.name for col in query_result.columns]
-        logger.warning(f"Essential columns '{cost_col_name}' or '{currency_col_name}' not found in query result. Columns: {column_map.keys()}")
-        raise ValueError(f"Essential columns missing in query result. Cannot parse costs. Found: {original_column_names}")
+        date_idx = None
+        for name in date_col_names_priority:
+            if name in column_map:
+                date_idx = column_map[name]
+                logger.debug(f"Using date column '{name}' at index {date_idx} for parsing.")
+                break
+        resource_id_idx = column_map.get(resource_id_col_name)
+
+
+        if cost_idx is None or currency_idx is None:
+            original_column_names = [col.name for col in columns_meta]
+            logger.warning(f"Essential columns '{cost_col_name}' or '{currency_col_name}' not found in query result. Columns: {column_map.keys()}")
+            raise ValueError(f"Essential columns missing in query result. Cannot parse costs. Found: {original_column_names}")
     
 
-    for row_data in rows:
-        try:
-            cost = float(row_data[cost_idx])
-            row_currency = str(row_data[currency_idx])
-            if currency == "USD" and row_currency:
-                currency = row_currency
-
-            total_overall_cost += cost
-
-            entry: Dict[str, Any] = {
-                "amount": round(cost, 2),
-                "currency": row_currency,
-                "entry_type": entry_type
-            }
+        for row_data in rows:
+            try:
+                cost = float(row_data[cost_idx])
+                row_currency = str(row_data[currency_idx])
+                if self.currency == "USD" and row_currency:
+                    self.currency = row_currency
+
+                self.total_overall_cost += cost
+
+                entry: Dict[str, Any] = {
+                    "amount": round(cost, 2),
+                    "currency": row_currency,
+                    "entry_type": self.entry_type
+                }
             
-            rg_name_from_row = None
-            is_actual_cost_col_name = "isactualcost"
-            is_actual_cost_idx = column_map.get(is_actual_cost_col_name)
-
-            if rg_idx is not None and len(row_data) > rg_idx and row_data[rg_idx] is not None:
-                rg_name_from_row = str(row_data[rg_idx])
-            entry["resourceGroupName"] = rg_name_from_row if rg_name_from_row else "N/A"
-
-            resource_id_from_row = None
-            # Corrected condition: check against resource_id_idx for length, not rg_idx
-            if resource_id_idx is not None and len(row_data) > resource_id_idx and row_data[resource_id_idx] is not None:
-                resource_id_from_row = str(row_data[resource_id_idx])
-            entry["resourceId"] = resource_id_from_row
-
-            parsed_date_for_monthly_agg = None
-            parsed_date_str = None # New variable to hold the YYYY-MM-DD string
-            if date_idx is not None and len(row_data) > date_idx and row_data[date_idx] is not None:
-                # UsageDate is often an integer (YYYYMMDD) or a string representation
-                date_val = row_data[date_idx]
-                logger.debug(f"Attempting to parse date_val: {date_val} (type: {type(date_val)}) for monthly agg: {not include_resource_group_in_parsing}")
-                try:
-                    if isinstance(date_val, int): # YYYYMMDD format
-                        parsed_date_for_monthly_agg = datetime.strptime(str(date_val), "%Y%m%d")
-                        parsed_date_str = parsed_date_for_monthly_agg.strftime("%Y-%m-%d")
-                    elif isinstance(date_val, str):
-                        date_str_to_parse = date_val.split("T")[0] # Get YYYY-MM-DD part
-                        if len(date_str_to_parse) == 10 and date_str_to_parse.count('-') == 2: # YYYY-MM-DD
-                            parsed_date_for_monthly_agg = datetime.strptime(date_str_to_parse, "%Y-%m-%d")
-                            parsed_date_str = date_str_to_parse
-                        elif len(date_str_to_parse) == 8 and date_str_to_parse.isdigit(): # YYYYMMDD as string
-                            parsed_date_for_monthly_agg = datetime.strptime(date_str_to_parse, "%Y%m%d")
-                            parsed_date_str = parsed_date_for_monthly_agg.strftime("%Y-%m-%d")
-                        else: # Fallback to fromisoformat for more complex ISO strings
-                            parsed_date_for_monthly_agg = datetime.fromisoformat(date_val.replace("Z", "+00:00").split("T")[0])
+                rg_name_from_row = None
+                is_actual_cost_col_name = "isactualcost"
+                is_actual_cost_idx = column_map.get(is_actual_cost_col_name)
+
+                if rg_idx is not None and len(row_data) > rg_idx and row_data[rg_idx] is not None:
+                    rg_name_from_row = str(row_data[rg_idx])
+                entry["resourceGroupName"] = rg_name_from_row if rg_name_from_row else "N/A"
+
+                resource_id_from_row = None
+                # Corrected condition: check against resource_id_idx for length, not rg_idx
+                if resource_id_idx is not None and len(row_data) > resource_id_idx and row_data[resource_id_idx] is not None:
+                    resource_id_from_row = str(row_data[resource_id_idx])
+                entry["resourceId"] = resource_id_from_row
+
+                parsed_date_for_monthly_agg = None
+                parsed_date_str = None # New variable to hold the YYYY-MM-DD string
+                if date_idx is not None and len(row_data) > date_idx and row_data[date_idx] is not None:
+                    # UsageDate is often an integer (YYYYMMDD) or a string representation
+                    date_val = row_data[date_idx]
+                    logger.debug(f"Attempting to parse date_val: {date_val} (type: {type(date_val)}) for monthly agg: {not self.include_resource_group_in_parsing}")
+                    try:
+                        if isinstance(date_val, int): # YYYYMMDD format
+                            parsed_date_for_monthly_agg = datetime.strptime(str(date_val), "%Y%m%d")
                             parsed_date_str = parsed_date_for_monthly_agg.strftime("%Y-%m-%d")
-                    else:
-                        logger.debug(f"Unsupported date type {type(date_val)} for value {date_val}")
-                except ValueError:
-                    logger.debug(f"Could not parse date string {date_val} into YYYY-MM-DD format.")
-            entry["date"] = parsed_date_str
-
-            # Determine entry type, using IsActualCost if available, otherwise fallback to date check
-            final_entry_type = entry_type # Start with the passed-in default
-            if is_actual_cost_idx is not None and len(row_data) > is_actual_cost_idx and row_data[is_actual_cost_idx] is not None:
-                # Primary method: Use the 'IsActualCost' boolean column from the forecast API
-                final_entry_type = "actual" if row_data[is_actual_cost_idx] else "forecast"
-            elif parsed_date_str and expected_granularity.lower() == 'daily':
-                # Fallback for daily granularity if IsActualCost is missing: check if the date is in the future
-                entry_date_obj = DateObject.fromisoformat(parsed_date_str)
-                if entry_date_obj > datetime.now(timezone.utc).date():
-                    final_entry_type = "forecast"
-            entry["entry_type"] = final_entry_type
-
-            if include_resource_group_in_parsing and rg_name_from_row:
-                if rg_name_from_row.startswith(RG_PREFIX_FILTER):
-                    costs_by_rg[rg_name_from_row] = costs_by_rg.get(rg_name_from_row, 0.0) + cost
+                        elif isinstance(date_val, str):
+                            date_str_to_parse = date_val.split("T")[0] # Get YYYY-MM-DD part
+                            if len(date_str_to_parse) == 10 and date_str_to_parse.count('-') == 2: # YYYY-MM-DD
+                                parsed_date_for_monthly_agg = datetime.strptime(date_str_to_parse, "%Y-%m-%d")
+                                parsed_date_str = date_str_to_parse
+                            elif len(date_str_to_parse) == 8 and date_str_to_parse.isdigit(): # YYYYMMDD as string
+                                parsed_date_for_monthly_agg = datetime.strptime(date_str_to_parse, "%Y%m%d")
+                                parsed_date_str = parsed_date_for_monthly_agg.strftime("%Y-%m-%d")
+                            else: # Fallback to fromisoformat for more complex ISO strings
+                                parsed_date_for_monthly_agg = datetime.fromisoformat(date_val.replace("Z", "+00:00").split("T")[0])
+                                parsed_date_str = parsed_date_for_monthly_agg.strftime("%Y-%m-%d")
+                        else:
+                            logger.debug(f"Unsupported date type {type(date_val)} for value {date_val}")
+                    except ValueError:
+                        logger.debug(f"Could not parse date string {date_val} into YYYY-MM-DD format.")
+                entry["date"] = parsed_date_str
+
+                # Determine entry type, using IsActualCost if available, otherwise fallback to date check
+                final_entry_type = self.entry_type # Start with the passed-in default
+                if is_actual_cost_idx is not None and len(row_data) > is_actual_cost_idx and row_data[is_actual_cost_idx] is not None:
+                    # Primary method: Use the 'IsActualCost' boolean column from the forecast API
+                    final_entry_type = "actual" if row_data[is_actual_cost_idx] else "forecast"
+                elif parsed_date_str and self.expected_granularity == 'daily':
+                    # Fallback for daily granularity if IsActualCost is missing: check if the date is in the future
+                    entry_date_obj = DateObject.fromisoformat(parsed_date_str)
+                    if entry_date_obj > datetime.now(timezone.utc).date():
+                        final_entry_type = "forecast"
+                entry["entry_type"] = final_entry_type
+
+                if self.include_resource_group_in_parsing and rg_name_from_row:
+                    if rg_name_from_row.startswith(self.RG_PREFIX_FILTER):
+                        self.costs_by_rg[rg_name_from_row] = self.costs_by_rg.get(rg_name_from_row, 0.0) + cost
             
-            # For monthly aggregation, if granularity was monthly
-            if parsed_date_for_monthly_agg and not include_resource_group_in_parsing: # Assuming this path is for monthly totals
-                logger.debug(f"Aggregating for monthly: Year {parsed_date_for_monthly_agg.year}, Month {parsed_date_for_monthly_agg.month}, Cost {cost}")
-                monthly_aggregated_costs[(parsed_date_for_monthly_agg.year, parsed_date_for_monthly_agg.month)] = monthly_aggregated_costs.get((parsed_date_for_monthly_agg.year, parsed_date_for_monthly_agg.month), 0.0) + cost
-
-            keep_entry = False
-            if include_resource_group_in_parsing:
-                # Only try to filter by prefix if we are actually parsing RGs and rg_name_from_row is not None
-                if rg_name_from_row and rg_name_from_row.startswith(RG_PREFIX_FILTER):
-                    keep_entry = True
-            else:
-                # If not parsing by RG (e.g. for MTD/Forecast totals), we want to keep the entry
-                # as it represents the aggregated total for that query.
-                keep_entry = True # Keep the aggregated row for MTD/Forecast
-
-            if keep_entry:
-                detailed_entries_list.append(entry)
-        except (IndexError, TypeError, ValueError) as e:
-            logger. warning(f"Skipping malformed row or type conversion error: {row_data} - {e}")
-            continue
-    
-    # Round the values in costs_by_rg
-    for rg, val in costs_by_rg.items():
-        costs_by_rg[rg] = round(val, 2)
-    
-    # If this function was called to get monthly aggregates, return that instead of detailed_entries_list
-    # The condition for returning the monthly dictionary should be very specific.
-    if not include_resource_group_in_parsing and expected_granularity.lower() == 'monthly' and monthly_aggregated_costs:
-         logger.info(f"Returning monthly aggregated costs dictionary: {monthly_aggregated_costs}")
-         return round(total_overall_cost, 2), currency, monthly_aggregated_costs, [] # Return dict for monthly costs
-    return round(total_overall_cost, 2), currency, costs_by_rg, detailed_entries_list # For all other cases
+                # For monthly aggregation, if granularity was monthly
+                if parsed_date_for_monthly_agg and not self.include_resource_group_in_parsing: # Assuming this path is for monthly totals
+                    logger.debug(f"Aggregating for monthly: Year {parsed_date_for_monthly_agg.year}, Month {parsed_date_for_monthly_agg.month}, Cost {cost}")
+                    self.monthly_aggregated_costs[(parsed_date_for_monthly_agg.year, parsed_date_for_monthly_agg.month)] = self.monthly_aggregated_costs.get((parsed_date_for_monthly_agg.year, parsed_date_for_monthly_agg.month), 0.0) + cost
+
+                keep_entry = False
+                if self.include_resource_group_in_parsing:
+                    # Only try to filter by prefix if we are actually parsing RGs and rg_name_from_row is not None
+                    if rg_name_from_row and rg_name_from_row.startswith(self.RG_PREFIX_FILTER):
+                        keep_entry = True
+                else:
+                    # If not parsing by RG (e.g. for MTD/Forecast totals), we want to keep the entry
+                    # as it represents the aggregated total for that query.
+                    keep_entry = True # Keep the aggregated row for MTD/Forecast
+
+                if keep_entry:
+                    self.detailed_entries.append(entry)
+            except (IndexError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping malformed row or type conversion error: {row_data} - {e}")
+                continue
+
+    def result_records(self) -> Tuple[float, str, Dict[Any, float], List[Dict[str, Any]]]:
+        """total_cost, currency, costs_by_rg (or the monthly totals of a Monthly non-RG query), detailed_entries."""
+        # Round the values in costs_by_rg
+        costs_by_rg = {rg: round(val, 2) for rg, val in self.costs_by_rg.items()}
+        # If this was a monthly-aggregates query, return that instead of detailed_entries
+        # The condition for returning the monthly dictionary should be very specific.
+        if not self.include_resource_group_in_parsing and self.expected_granularity == 'monthly' and self.monthly_aggregated_costs:
+            logger.info(f"Returning monthly aggregated costs dictionary: {self.monthly_aggregated_costs}")
+            return round(self.total_overall_cost, 2), self.currency, dict(self.monthly_aggregated_costs), [] # Return dict for monthly costs
+        return round(self.total_overall_cost, 2), self.currency, costs_by_rg, self.detailed_entries # For all other cases
+
+    def result(self) -> Tuple[float, str, Dict[Any, float], CostEntryTable]:
+        total, currency, costs_by_rg, entries = self.result_records()
+        return total, currency, costs_by_rg, CostEntryTable.from_records(entries)
+
+def _cost_accumulator(
+        include_resource_group_in_parsing: bool = True,
+        expected_granularity: str = "None",
+        entry_type: str = "actual"
+) -> Union[ColumnarCostAccumulator, RowCostAccumulator]:
+    """A page-by-page result parser for the COST_PARSER_ENGINE setting ("columnar" or "python")."""
+    if settings.COST_PARSER_ENGINE.lower() == "columnar":
+        return ColumnarCostAccumulator(include_resource_group_in_parsing, expected_granularity, entry_type)
+    return RowCostAccumulator(include_resource_group_in_parsing, expected_granularity, entry_type)
+
+def _parse_cost_management_query_result_rows(
+        query_result: Any,
+        include_resource_group_in_parsing: bool = True,
+        expected_granularity: str = "None",
+        entry_type: str = "actual"
+) -> Tuple[float, str, Dict[str, float], List[Dict[str, Any]]]:
+    """
+    Row-by-row parser for the raw result from the Cost Management API query (one RowCostAccumulator page).
+    Returns: total_cost, currency, costs_by_rg (if applicable), detailed_entries
+    """
+    if not query_result or not hasattr(query_result, 'rows') or not hasattr(query_result, 'columns'):
+        logger.warning("Query result is empty or malformed.")
+        return 0.0, "USD", {}, []
+    if not query_result.rows:
+        logger.debug("Query returned no data rows for this specific parsing context.")
+        return 0.0, "USD", {}, []
+    logger.debug(f"Parsing query result with columns: {[col.name.lower() for col in query_result.columns]}. include_rg_parsing: {include_resource_group_in_parsing}")
+    logger.debug(f"Sample rows (up to 3): {query_result.rows[:3]}")
+    accumulator = RowCostAccumulator(include_resource_group_in_parsing, expected_granularity, entry_type)
+    accumulator.add_page(query_result.columns, query_result.rows)
+    return accumulator.result_records()
 
 
 # --- API Service Functions ---
@@ -341,10 +957,9 @@ async def list_accessible_subscriptions(access_token: str, token_expires_on: Opt
     sub_client = get_subscription_client(user_access_token=access_token, user_token_expires_on=token_expires_on)
     subscriptions_list = []
     try:
-        # Note: SDK list operations are iterators, not directly awaitable.
-        # To make this async, you would typically run it in a thread.
-        # For simplicity here, we'll call it directly. FastAPI handles sync functions in async routes.
-        for sub in sub_client.subscriptions.list():
+        # SDK list operations are blocking paged iterators; drain them on the SDK executor.
+        azure_subscriptions = await _call_azure(access_token, "/", lambda **kwargs: list(sub_client.subscriptions.list(**kwargs)))
+        for sub in azure_subscriptions:
             subscriptions_list.append(
                 AzureSubscription(
                     id=sub.id,
@@ -360,13 +975,141 @@ async def list_accessible_subscriptions(access_token: str, token_expires_on: Opt
         logger.warning(f"Azure API Error listing subscriptions: {e.message} - Details: {e.error.message if e.error else 'N/A'} - Retry-After: {retry_after}")
         raise HTTPException(
             status_code=e.status_code if hasattr(e, 'status_code') else 500,
-            detail=f"Azure API Error: {e.error.message if e.error else e.message}. Retry-After: {retry_after}"
+            detail=f"Azure API Error: {e.error.message if e.error else e.message}. Retry-After: {retry_after}",
+            headers={"Retry-After": retry_after} if e.status_code == 429 else None
         )
     except Exception as e:
         logger.warning(f"Unexpected error listing subscriptions: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
+async def _daily_cost_history(
+        access_token: str,
+        identity_hash: str,
+        subscription_id: str,
+        first_day: DateObject,
+        last_day: DateObject,
+        tag_filters: Optional[List[dict]] = None
+) -> List[WarehouseRow]:
+    """
+    Daily actual costs per resource group for the local forecast, as fetch_daily_cost_rows tuples: from the
+    warehouse for untagged subscriptions it holds, otherwise one cached Daily query (grouped by resource group only,
+    so it stays small even for the whole year).
+    """
+    if not tag_filters:
+        local_rows = await _warehouse_rows(access_token, subscription_id, first_day, last_day, "Daily", ["ResourceGroupName"])
+        if local_rows is not None:
+            return [(usage_date, resource_group, None, currency, cost) for cost, usage_date, resource_group, currency in local_rows[1]]
+
+    scope = f"/subscriptions/{subscription_id}"
+    definition = _daily_query_definition(first_day, last_day, ["ResourceGroupName"], tag_filters)
+
+    async def fetch_history():
+        logger.info(f"Querying daily cost history for the local forecast of scope: {scope} ({first_day} to {last_day})")
+        history_rows = await fetch_daily_cost_rows(access_token, subscription_id, first_day, last_day, tag_filters, grouping=["ResourceGroupName"])
+        return [list(row) for row in history_rows]
+
+    history_cache_key = build_cost_cache_key("forecast-history", identity_hash, scope, definition.serialize(keep_readonly=True))
+    rows = await _get_cached_or_fetch(history_cache_key, cost_cache_ttl_for_period(definition.time_period.to), fetch_history, access_token, scope)
+    await _register_warehouse_access(access_token, subscription_id)
+    return [tuple(row) for row in rows]
+
+def _forecast_history_range(timeframe: str, time_period: QueryTimePeriod) -> Tuple[DateObject, DateObject, DateObject]:
+    """
+    First and last day (today) of the daily history the local projection of `timeframe` is built from, and the
+    end of its horizon: the rest of the year and the timeframe's dynamic projection window.
+    """
+    today = datetime.now(timezone.utc).date()
+    window_first, window_last = time_period.from_property.date(), time_period.to.date()
+    window = projection_window(timeframe, window_first, window_last, today)
+    first_day = min(DateObject(today.year, 1, 1), today - timedelta(days=settings.COST_FORECAST_LOOKBACK_DAYS + 1))
+    horizon_end = DateObject(today.year, 12, 31)
+    if window is not None:
+        horizon_end = max(horizon_end, window[2])
+        if window[3]:
+            first_day = min(first_day, window_first)
+    return first_day, today, horizon_end
+
+async def _local_cost_projection(
+        access_token: str,
+        identity_hash: str,
+        subscription_id: str,
+        timeframe: str,
+        time_period: QueryTimePeriod,
+        tag_filters: Optional[List[dict]] = None,
+        history: Optional[List[WarehouseRow]] = None
+) -> Optional[CostProjection]:
+    """
+    Projects the subscription's costs locally (cost_forecast.CostProjection) over the rest of the year and the
+    timeframe's dynamic projection window, from `history` when the caller already fetched it (e.g. split from a
+    scope-level query), otherwise from _daily_cost_history. None (logged) when the history cannot be fetched;
+    the caller then falls back to the Azure forecast.
+    """
+    first_day, today, horizon_end = _forecast_history_range(timeframe, time_period)
+    try:
+        rows = history if history is not None else await _daily_cost_history(access_token, identity_hash, subscription_id, first_day, today, tag_filters)
+        projection = await asyncio.to_thread(
+            CostProjection, rows, first_day, today, horizon_end, settings.COST_FORECAST_METHOD, settings.COST_FORECAST_LOOKBACK_DAYS
+        )
+    except Exception as e:
+        logger.warning(f"Local cost forecast failed for subscription {subscription_id}, falling back to the Azure forecast: {e}", exc_info=True)
+        return None
+    forecast_stats["local_forecasts"] += 1
+    return projection
+
+async def _azure_yearly_forecast(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        identity_hash: str,
+        subscription_id: str,
+        query_filter: Optional[QueryFilter],
+        current_year: int
+) -> CostEntryTable:
+    """Yearly daily actuals + forecasts from the Azure forecast API (empty, logged, when the call fails)."""
+    scope = f"/subscriptions/{subscription_id}"
+    try:
+        time_period_yearly_daily = QueryTimePeriod(
+            from_property=datetime(current_year, 1, 1, tzinfo=timezone.utc),
+            to=datetime(current_year, 12, 31, 23, 59, 59, tzinfo=timezone.utc) # Entire year
+        )
+        forecast_def_yearly_daily = ForecastDefinition(
+            type="ActualCost", timeframe=TimeframeType.CUSTOM, time_period=time_period_yearly_daily,
+            include_actual_cost=True,
+            dataset=QueryDataset(
+                granularity="Daily",
+                aggregation={"totalCost": QueryAggregation(name="Cost", function="Sum")},
+                filter=query_filter # Apply same tag filters
+            )
+        )
+        async def fetch_forecast():
+            logger.debug(f"Querying yearly daily actuals and forecasts (combined): {forecast_def_yearly_daily.serialize(keep_readonly=True)}")
+            forecast_stats["azure_forecasts"] += 1
+            daily_combined = await _query_and_parse(
+                access_token, cost_mgmt_client, scope, cost_mgmt_client.forecast.usage, forecast_def_yearly_daily,
+                include_resource_group_in_parsing=False, expected_granularity="Daily"
+            )
+            return daily_combined[3].to_columns()
+
+        forecast_cache_key = build_cost_cache_key("subscription-forecast", identity_hash, scope, forecast_def_yearly_daily.serialize(keep_readonly=True))
+        return CostEntryTable.from_columns(
+            await _get_cached_or_fetch(
+                forecast_cache_key, settings.COST_CACHE_FORECAST_TTL_SECONDS, fetch_forecast, access_token, scope, COST_FORECAST_ACTION
+            )
+        )
+    except HttpResponseError as e_daily_combined:
+        # Extract retry-after header if available for 429 errors during forecast query
+        retry_after = e_daily_combined.response.headers.get('x-ms-ratelimit-microsoft.costmanagement-entity-retry-after', '0') if e_daily_combined.status_code == 429 else '0'
+        logger.warning(f"Azure API Error fetching yearly daily combined actual/forecast data for {subscription_id}: {e_daily_combined.message} - Retry-After: {retry_after}", exc_info=True)
+    except Exception as e_daily_combined:
+        logger.warning(f"Could not fetch yearly daily combined actual/forecast data for {subscription_id}: {e_daily_combined}", exc_info=True)
+    return CostEntryTable()
+
+def _month_projection(daily_breakdown: CostEntryTable, month: int) -> Optional[float]:
+    """Actual + forecast total of a month of a yearly daily breakdown (None when it has no entries)."""
+    amounts = [entry['amount'] for entry in daily_breakdown if DateObject.fromisoformat(entry['date']).month == month]
+    return round(sum(amounts), 2) if amounts else None
+
+
 async def query_subscription_costs(
     access_token: str,
     subscription_id: str,
@@ -375,89 +1118,106 @@ async def query_subscription_costs(
     tag_filters: Optional[List[dict]] = None,
     from_date: Optional[DateObject] = None,
     to_date: Optional[DateObject] = None,
-    token_expires_on: Optional[int] = None
-) -> Tuple[float, str, Dict[str, float], List[Dict[str, Any]], QueryTimePeriod, Optional[float], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    token_expires_on: Optional[int] = None,
+    include: Optional[Iterable[str]] = None,
+    forecast_history: Optional[List[WarehouseRow]] = None
+) -> Tuple[float, str, Dict[str, float], CostEntryTable, QueryTimePeriod, Optional[float], List[Dict[str, Any]], CostEntryTable, Optional[Dict[str, Any]]]:
     """Queries cost data for a subscription using the user's token.
-    Returns: total_cost, currency, costs_by_rg, detailed_entries, time_period_used"""
+    `include` selects COST_SECTIONS (default: all). The actuals query only runs for totals / resource_groups /
+    detailed_entries (grouped only as finely as needed) and the yearly forecast only for yearly_forecast;
+    sections not requested come back empty. `forecast_history` is the local projection's daily history when the
+    caller already has it (_daily_cost_history rows over _forecast_history_range, matching `tag_filters`).
+    Returns: total_cost, currency, costs_by_rg, detailed_entries, time_period_used, projected_eom,
+    yearly_monthly_breakdown, yearly_daily_breakdown, dynamic_projection (the projected_*_dynamic fields of
+    SubscriptionCostDetails, None without a local projection or for closed timeframes)"""
     if not access_token:
         raise ValueError("Access token is required to query subscription costs.")
     cost_mgmt_client = get_cost_management_client(user_access_token=access_token, user_token_expires_on=token_expires_on)
     scope = f"/subscriptions/{subscription_id}"
     time_period_obj = _determine_time_period(timeframe, from_date, to_date)
+    sections = parse_cost_sections(include)
 
     current_year = datetime.now(timezone.utc).year
     month_labels = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
 
-    grouping = [
-        QueryGrouping(name="ResourceGroupName", type="Dimension"),
-        QueryGrouping(name="ResourceID", type="Dimension")
-    ]
-
-
-    query_definition = QueryDefinition(
-        type=ExportType.ACTUAL_COST, # "ActualCost"
-        timeframe=TimeframeType.CUSTOM, # We use custom because QueryTimePeriod is explicit
-        time_period=time_period_obj,
-        dataset=QueryDataset(
-            granularity=granularity if granularity.lower() != "none" else None, # API expects None for total, not string "None"
-            aggregation={"totalCost": QueryAggregation(name="Cost", function="Sum")},
-            grouping=grouping,
-            filter=None # Initialize filter as None
-        )
-    )
-
-    # Apply tag filters if provided
-    if tag_filters:
-        # tag_filters is a list of dicts like:
-        # [{"name": "tag_key", "operator": "In", "values": ["value1"]}]
-        filter_expressions = []
-        for tf in tag_filters:
-            filter_expressions.append(
-                QueryFilter(tags=QueryComparisonExpression(name=tf["name"], operator=tf["operator"], values=tf["values"]))
-            )
-
-        if len(tag_filters) == 1:
-            query_definition.dataset.filter = filter_expressions[0]
-        elif len(filter_expressions) > 1:
-            query_definition.dataset.filter = QueryFilter(and_property=filter_expressions)
+    grouping = []
+    if sections & {"resource_groups", "detailed_entries"}:
+        grouping.append("ResourceGroupName")
+    if "detailed_entries" in sections:
+        grouping.append("ResourceID")
+    query_definition = _build_query_definition(time_period_obj, granularity, grouping, tag_filters)
 
     logger.info(f"Querying cost for scope: {scope} with granularity '{granularity}', timeframe: {timeframe} ({time_period_obj.from_property} to {time_period_obj.to})")
     logger.debug(f"Query definition: {query_definition.serialize(keep_readonly=True)}")
 
+    identity_hash = get_identity_hash(access_token)
     try:
-        # This is a synchronous call. For a truly async FastAPI, wrap with asyncio.to_thread
-        # result = await asyncio.to_thread(cost_mgmt_client.query.usage, scope=scope, parameters=query_definition)
-        result = cost_mgmt_client.query.usage(scope=scope, parameters=query_definition)
-        total, currency, by_rg, entries = _parse_cost_management_query_result(result, include_resource_group_in_parsing=True, expected_granularity=granularity)
+        # Identical query definitions from the same identity are served from the result cache,
+        # and concurrent identical requests share a single upstream call.
+        # Entries are cached in CostEntryTable's columnar form.
+        async def fetch_actuals():
+            total, currency, by_rg, entries = await _query_and_parse_sharded(
+                access_token, cost_mgmt_client, scope, query_definition,
+                include_resource_group_in_parsing=True, expected_granularity=granularity
+            )
+            return [total, currency, by_rg, entries.to_columns()]
+
+        total, currency, by_rg, entries = 0.0, "USD", {}, CostEntryTable()
+        if sections & {"totals", "resource_groups", "detailed_entries"}:
+            # Untagged queries are answered from the local warehouse when it holds the whole window.
+            local_result = None if tag_filters else await _query_warehouse_actuals(
+                access_token, subscription_id, time_period_obj, granularity, grouping, include_resource_group_in_parsing=True
+            )
+            if local_result is None:
+                local_result = await _query_planned_actuals(
+                    access_token, identity_hash, subscription_id, time_period_obj, granularity, grouping,
+                    include_resource_group_in_parsing=True, tag_filters=tag_filters
+                )
+                if local_result is not None:
+                    await _register_warehouse_access(access_token, subscription_id)
+            if local_result is not None:
+                total, currency, by_rg, entries = local_result
+            else:
+                actuals_cache_key = build_cost_cache_key("subscription-actuals", identity_hash, scope, query_definition.serialize(keep_readonly=True))
+                total, currency, by_rg, entry_columns = await _get_cached_or_fetch(
+                    actuals_cache_key, cost_cache_ttl_for_period(time_period_obj.to), fetch_actuals, access_token, scope
+                )
+                entries = CostEntryTable.from_columns(entry_columns)
+                await _register_warehouse_access(access_token, subscription_id)
+            if "detailed_entries" not in sections:
+                entries = CostEntryTable()
+            if "resource_groups" not in sections:
+                by_rg = {}
 
         # --- Fetch Yearly Monthly Breakdown ---
         # This will be derived from the daily data fetch below to reduce API calls.
 
         # --- Fetch Yearly Daily Breakdown (Actuals + Forecasts) ---
-        yearly_daily_breakdown_list: List[Dict[str, Any]] = []
-        try:
-            time_period_yearly_daily = QueryTimePeriod(
-                from_property=datetime(current_year, 1, 1, tzinfo=timezone.utc),
-                to=datetime(current_year, 12, 31, 23, 59, 59, tzinfo=timezone.utc) # Entire year
-            )
-            forecast_def_yearly_daily = ForecastDefinition(
-                type="ActualCost", timeframe=TimeframeType.CUSTOM, time_period=time_period_yearly_daily,
-                include_actual_cost=True,
-                dataset=QueryDataset(
-                    granularity="Daily",
-                    aggregation={"totalCost": QueryAggregation(name="Cost", function="Sum")},
-                    filter=query_definition.dataset.filter # Apply same tag filters
+        # Projected locally from the daily actuals (COST_FORECAST_ENGINE); the Azure forecast API is only called
+        # for the "azure" engine, as a cross-check ("both") or when the local projection fails.
+        yearly_daily_breakdown_list = CostEntryTable()
+        dynamic_projection = None
+        if "yearly_forecast" in sections:
+            forecast_engine = settings.COST_FORECAST_ENGINE.lower()
+            local_projection = None
+            if forecast_engine in ("local", "both"):
+                local_projection = await _local_cost_projection(
+                    access_token, identity_hash, subscription_id, timeframe, time_period_obj, tag_filters, forecast_history
                 )
-            )
-            logger.debug(f"Querying yearly daily actuals and forecasts (combined): {forecast_def_yearly_daily.serialize(keep_readonly=True)}")
-            daily_combined_result = cost_mgmt_client.forecast.usage(scope=scope, parameters=forecast_def_yearly_daily)
-            _, _, _, yearly_daily_breakdown_list = _parse_cost_management_query_result(daily_combined_result, include_resource_group_in_parsing=False, expected_granularity="Daily")
-        except HttpResponseError as e_daily_combined:
-            # Extract retry-after header if available for 429 errors during forecast query
-            retry_after = e_daily_combined.response.headers.get('x-ms-ratelimit-microsoft.costmanagement-entity-retry-after', '0') if e_daily_combined.status_code == 429 else '0'
-            logger.warning(f"Azure API Error fetching yearly daily combined actual/forecast data for {subscription_id}: {e_daily_combined.message} - Retry-After: {retry_after}", exc_info=True)
-        except Exception as e_daily_combined:
-            logger.warning(f"Could not fetch yearly daily combined actual/forecast data for {subscription_id}: {e_daily_combined}", exc_info=True)
+            if local_projection is not None:
+                yearly_daily_breakdown_list = CostEntryTable.from_records(
+                    local_projection.daily_entries(DateObject(current_year, 1, 1), DateObject(current_year, 12, 31))
+                )
+                dynamic_projection = local_projection.dynamic_projection(timeframe, time_period_obj.from_property.date(), time_period_obj.to.date())
+            if local_projection is None or forecast_engine == "both":
+                azure_breakdown = await _azure_yearly_forecast(
+                    access_token, cost_mgmt_client, identity_hash, subscription_id, query_definition.dataset.filter, current_year
+                )
+                if local_projection is None:
+                    yearly_daily_breakdown_list = azure_breakdown
+                else:
+                    current_month = datetime.now(timezone.utc).month
+                    cross_check(subscription_id, _month_projection(yearly_daily_breakdown_list, current_month), _month_projection(azure_breakdown, current_month))
 
         # --- Derive Monthly Breakdown from Daily Data ---
         projected_total_for_month = None
@@ -500,7 +1260,7 @@ async def query_subscription_costs(
             
             projected_total_for_month = derived_yearly_monthly_breakdown[current_month - 1]['forecast']
 
-        return total, currency, by_rg, entries, time_period_obj, projected_total_for_month, derived_yearly_monthly_breakdown, yearly_daily_breakdown_list
+        return total, currency, by_rg, entries, time_period_obj, projected_total_for_month, derived_yearly_monthly_breakdown, yearly_daily_breakdown_list, dynamic_projection
     except HttpResponseError as e:
         # Extract retry-after header if available for 429 errors
         retry_after = e.response.headers.get('x-ms-ratelimit-microsoft.costmanagement-entity-retry-after', '0') if e.status_code == 429 else '0'
@@ -512,7 +1272,8 @@ async def query_subscription_costs(
         logger.warning(f"Azure API Error querying subscription costs for {subscription_id}: {error_details} - Retry-After: {retry_after}", exc_info=True)
         raise HTTPException(
             status_code=e.status_code if hasattr(e, 'status_code') else 500,
-            detail=f"Azure API Error: {error_details}. Retry-After: {retry_after}"
+            detail=f"Azure API Error: {error_details}. Retry-After: {retry_after}",
+            headers={"Retry-After": retry_after} if e.status_code == 429 else None
         )
     except ValueError as e:  # Catch parsing errors or bad input from _determine_time_period
         logger.warning(f"ValueError during cost query for subscription {subscription_id}: {str(e)}", exc_info=True)
@@ -522,6 +1283,348 @@ async def query_subscription_costs(
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
+def tag_split_key(tag_filters: Optional[List[dict]]) -> Optional[str]:
+    """The tag key all `tag_filters` are on, or None when there are none or they span several keys."""
+    names = {tf["name"].lower() for tf in tag_filters or []}
+    return next(iter(names)) if len(names) == 1 else None
+
+def tag_filters_match(tag_filters: List[dict], tag_value: Optional[str]) -> bool:
+    """
+    Whether a cost row with `tag_value` for the filtered tag key (None / "" when untagged) passes every filter,
+    as the Cost Management tag filter would evaluate it: In needs one of the values, NotIn none of them
+    (so untagged costs pass NotIn). Values are compared case-insensitively, like Azure does.
+    """
+    folded_value = str(tag_value).casefold() if tag_value else None
+    for tf in tag_filters:
+        matched = folded_value is not None and folded_value in {str(value).casefold() for value in tf["values"]}
+        if matched != (tf["operator"].lower() == "in"):
+            return False
+    return True
+
+async def _query_tag_split_actuals(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        identity_hash: str,
+        subscription_id: str,
+        time_period: QueryTimePeriod,
+        granularity: str,
+        tag_filters: List[dict]
+) -> Tuple[Tuple[float, str, Dict[str, float]], Tuple[float, str, Dict[str, float]]]:
+    """
+    Filtered and unfiltered (baseline) totals and resource group costs from one unfiltered query grouped by
+    ResourceGroupName and the filters' tag key: rows passing tag_filters_match make up the filtered result, all
+    rows the baseline. The raw rows are cached per tag key, so other values of the same tag reuse the query.
+    """
+    scope = f"/subscriptions/{subscription_id}"
+    query_definition = _build_query_definition(time_period, granularity, ["ResourceGroupName"])
+    query_definition.dataset.grouping.append(QueryGrouping(name=tag_split_key(tag_filters), type="TagKey"))
+
+    async def fetch_tag_rows():
+        logger.info(f"Querying costs grouped by tag '{tag_split_key(tag_filters)}' for scope: {scope} ({time_period.from_property} to {time_period.to})")
+        column_names: List[str] = []
+        rows: List[Any] = []
+        async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition):
+            if page.columns and page.rows:
+                column_names = [col.name for col in page.columns]
+                rows.extend(page.rows)
+        return [column_names, rows]
+
+    cache_key = build_cost_cache_key("tag-split-actuals", identity_hash, scope, query_definition.serialize(keep_readonly=True))
+    column_names, rows = await _get_cached_or_fetch(cache_key, cost_cache_ttl_for_period(time_period.to), fetch_tag_rows, access_token, scope)
+    filtered = _cost_accumulator(True, granularity)
+    baseline = _cost_accumulator(True, granularity)
+    if rows:
+        tag_value_idx = next((idx for idx, name in enumerate(column_names) if name.lower() == "tagvalue"), None)
+        if tag_value_idx is None:
+            raise ValueError(f"TagValue column missing in tag grouped query result. Found: {column_names}")
+        columns = [QueryColumn(name=name) for name in column_names]
+        baseline.add_page(columns, rows)
+        filtered.add_page(columns, [row for row in rows if tag_filters_match(tag_filters, row[tag_value_idx])])
+    filtered_total, filtered_currency, filtered_by_rg, _ = filtered.result()
+    baseline_total, baseline_currency, baseline_by_rg, _ = baseline.result()
+    return (filtered_total, filtered_currency, filtered_by_rg), (baseline_total, baseline_currency, baseline_by_rg)
+
+async def _query_tag_split_history(
+        access_token: str,
+        cost_mgmt_client: CostManagementClient,
+        identity_hash: str,
+        subscription_id: str,
+        timeframe: str,
+        time_period: QueryTimePeriod,
+        tag_filters: List[dict]
+) -> Tuple[Optional[List[WarehouseRow]], Optional[List[WarehouseRow]]]:
+    """
+    Filtered and unfiltered (baseline) local forecast histories from one Daily query grouped by ResourceGroupName
+    and the filters' tag key, split with tag_filters_match like _query_tag_split_actuals. (None, None) for the
+    "azure" forecast engine or when the query fails (logged); each forecast then fetches its own history.
+    """
+    if settings.COST_FORECAST_ENGINE.lower() not in ("local", "both"):
+        return None, None
+    scope = f"/subscriptions/{subscription_id}"
+    first_day, today, _ = _forecast_history_range(timeframe, time_period)
+    query_definition = _daily_query_definition(first_day, today, ["ResourceGroupName"])
+    query_definition.dataset.grouping.append(QueryGrouping(name=tag_split_key(tag_filters), type="TagKey"))
+
+    async def fetch_tag_history():
+        logger.info(f"Querying daily cost history grouped by tag '{tag_split_key(tag_filters)}' for the local forecast of scope: {scope} ({first_day} to {today})")
+        column_names: List[str] = []
+        rows: List[Any] = []
+        async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition):
+            if page.columns and page.rows:
+                column_names = [col.name for col in page.columns]
+                rows.extend(page.rows)
+        return [column_names, rows]
+
+    try:
+        cache_key = build_cost_cache_key("tag-split-history", identity_hash, scope, query_definition.serialize(keep_readonly=True))
+        column_names, rows = await _get_cached_or_fetch(cache_key, cost_cache_ttl_for_period(query_definition.time_period.to), fetch_tag_history, access_token, scope)
+        if not rows:
+            return [], []
+        tag_value_idx = next((idx for idx, name in enumerate(column_names) if name.lower() == "tagvalue"), None)
+        if tag_value_idx is None:
+            raise ValueError(f"TagValue column missing in tag grouped query result. Found: {column_names}")
+        matching = [row for row in rows if tag_filters_match(tag_filters, row[tag_value_idx])]
+        other = [row for row in rows if not tag_filters_match(tag_filters, row[tag_value_idx])]
+        filtered = _daily_rows_from_page(column_names, matching)
+        return filtered, filtered + _daily_rows_from_page(column_names, other)
+    except Exception as e:
+        logger.warning(f"Tag grouped forecast history failed for subscription {subscription_id}, fetching each history separately: {e}", exc_info=True)
+        return None, None
+
+async def query_subscription_costs_with_baseline(
+    access_token: str,
+    subscription_id: str,
+    timeframe: str,
+    granularity: str,
+    tag_filters: Optional[List[dict]] = None,
+    from_date: Optional[DateObject] = None,
+    to_date: Optional[DateObject] = None,
+    token_expires_on: Optional[int] = None,
+    include: Optional[Iterable[str]] = None
+) -> Tuple[Tuple[Any, ...], Dict[str, Any]]:
+    """query_subscription_costs for the tag-filtered costs plus the unfiltered baseline of the same window.
+    With filters on a single tag key (and no detailed_entries) the filtered and baseline actuals come from one
+    query grouped by that key (_query_tag_split_actuals) instead of two full queries; otherwise the baseline is a
+    second, unfiltered query_subscription_costs call. The yearly forecast section is projected for both, and with
+    a single tag key both forecast histories come from one query grouped by it (_query_tag_split_history).
+    Returns: the query_subscription_costs tuple, {baseline_* field of SubscriptionCostDetails: value}"""
+    sections = parse_cost_sections(include)
+    actual_sections = sections & {"totals", "resource_groups"}
+    forecast_sections = sections & {"yearly_forecast"}
+
+    def query(filters: Optional[List[dict]], query_sections: Iterable[str], forecast_history: Optional[List[WarehouseRow]] = None):
+        return query_subscription_costs(
+            access_token=access_token, subscription_id=subscription_id, timeframe=timeframe, granularity=granularity,
+            tag_filters=filters, from_date=from_date, to_date=to_date, token_expires_on=token_expires_on, include=query_sections,
+            forecast_history=forecast_history
+        )
+
+    async def split_forecast_histories() -> Tuple[Optional[List[WarehouseRow]], Optional[List[WarehouseRow]]]:
+        if not forecast_sections or tag_split_key(tag_filters) is None:
+            return None, None
+        return await _query_tag_split_history(
+            access_token, get_cost_management_client(user_access_token=access_token, user_token_expires_on=token_expires_on),
+            get_identity_hash(access_token), subscription_id, timeframe, _determine_time_period(timeframe, from_date, to_date), tag_filters
+        )
+
+    if not tag_filters:
+        result = await query(None, sections)
+        baseline_actuals, baseline_forecast = result, result
+    elif actual_sections and "detailed_entries" not in sections and tag_split_key(tag_filters) is not None:
+        cost_mgmt_client = get_cost_management_client(user_access_token=access_token, user_token_expires_on=token_expires_on)
+        time_period_obj = _determine_time_period(timeframe, from_date, to_date)
+
+        async def forecasts():
+            if not forecast_sections:
+                return None, None
+            filtered_history, baseline_history = await split_forecast_histories()
+            return await asyncio.gather(query(tag_filters, forecast_sections, filtered_history), query(None, forecast_sections, baseline_history))
+
+        try:
+            split, (filtered_forecast, baseline_forecast) = await asyncio.gather(
+                _query_tag_split_actuals(access_token, cost_mgmt_client, get_identity_hash(access_token), subscription_id, time_period_obj, granularity, tag_filters),
+                forecasts()
+            )
+        except HttpResponseError as e:
+            retry_after = e.response.headers.get('x-ms-ratelimit-microsoft.costmanagement-entity-retry-after', '0') if e.status_code == 429 else '0'
+            logger.warning(f"Azure API Error querying tag grouped costs for {subscription_id}: {e.message} - Retry-After: {retry_after}", exc_info=True)
+            raise HTTPException(
+                status_code=e.status_code if hasattr(e, 'status_code') else 500,
+                detail=f"Azure API Error: {e.error.message if e.error else e.message}. Retry-After: {retry_after}",
+                headers={"Retry-After": retry_after} if e.status_code == 429 else None
+            )
+        except ValueError as e:
+            logger.warning(f"ValueError during tag grouped cost query for {subscription_id}: {str(e)}", exc_info=True)
+            raise HTTPException(status_code=400, detail=str(e))
+        (filtered_total, filtered_currency, filtered_by_rg), baseline_actuals = split
+        forecast_part = filtered_forecast[5:] if forecast_sections else (None, [], CostEntryTable(), None)
+        result = (
+            filtered_total, filtered_currency, filtered_by_rg if "resource_groups" in sections else {},
+            CostEntryTable(), time_period_obj, *forecast_part
+        )
+    elif actual_sections or forecast_sections:
+        filtered_history, baseline_history = await split_forecast_histories()
+        result, baseline_actuals = await asyncio.gather(
+            query(tag_filters, sections, filtered_history), query(None, actual_sections | forecast_sections, baseline_history)
+        )
+        baseline_forecast = baseline_actuals
+    else:
+        return await query(tag_filters, sections), {}
+
+    baseline: Dict[str, Any] = {}
+    if "totals" in sections:
+        baseline["baseline_total_cost"] = baseline_actuals[0]
+    if "resource_groups" in sections:
+        baseline["baseline_costs_by_resource_group"] = baseline_actuals[2]
+    if forecast_sections:
+        baseline["baseline_projected_cost_current_month"] = baseline_forecast[5]
+        baseline["baseline_yearly_monthly_breakdown"] = baseline_forecast[6]
+    return result, baseline
+
+
+# Scope prefixes accepted by query_scope_costs_by_subscription; a bare name is taken as a management group id.
+AGGREGATION_SCOPE_PREFIXES = ("/providers/Microsoft.Management/managementGroups/", "/providers/Microsoft.Billing/billingAccounts/")
+
+def resolve_aggregation_scope(scope: str) -> str:
+    """Normalizes a management group id or management group / billing account scope. Raises ValueError otherwise."""
+    scope = scope.strip().rstrip("/")
+    if not scope.startswith("/"):
+        scope = AGGREGATION_SCOPE_PREFIXES[0] + scope
+    if not any(scope.lower().startswith(prefix.lower()) and len(scope) > len(prefix) for prefix in AGGREGATION_SCOPE_PREFIXES):
+        raise ValueError(f"Unsupported aggregation scope '{scope}'. Use a management group id or a scope starting with {' or '.join(AGGREGATION_SCOPE_PREFIXES)}.")
+    return scope
+
+async def query_scope_costs_by_subscription(
+    access_token: str,
+    scope: str,
+    subscription_ids: List[str],
+    timeframe: str,
+    granularity: str, # "Daily", "Monthly", "None"
+    from_date: Optional[DateObject] = None,
+    to_date: Optional[DateObject] = None,
+    token_expires_on: Optional[int] = None,
+    include: Optional[Iterable[str]] = None
+) -> Tuple[Dict[str, Tuple[float, str, Dict[str, float], CostEntryTable]], QueryTimePeriod]:
+    """Queries the actual costs of many subscriptions with one query at a management group or billing scope.
+    The query is filtered to `subscription_ids` and grouped by SubscriptionId (plus ResourceGroupName / ResourceID
+    for the resource_groups / detailed_entries sections); its rows are split per subscription and parsed exactly like
+    query_subscription_costs parses a subscription-scoped result. The yearly forecast is not part of this query
+    (see query_scope_forecast_histories).
+    Subscriptions without cost rows in the window come back with a zero total.
+    Returns: {lowercased subscription id: (total_cost, currency, costs_by_rg, detailed_entries)}, time_period_used"""
+    if not access_token:
+        raise ValueError("Access token is required to query scope costs.")
+    cost_mgmt_client = get_cost_management_client(user_access_token=access_token, user_token_expires_on=token_expires_on)
+    sections = parse_cost_sections(include)
+    subscription_keys = sorted({subscription_id.lower() for subscription_id in subscription_ids})
+
+    try:
+        scope = resolve_aggregation_scope(scope)
+        time_period_obj = _determine_time_period(timeframe, from_date, to_date)
+        grouping = ["SubscriptionId"]
+        if sections & {"resource_groups", "detailed_entries"}:
+            grouping.append("ResourceGroupName")
+        if "detailed_entries" in sections:
+            grouping.append("ResourceID")
+        query_definition = _build_query_definition(time_period_obj, granularity, grouping, subscription_ids=subscription_keys)
+        logger.info(f"Querying cost for {len(subscription_keys)} subscriptions at scope: {scope} with granularity '{granularity}', timeframe: {timeframe} ({time_period_obj.from_property} to {time_period_obj.to})")
+
+        async def fetch_scope_actuals():
+            accumulators = {key: _cost_accumulator(True, granularity) for key in subscription_keys}
+            async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition):
+                if not page.columns or not page.rows:
+                    continue
+                subscription_idx = next((idx for idx, col in enumerate(page.columns) if col.name.lower() == "subscriptionid"), None)
+                if subscription_idx is None:
+                    raise ValueError(f"SubscriptionId column missing in scope query result. Found: {[col.name for col in page.columns]}")
+                rows_by_subscription: Dict[str, List[Any]] = {}
+                for row in page.rows:
+                    rows_by_subscription.setdefault(str(row[subscription_idx]).lower(), []).append(row)
+                for key, rows in rows_by_subscription.items():
+                    if key in accumulators:
+                        accumulators[key].add_page(page.columns, rows)
+            results = {}
+            for key, accumulator in accumulators.items():
+                total, currency, by_rg, entries = accumulator.result()
+                results[key] = [total, currency, by_rg, entries.to_columns()]
+            return results
+
+        cache_key = build_cost_cache_key("scope-actuals", get_identity_hash(access_token), scope.lower(), query_definition.serialize(keep_readonly=True))
+        cached = await _get_cached_or_fetch(cache_key, cost_cache_ttl_for_period(time_period_obj.to), fetch_scope_actuals, access_token, scope)
+        results = {}
+        for key in subscription_keys:
+            total, currency, by_rg, entry_columns = cached[key]
+            results[key] = (
+                total,
+                currency,
+                by_rg if "resource_groups" in sections else {},
+                CostEntryTable.from_columns(entry_columns) if "detailed_entries" in sections else CostEntryTable()
+            )
+        return results, time_period_obj
+    except HttpResponseError as e:
+        # Extract retry-after header if available for 429 errors
+        retry_after = e.response.headers.get('x-ms-ratelimit-microsoft.costmanagement-entity-retry-after', '0') if e.status_code == 429 else '0'
+        error_details = e.message
+        if e.error and e.error.message:
+            error_details = e.error.message
+        elif e.response and e.response.text:
+            error_details = e.response.text
+        logger.warning(f"Azure API Error querying costs at scope {scope}: {error_details} - Retry-After: {retry_after}", exc_info=True)
+        raise HTTPException(
+            status_code=e.status_code if hasattr(e, 'status_code') else 500,
+            detail=f"Azure API Error: {error_details}. Retry-After: {retry_after}",
+            headers={"Retry-After": retry_after} if e.status_code == 429 else None
+        )
+    except ValueError as e:
+        logger.warning(f"ValueError during cost query at scope {scope}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.warning(f"Unexpected error querying costs at scope {scope}: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
+
+async def query_scope_forecast_histories(
+    access_token: str,
+    scope: str,
+    subscription_ids: List[str],
+    timeframe: str,
+    from_date: Optional[DateObject] = None,
+    to_date: Optional[DateObject] = None,
+    token_expires_on: Optional[int] = None
+) -> Dict[str, List[WarehouseRow]]:
+    """The local forecast histories of many subscriptions from one Daily query at a management group or billing
+    scope, filtered to `subscription_ids` and grouped by SubscriptionId + ResourceGroupName; its rows are split per
+    subscription and passed to query_subscription_costs as forecast_history, so scope mode projects every
+    subscription without a history query each. Raises HttpResponseError / ValueError like fetch_daily_cost_rows.
+    Returns: {lowercased subscription id: _daily_cost_history rows} (empty for subscriptions without costs)"""
+    cost_mgmt_client = get_cost_management_client(user_access_token=access_token, user_token_expires_on=token_expires_on)
+    scope = resolve_aggregation_scope(scope)
+    subscription_keys = sorted({subscription_id.lower() for subscription_id in subscription_ids})
+    first_day, today, _ = _forecast_history_range(timeframe, _determine_time_period(timeframe, from_date, to_date))
+    query_definition = _daily_query_definition(first_day, today, ["SubscriptionId", "ResourceGroupName"], subscription_ids=subscription_keys)
+
+    async def fetch_scope_history():
+        logger.info(f"Querying daily cost history for the local forecasts of {len(subscription_keys)} subscriptions at scope: {scope} ({first_day} to {today})")
+        histories: Dict[str, List[Any]] = {key: [] for key in subscription_keys}
+        async for page in _iter_query_result_pages(access_token, cost_mgmt_client, scope, cost_mgmt_client.query.usage, query_definition):
+            if not page.columns or not page.rows:
+                continue
+            column_names = [col.name for col in page.columns]
+            subscription_idx = next((idx for idx, name in enumerate(column_names) if name.lower() == "subscriptionid"), None)
+            if subscription_idx is None:
+                raise ValueError(f"SubscriptionId column missing in scope query result. Found: {column_names}")
+            rows_by_subscription: Dict[str, List[Any]] = {}
+            for row in page.rows:
+                rows_by_subscription.setdefault(str(row[subscription_idx]).lower(), []).append(row)
+            for key, rows in rows_by_subscription.items():
+                if key in histories:
+                    histories[key].extend(list(row) for row in _daily_rows_from_page(column_names, rows))
+        return histories
+
+    cache_key = build_cost_cache_key("scope-forecast-history", get_identity_hash(access_token), scope.lower(), query_definition.serialize(keep_readonly=True))
+    cached = await _get_cached_or_fetch(cache_key, cost_cache_ttl_for_period(query_definition.time_period.to), fetch_scope_history, access_token, scope)
+    return {key: [tuple(row) for row in cached[key]] for key in subscription_keys}
+
+
 async def query_resource_group_costs(
     access_token: str,
     subscription_id: str,
@@ -531,9 +1634,11 @@ async def query_resource_group_costs(
     tag_filters: Optional[List[dict]] = None,
     from_date: Optional[DateObject] = None,
     to_date: Optional[DateObject] = None,
-    token_expires_on: Optional[int] = None
-) -> Tuple[float, str, List[Dict[str, Any]], QueryTimePeriod]:
+    token_expires_on: Optional[int] = None,
+    include: Optional[Iterable[str]] = None
+) -> Tuple[float, str, CostEntryTable, QueryTimePeriod]:
     """Queries cost data for a specific resource group using the user's token.
+    `include` selects COST_SECTIONS (default: all); without detailed_entries only the total is queried.
     Returns: total_cost, currency, detailed_entries, time_period_used"""
     if not access_token:
         raise ValueError("Access token is required to query resource group costs.")
@@ -541,45 +1646,44 @@ async def query_resource_group_costs(
     # Scope for a resource group
     scope = f"/subscriptions/{subscription_id}/resourceGroups/{resource_group_name}"
     time_period_obj = _determine_time_period(timeframe, from_date, to_date)
+    sections = parse_cost_sections(include)
 
-    grouping = [
-        QueryGrouping(name="ResourceID", type="Dimension")
-    ]
+    grouping = ["ResourceID"] if "detailed_entries" in sections else []
     # You might want to group by other dimensions as well, e.g., ServiceName, Meter
-    # grouping.append(QueryGrouping(name="ServiceName", type="Dimension"))
-
-    query_definition = QueryDefinition(
-        type=ExportType.ACTUAL_COST,
-        timeframe=TimeframeType.CUSTOM,
-        time_period=time_period_obj,
-        dataset=QueryDataset(
-            granularity=granularity if granularity.lower() != "none" else None,
-            aggregation={"totalCost": QueryAggregation(name="Cost", function="Sum")},
-            grouping=grouping if grouping else None,
-            filter=None # Initialize filter
-        )
-    )
-
-    # Apply tag filters if provided
-    if tag_filters:
-        filter_expressions_rg = []
-        for tf in tag_filters:
-            filter_expressions_rg.append(
-                QueryFilter(tags=QueryComparisonExpression(name=tf["name"], operator=tf["operator"], values=tf["values"]))
-            )
-        
-        if len(filter_expressions_rg) == 1:
-            query_definition.dataset.filter = filter_expressions_rg[0]
-        elif len(filter_expressions_rg) > 1:
-            query_definition.dataset.filter = QueryFilter(and_property=filter_expressions_rg)
+    query_definition = _build_query_definition(time_period_obj, granularity, grouping, tag_filters)
 
     logger.info(f"Querying cost for RG scope: {scope} with granularity '{granularity}', timeframe: {timeframe} ({time_period_obj.from_property} to {time_period_obj.to})")
     logger.debug(f"Query definition: {query_definition.serialize(keep_readonly=True)}")
 
+    identity_hash = get_identity_hash(access_token)
     try:
-        result = cost_mgmt_client.query.usage(scope=scope, parameters=query_definition)
-        # For RG specific query, we don't re-parse costs_by_rg, as it's all for this RG.
-        total, currency, _, entries = _parse_cost_management_query_result(result, include_resource_group_in_parsing=False, expected_granularity=granularity)
+        # Untagged queries are answered from the local warehouse when it holds the whole window.
+        local_result = None if tag_filters else await _query_warehouse_actuals(
+            access_token, subscription_id, time_period_obj, granularity, grouping,
+            include_resource_group_in_parsing=False, resource_group=resource_group_name
+        )
+        if local_result is None:
+            local_result = await _query_planned_actuals(
+                access_token, identity_hash, subscription_id, time_period_obj, granularity, grouping,
+                include_resource_group_in_parsing=False, tag_filters=tag_filters, resource_group=resource_group_name
+            )
+        if local_result is not None:
+            total, currency, _, entries = local_result
+            return total, currency, entries if "detailed_entries" in sections else CostEntryTable(), time_period_obj
+
+        async def fetch_rg_costs():
+            # For RG specific query, we don't re-parse costs_by_rg, as it's all for this RG.
+            total, currency, _, entries = await _query_and_parse_sharded(
+                access_token, cost_mgmt_client, scope, query_definition,
+                include_resource_group_in_parsing=False, expected_granularity=granularity
+            )
+            return [total, currency, entries.to_columns()]
+
+        cache_key = build_cost_cache_key("resource-group-actuals", identity_hash, scope, query_definition.serialize(keep_readonly=True))
+        total, currency, entry_columns = await _get_cached_or_fetch(
+            cache_key, cost_cache_ttl_for_period(time_period_obj.to), fetch_rg_costs, access_token, scope
+        )
+        entries = CostEntryTable.from_columns(entry_columns) if "detailed_entries" in sections else CostEntryTable()
         return total, currency, entries, time_period_obj
     except HttpResponseError as e:
         # Extract retry-after header if available for 429 errors
@@ -592,7 +1696,8 @@ async def query_resource_group_costs(
         logger.warning(f"Azure API Error querying RG costs for {resource_group_name} in {subscription_id}: {error_details} - Retry-After: {retry_after}", exc_info=True)
         raise HTTPException(
             status_code=e.status_code if hasattr(e, 'status_code') else 500,
-            detail=f"Azure API Error: {error_details}. Retry-After: {retry_after}"
+            detail=f"Azure API Error: {error_details}. Retry-After: {retry_after}",
+            headers={"Retry-After": retry_after} if e.status_code == 429 else None
         )
     except ValueError as e:
         logger.warning(f"ValueError during cost query for RG {resource_group_name}: {str(e)}", exc_info=True)
@@ -602,59 +1707,111 @@ async def query_resource_group_costs(
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
 
+def _write_csv_report(file_path: str, entries: Iterable[Dict[str, Any]], compress: bool) -> None:
+    """Writes the entries chunk by chunk, so memory stays at one chunk whatever the row count."""
+    chunks = iter_entries_csv(entries)
+    if compress:
+        with open(file_path, "wb") as f:
+            for data in gzip_chunks(chunks):
+                f.write(data)
+    else:
+        with open(file_path, "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+def _write_columnar_report(file_path: str, table: CostEntryTable, file_format: str) -> None:
+    """Parquet or Arrow IPC file from the table's Arrow form (dictionary-encoded strings), compressed with REPORT_COLUMNAR_COMPRESSION."""
+    import pyarrow as pa  # to_arrow() has already checked that pyarrow is installed
+    arrow_table = table.to_arrow()
+    compression = settings.REPORT_COLUMNAR_COMPRESSION
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(arrow_table, file_path, compression=compression, use_dictionary=True)
+    else:
+        options = pa.ipc.IpcWriteOptions(compression=compression if compression in ("zstd", "lz4") else None)
+        with pa.OSFile(file_path, "wb") as sink, pa.ipc.new_file(sink, arrow_table.schema, options=options) as writer:
+            writer.write_table(arrow_table)
+
 async def generate_cost_report_file(
     subscription_id: str,
-    cost_data_entries: List[Dict[str, Any]],
+    cost_data_entries: Union[CostEntryTable, List[Dict[str, Any]]],
     timeframe_str: str,
     granularity_str: str,
-    file_format: str = "csv" # "csv" or "excel"
+    file_format: str = "csv", # "csv", "excel", "parquet" or "arrow"
+    compress: bool = False, # gzip the CSV (.csv.gz)
+    report_key: Optional[str] = None # report_store key; replaces the timestamp in the file name
     # access_token and token_expires_on are not directly used here as data is pre-fetched,
     # but if file generation involved further Azure calls, they would be needed.
 ) -> str:
     """
-    Generates a cost report file (CSV or Excel) from parsed cost data.
+    Generates a cost report file (CSV, Excel, Parquet or Arrow IPC) from parsed cost data.
+    CSV is streamed to disk in chunks (iter_entries_csv) without building a DataFrame; Excel goes through pandas;
+    Parquet / Arrow are written from the columnar table and need the optional pyarrow package.
     Returns the path to the created file.
     """
     if not cost_data_entries:
         logger.warning("No data provided for report generation.")
         # Create an empty file or raise an error
-        # For now, let it proceed and create an empty file if that's the pandas behavior
-        pass # Fall through to pandas handling
+        # For now, let it proceed and create an empty file (header only)
 
-    df = pd.DataFrame(cost_data_entries)
+    file_format = file_format.lower()
+    if file_format not in REPORT_FILE_EXTENSIONS:
+        raise ValueError(f"Unsupported file format. Choose one of: {', '.join(REPORT_FILE_EXTENSIONS)}.")
+    extension = ".csv.gz" if file_format == "csv" and compress else REPORT_FILE_EXTENSIONS[file_format]
 
     # Sanitize inputs for filename
     safe_sub_id = subscription_id.replace("-", "")
     safe_timeframe = timeframe_str.replace(" ", "_").lower()
     safe_granularity = granularity_str.replace(" ", "_").lower()
-    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-
-    base_filename = f"cost_report_{safe_sub_id}_{safe_timeframe}_{safe_granularity}_{timestamp}"
-
-    if file_format.lower() == "excel":
-        file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_filename}.xlsx")
-        try:
-            df.to_excel(file_path, index=False, engine='openpyxl')
-        except Exception as e:
-            logger.warning(f"Error writing Excel file {file_path}: {e}", exc_info=True)
-            raise IOError(f"Failed to generate Excel report: {e}")
-    elif file_format.lower() == "csv":
-        file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_filename}.csv")
-        try:
-            df.to_csv(file_path, index=False)
-        except Exception as e:
-            logger.warning(f"Error writing CSV file {file_path}: {e}", exc_info=True)
-            raise IOError(f"Failed to generate CSV report: {e}")
+    if report_key:
+        # Content-addressed (report_store.py): identical queries map to the same file.
+        base_filename = f"cost_report_{safe_sub_id}_{safe_timeframe}_{safe_granularity}_{report_key}"
     else:
-        raise ValueError("Unsupported file format. Choose 'csv' or 'excel'.")
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        # Report workers run concurrently, so a random suffix keeps same-second reports from overwriting each other.
+        base_filename = f"cost_report_{safe_sub_id}_{safe_timeframe}_{safe_granularity}_{timestamp}_{uuid.uuid4().hex[:8]}"
+    file_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_filename}{extension}")
+    # Written under a temporary name and renamed, so a file being (re)rendered is never served half-written.
+    partial_path = os.path.join(GENERATED_REPORTS_DIR, f"{base_filename}.partial{extension}")
+
+    try:
+        os.makedirs(GENERATED_REPORTS_DIR, exist_ok=True)
+        if file_format == "excel":
+            df = cost_data_entries.to_dataframe() if isinstance(cost_data_entries, CostEntryTable) else pd.DataFrame(cost_data_entries)
+            await asyncio.to_thread(df.to_excel, partial_path, index=False, engine='openpyxl')
+        elif file_format == "csv":
+            await asyncio.to_thread(_write_csv_report, partial_path, cost_data_entries, compress)
+        else:
+            table = cost_data_entries if isinstance(cost_data_entries, CostEntryTable) else CostEntryTable.from_records(cost_data_entries)
+            await asyncio.to_thread(_write_columnar_report, partial_path, table, file_format)
+        os.replace(partial_path, file_path)
+    except Exception as e:
+        logger.warning(f"Error writing {file_format} file {file_path}: {e}", exc_info=True)
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise IOError(f"Failed to generate {file_format} report: {e}")
 
     logger.info(f"Successfully created cost report: {file_path}")
     return file_path
 
+def _tag_count(tag_or_value: Any) -> Optional[int]:
+    """Resource count of a TagDetails / TagValue (its TagCount.value), None when Azure did not return one."""
+    count = getattr(tag_or_value, "count", None)
+    value = getattr(count, "value", None)
+    return int(value) if value is not None else None
+
+def _tag_values(tag_details: Any) -> List[Any]:
+    """TagValue list of a TagDetails; newer azure-mgmt-resource models expose it as `values_property`."""
+    values = getattr(tag_details, "values_property", None)
+    if values is None and not callable(getattr(tag_details, "values", None)):
+        values = tag_details.values
+    return values or []
+
 async def list_available_tags_for_subscription(access_token: str, subscription_id: str, token_expires_on: Optional[int] = None) -> List[Dict[str, Any]]:
     """
-    Lists all tag names and their distinct values for a given subscription.
-    Uses azure-mgmt-resource.
+    Lists all tag names and their distinct values for a given subscription, with the number of tagged resources
+    per tag ("count") and per value ("value_counts", parallel to "values"). Uses azure-mgmt-resource.
+    Always calls Azure: the caller (tag_catalog.TagCatalogCache) keeps the result for COST_CACHE_TAGS_TTL_SECONDS.
     """
     if not access_token:
         raise ValueError("Access token is required to list available tags.")
@@ -664,25 +1821,25 @@ async def list_available_tags_for_subscription(access_token: str, subscription_i
     # The client itself needs a subscription_id at initialization, even if it's a dummy one for some operations.
     # The actual subscription_id for the 'tags.list' operation is part of the scope.
     
-    # The ResourceManagementClient needs the subscription_id at initialization.
-    resource_mgmt_client = ResourceManagementClient(
-        credential=CustomBearerTokenCredential(access_token, token_expires_on),
-        subscription_id=subscription_id, # Crucial for this client
-        base_url=endpoint
-    )
+    # The ResourceManagementClient needs the subscription_id at initialization (pooled per subscription).
+    resource_mgmt_client = get_resource_management_client(access_token, token_expires_on, subscription_id=subscription_id)
 
-    tags_list: List[Dict[str, Any]] = []
     try:
+        tags_list: List[Dict[str, Any]] = []
         # The tags.list operation is on the client itself, not a sub-client like 'subscriptions'.
         # It operates on the subscription_id the client was initialized with.
         logger.info(f"Calling resource_mgmt_client.tags.list() for subscription {subscription_id}")
-        for tag_details in resource_mgmt_client.tags.list(): # This is a paged operation
-            logger.debug(f"Raw tag_details from SDK for sub {subscription_id}: Name: {tag_details.tag_name}, Values count: {len(tag_details.values) if tag_details.values else 0}")
+        azure_tags = await _call_azure(access_token, f"/subscriptions/{subscription_id}", lambda **kwargs: list(resource_mgmt_client.tags.list(**kwargs))) # Paged operation, drained off the event loop
+        for tag_details in azure_tags:
+            tag_values = _tag_values(tag_details)
+            logger.debug(f"Raw tag_details from SDK for sub {subscription_id}: Name: {tag_details.tag_name}, Values count: {len(tag_values)}")
             tags_list.append({
                 "tagName": tag_details.tag_name,
-                "values": [tv.tag_value for tv in tag_details.values] if tag_details.values else []
+                "count": _tag_count(tag_details),
+                "values": [tv.tag_value for tv in tag_values],
+                "value_counts": [_tag_count(tv) for tv in tag_values],
             })
-        logger.info(f"Processed tags for subscription {subscription_id}: {tags_list}")
+        logger.info(f"Processed {len(tags_list)} tags with {sum(len(tag['values']) for tag in tags_list)} values for subscription {subscription_id}")
         return tags_list
     except HttpResponseError as e:
         # Extract retry-after header if available for 429 errors
@@ -690,7 +1847,8 @@ async def list_available_tags_for_subscription(access_token: str, subscription_i
         logger.warning(f"Azure API Error listing tags for subscription {subscription_id}: {e.message} - Retry-After: {retry_after}", exc_info=True)
         raise HTTPException(
             status_code=e.status_code if hasattr(e, 'status_code') else 500,
-            detail=f"Azure API Error listing tags: {e.message}. Retry-After: {retry_after}"
+            detail=f"Azure API Error listing tags: {e.message}. Retry-After: {retry_after}",
+            headers={"Retry-After": retry_after} if e.status_code == 429 else None
         )
     except Exception as e:
         logger.warning(f"Unexpected error listing tags for subscription {subscription_id}: {str(e)}", exc_info=True)
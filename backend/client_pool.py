@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+C = TypeVar("C")
+
+
+class AzureClientPool:
+    """
+    Reuses Azure management SDK clients across requests. All clients send through one shared requests.Session,
+    so connections to ARM stay open (keep-alive) instead of paying a TLS handshake per request; each client gets
+    its own RequestsTransport over that session (session_owner=False, so closing a client leaves the session open).
+
+    Clients are pooled per (kind, token hash, token expiry, extra key) because every client carries its caller's
+    bearer token. Clients idle for `idle_seconds` or whose token has expired are closed by a sweep that runs on
+    access at most every `sweep_interval_seconds`; beyond `max_clients` the least recently used client is closed.
+    """
+    def __init__(self, max_clients: int, idle_seconds: float, connection_pool_size: int, sweep_interval_seconds: float = 60):
+        self.max_clients = max_clients
+        self.idle_seconds = idle_seconds
+        self.connection_pool_size = connection_pool_size
+        self.sweep_interval_seconds = sweep_interval_seconds
+        self._lock = threading.Lock()
+        self._session: Optional[requests.Session] = None
+        self._clients: "OrderedDict[Tuple[str, str, Optional[float], str], Tuple[Any, float]]" = OrderedDict()  # key -> (client, last used)
+        self._last_sweep = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evicted_clients = 0
+
+    def _shared_session(self) -> requests.Session:
+        if self._session is None:
+            session = requests.Session()
+            # Retries are left to the SDK pipeline's RetryPolicy, as in RequestsTransport's own session setup.
+            adapter = HTTPAdapter(
+                pool_connections=self.connection_pool_size,
+                pool_maxsize=self.connection_pool_size,
+                max_retries=Retry(total=False, redirect=False, raise_on_status=False),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            self._session = session
+        return self._session
+
+    def transport(self) -> RequestsTransport:
+        """A transport over the shared keep-alive session, for one SDK client."""
+        with self._lock:
+            return RequestsTransport(session=self._shared_session(), session_owner=False)
+
+    def get(
+            self,
+            kind: str,
+            access_token: str,
+            expires_on: Optional[float],
+            factory: Callable[[RequestsTransport], C],
+            extra_key: str = ""
+    ) -> C:
+        """Returns the pooled client for this caller token (building it with `factory(transport)` when missing)."""
+        key = (kind, hashlib.sha256(access_token.encode("utf-8")).hexdigest(), expires_on, extra_key)
+        now = time.monotonic()
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                self._clients[key] = (pooled[0], now)
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return pooled[0]
+        client = factory(self.transport())
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None:  # Built concurrently by another request; keep the pooled one.
+                self._close(client)
+                return pooled[0]
+            self._clients[key] = (client, now)
+            self.misses += 1
+            evicted = self._collect_evictions(now)
+        for stale_client in evicted:
+            self._close(stale_client)
+        return client
+
+    def _collect_evictions(self, now: float) -> list:
+        """Removes LRU overflow and (at most every sweep interval) idle / expired clients. Called with the lock held."""
+        evicted = []
+        while len(self._clients) > self.max_clients:
+            evicted.append(self._clients.popitem(last=False)[1][0])
+        if now - self._last_sweep >= self.sweep_interval_seconds:
+            self._last_sweep = now
+            wall_now = time.time()
+            for key, (client, last_used) in list(self._clients.items()):
+                expires_on = key[2]
+                if now - last_used > self.idle_seconds or (expires_on is not None and expires_on <= wall_now):
+                    del self._clients[key]
+                    evicted.append(client)
+        self.evicted_clients += len(evicted)
+        return evicted
+
+    @staticmethod
+    def _close(client: Any) -> None:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug(f"Error closing pooled Azure client: {e}")
+
+    def close(self) -> None:
+        """Closes every pooled client and the shared session. Called from the application shutdown hook."""
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+            session, self._session = self._session, None
+        for client in clients:
+            self._close(client)
+        if session is not None:
+            session.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds: Dict[str, int] = {}
+            for kind, _, _, _ in self._clients:
+                kinds[kind] = kinds.get(kind, 0) + 1
+            return {
+                "clients": len(self._clients),
+                "clients_by_kind": kinds,
+                "max_clients": self.max_clients,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted_clients": self.evicted_clients,
+            }
+
+
+azure_client_pool = AzureClientPool(
+    max_clients=settings.AZURE_CLIENT_POOL_MAX_CLIENTS,
+    idle_seconds=settings.AZURE_CLIENT_POOL_IDLE_SECONDS,
+    connection_pool_size=settings.AZURE_SDK_MAX_WORKERS,
+)
@@ -10,6 +10,96 @@ class Settings(BaseSettings):
     AZURE_RESOURCE_MANAGER_ENDPOINT: Optional[str] = None
     AZURE_RESOURCE_MANAGER_AUDIENCE: Optional[str] = None
 
+    # Max threads used to run the (synchronous) Azure SDK calls off the event loop
+    AZURE_SDK_MAX_WORKERS: int = 32
+
+    # Pooled per-token SDK clients sharing one keep-alive HTTP session (client_pool.py)
+    AZURE_CLIENT_POOL_MAX_CLIENTS: int = 256         # Least recently used clients are closed beyond this
+    AZURE_CLIENT_POOL_IDLE_SECONDS: int = 600        # Pooled clients unused this long are closed
+
+    # /subscriptions/batch-costs fan-out
+    BATCH_COSTS_MAX_CONCURRENCY_PER_TENANT: int = 4
+    BATCH_COSTS_MAX_TENANTS: int = 1000                    # Per-tenant semaphores kept (least recently used dropped first)
+    BATCH_COSTS_MAX_RETRIES: int = 3
+    BATCH_COSTS_AGGREGATION_SCOPE: Optional[str] = None    # Management group id / scope used by mode="scope" when none is sent
+
+    # Shared Azure request scheduler (rate_limiter.py)
+    AZURE_MAX_CONCURRENT_REQUESTS_PER_SCOPE: int = 4
+    AZURE_RATE_LIMIT_LOW_QUOTA_THRESHOLD: int = 2           # Start spacing requests at or below this remaining quota
+    AZURE_RATE_LIMIT_LOW_QUOTA_DELAY_SECONDS: float = 5.0
+    AZURE_RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS: float = 10.0 # Used for 429s that carry no retry-after header
+    AZURE_RATE_LIMIT_MAX_RETRY_AFTER_SECONDS: float = 300.0   # Longer retry-after values are capped to this
+    AZURE_RATE_LIMIT_MAX_TRACKED_KEYS: int = 10000             # Idle tenants / scopes are forgotten beyond this
+
+    # Query result parsing: "columnar" (NumPy/pandas, cost_parser.py) or "python" (row-by-row)
+    COST_PARSER_ENGINE: str = "columnar"
+    COST_QUERY_MAX_PAGES: int = 200 # Upper bound on next_link pages followed for one query
+    COST_QUERY_PLANNER_ENABLED: bool = True  # Serve recent windows by slicing one cached Daily superset query (query_planner.py)
+    COST_QUERY_SHARD_MIN_DAYS: int = 45      # Longer windows are split into calendar-month queries run concurrently (0: never)
+    COST_QUERY_SHARD_CONCURRENCY: int = 4    # Month shards of one query in flight at a time
+
+    # Cost projections (cost_forecast.py): "local" (from daily actuals), "azure" (forecast API) or "both" (local, cross-checked against Azure)
+    COST_FORECAST_ENGINE: str = "local"
+    COST_FORECAST_METHOD: str = "weekday_seasonal"  # "run_rate", "weekday_seasonal" or "linear_trend"
+    COST_FORECAST_LOOKBACK_DAYS: int = 28           # Complete days the local forecast is fitted on
+
+    # Cost result cache (cost_cache.py)
+    COST_CACHE_ENABLED: bool = True
+    COST_CACHE_BACKEND: str = "memory"                 # "memory", "sqlite" (shared by workers on a host) or "redis"
+    COST_CACHE_SQLITE_PATH: str = "cost_cache.sqlite3"
+    COST_CACHE_REDIS_URL: Optional[str] = None         # e.g. redis://localhost:6379/0
+    COST_CACHE_KEY_PREFIX: str = "cost:"
+    COST_CACHE_MAX_BYTES: int = 256 * 1024 * 1024
+    COST_CACHE_TTL_SECONDS: int = 3600                 # Windows that still include unsettled days
+    COST_CACHE_FORECAST_TTL_SECONDS: int = 6 * 3600    # Yearly actual + forecast series
+    COST_CACHE_TAGS_TTL_SECONDS: int = 3600
+    COST_CACHE_SETTLED_DAYS: int = 3                   # Windows ending before today - N days never expire
+
+    # Local cost warehouse (cost_warehouse.py) and its background ingestion (cost_ingestion.py)
+    COST_WAREHOUSE_ENABLED: bool = False                    # Opened by the startup hook when enabled
+    COST_WAREHOUSE_PATH: str = "cost_warehouse.sqlite3"
+    # Background ingestion keeps the latest user token per subscription in memory to backfill the history;
+    # without it the warehouse only holds days refreshed during requests. One worker per host ingests.
+    COST_WAREHOUSE_INGESTION_ENABLED: bool = False
+    COST_WAREHOUSE_HISTORY_DAYS: int = 400                  # Days back from today kept in the warehouse
+    COST_WAREHOUSE_UNSETTLED_DAYS: int = 3                  # Trailing days whose costs Azure may still revise
+    COST_WAREHOUSE_FRESHNESS_SECONDS: int = 3600            # Max age of unsettled days for a query to be served locally
+    COST_WAREHOUSE_INCREMENTAL_MAX_DAYS: int = 7            # Requests re-fetch stale trailing days themselves up to this far back
+    COST_WAREHOUSE_INGEST_INTERVAL_SECONDS: int = 900
+    COST_WAREHOUSE_ACCESS_TTL_SECONDS: int = 24 * 3600      # How long a successful Azure query proves an identity's access
+    COST_WAREHOUSE_TOKEN_MIN_VALIDITY_SECONDS: int = 300    # Ingestion only uses user tokens valid at least this long
+    COST_WAREHOUSE_MAX_TOKENS: int = 1000                   # Subscriptions whose ingestion token is kept in memory
+
+    # Bearer token verification (security.py): each new token is checked once against ARM before its claims are trusted
+    TOKEN_VERIFIER_MAX_TOKENS: int = 10000           # Verified tokens remembered (least recently used dropped first)
+    TOKEN_VERIFIER_TIMEOUT_SECONDS: float = 10.0
+    # Callers of another identity only join an Azure query already in flight (azure_client._single_flight) once
+    # their permissions on its scope allow it; those permissions are cached this long per identity and scope
+    SCOPE_PERMISSIONS_TTL_SECONDS: int = 300
+    SCOPE_PERMISSIONS_MAX_ENTRIES: int = 10000
+
+    # Per-identity subscription directory (subscription_directory.py) behind /subscriptions and subscription_name
+    SUBSCRIPTION_DIRECTORY_TTL_SECONDS: int = 3600        # Older directories are fetched again before answering
+    SUBSCRIPTION_DIRECTORY_REFRESH_SECONDS: int = 300     # Older directories are served and refreshed in the background
+    SUBSCRIPTION_DIRECTORY_MAX_IDENTITIES: int = 1000
+
+    # Searchable tag catalogs (tag_catalog.py) behind /available-tags; rebuilt after COST_CACHE_TAGS_TTL_SECONDS
+    TAG_CATALOG_MAX_SUBSCRIPTIONS: int = 256             # (identity, subscription) catalogs kept in memory
+
+    # Report job queue (report_jobs.py): generate-report returns a job id and a worker renders the file
+    REPORT_JOB_WORKERS: int = 2                 # Reports fetched / rendered concurrently
+    REPORT_JOB_QUEUE_SIZE: int = 50             # Waiting jobs before generate-report answers 503
+    REPORT_JOB_RETENTION_SECONDS: int = 3600    # How long finished jobs stay pollable
+    REPORT_COLUMNAR_COMPRESSION: str = "zstd"   # Parquet / Arrow report codec (zstd, lz4, snappy (parquet only), none)
+
+    # Report store (report_store.py): reuse of identical reports and retention of GENERATED_REPORTS_DIR
+    REPORT_STORE_MAX_BYTES: int = 2 * 1024 ** 3           # Least recently used reports are deleted above this
+    REPORT_STORE_MAX_AGE_SECONDS: int = 7 * 24 * 3600     # Report files older than this are deleted
+    REPORT_STORE_JANITOR_INTERVAL_SECONDS: int = 600
+    # download-report links are signed: only callers allowed to see a report job get a working URL
+    REPORT_DOWNLOAD_SIGNING_KEY: Optional[str] = None     # Shared secret for multi-host deployments; if unset, one key is generated and kept in GENERATED_REPORTS_DIR/.download_signing_key
+    REPORT_DOWNLOAD_URL_TTL_SECONDS: int = 900            # How long a download link works
+
     # Load from .env file
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding='utf-8', extra='ignore')
 
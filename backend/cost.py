@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any, Optional
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional, Dict, Any
 
 class CostQueryRequest(BaseModel):
@@ -43,6 +43,12 @@ class SubscriptionCostDetails(BaseModel):
     projected_cost_dynamic_label: Optional[str] = None  # Label for the dynamic projection
     projected_costs_by_resource_group_dynamic: Dict[str, float] = {} # RG projections for dynamic timeframe
     detailed_entries: List[CostEntry] = []
+    # Unfiltered costs of the same window (batch-costs with tag_filters and include_baseline)
+    baseline_total_cost: Optional[float] = None
+    baseline_costs_by_resource_group: Optional[Dict[str, float]] = None
+    baseline_projected_cost_current_month: Optional[float] = None
+    baseline_yearly_monthly_breakdown: Optional[List[MonthlyBreakdownItem]] = None
+    error: Optional[str] = None # Set when this subscription could not be fetched (batch endpoints)
 
 class ResourceGroupCostDetails(BaseModel):
     subscription_id: str
@@ -65,11 +71,28 @@ class ReportCreationResponse(BaseModel):
     message: str
     file_name: Optional[str] = None
     download_url: Optional[str] = None
+    job_id: Optional[str] = None
+    status_url: Optional[str] = None
+
+class ReportJobStatus(BaseModel):
+    job_id: str
+    status: str                            # queued, running, completed, failed
+    progress: int                          # 0-100
+    stage: str
+    queue_position: int = 0                # 1-based while queued
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    file_name: Optional[str] = None
+    download_url: Optional[str] = None     # Set once the job is completed
+    error: Optional[str] = None
 
 class TagValueDetails(BaseModel):
     tagValue: Optional[str] = None
-    # count: Optional[Dict[str, Any]] = None # If you need count details
+    count: Optional[int] = None  # Number of resources with this tag value
 
 class TagDetailsResponse(BaseModel):
     tagName: str
-    values: List[Optional[str]] # List of distinct string values for the tag
\ No newline at end of file
+    values: List[Optional[str]] # List of distinct string values for the tag (most used first, at most values_limit)
+    count: Optional[int] = None       # Number of resources with this tag
+    valueCount: Optional[int] = None  # Number of distinct values, including those beyond values_limit
\ No newline at end of file
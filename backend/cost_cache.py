@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+try:
+    import redis
+except ImportError:  # Optional dependency, only needed for COST_CACHE_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+def build_cost_cache_key(namespace: str, identity_hash: str, scope: str, definition: Any) -> str:
+    """
+    Builds a cache key from the serialized query/forecast definition, its scope and the caller's identity hash.
+    The definition is JSON-normalized (sorted keys) so equal queries always map to the same key.
+    """
+    normalized = json.dumps({"scope": scope.lower(), "definition": definition}, sort_keys=True, default=str)
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return f"{namespace}:{identity_hash}:{digest}"
+
+
+def cost_cache_ttl_for_period(period_end: datetime) -> Optional[float]:
+    """
+    TTL for a cost query ending at `period_end`. Windows that closed more than COST_CACHE_SETTLED_DAYS ago
+    (e.g. past months) no longer change and never expire; anything still open uses COST_CACHE_TTL_SECONDS.
+    """
+    settled_before = datetime.now(timezone.utc).date() - timedelta(days=settings.COST_CACHE_SETTLED_DAYS)
+    if period_end.date() < settled_before:
+        return None
+    return float(settings.COST_CACHE_TTL_SECONDS)
+
+
+class CostCacheBackend(ABC):
+    """
+    Storage interface behind CostResultCache. Backends store opaque JSON payload strings;
+    `ttl_seconds=None` means the entry never expires and only leaves through eviction.
+    `blocking` backends (disk / network) are called from a worker thread.
+    """
+    name = "base"
+    blocking = False
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """The payload stored under `key`, or None if it is missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, payload: str, ttl_seconds: Optional[float]) -> None:
+        """Stores `payload` under `key` for `ttl_seconds` (None: until evicted)."""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryCacheBackend(CostCacheBackend):
+    """Per-process TTL + LRU store. Payload sizes count towards `max_bytes`; least recently used entries are evicted first."""
+    name = "memory"
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()  # key -> (expires_at, payload)
+        self._bytes = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at is not None and expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return payload
+
+    def set(self, key: str, payload: str, ttl_seconds: Optional[float]) -> None:
+        if len(payload) > self.max_bytes:
+            logger.debug(f"Not caching {key}: {len(payload)} bytes exceeds cache cap of {self.max_bytes} bytes.")
+            return
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.time() + ttl_seconds if ttl_seconds is not None else None
+        self._entries[key] = (expires_at, payload)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, payload = self._entries.pop(key)
+        self._bytes -= len(payload)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+
+class SQLiteCacheBackend(CostCacheBackend):
+    """
+    On-disk store shared by every worker on the host and kept across restarts.
+    Uses WAL mode so workers can read while another writes; evicts least recently used rows past `max_bytes`.
+    The total payload size is kept in `cost_cache_size` by triggers, so every worker's writes count towards it
+    without summing the table on each set; expired rows are only purged once the cache is over its budget.
+    """
+    name = "sqlite"
+    blocking = True
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cost_cache ("
+            " key TEXT PRIMARY KEY, payload TEXT NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_cost_cache_last_access ON cost_cache (last_access)")
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cost_cache_size'").fetchone() is None:
+                self._conn.execute("CREATE TABLE cost_cache_size (id INTEGER PRIMARY KEY CHECK (id = 1), total_bytes INTEGER NOT NULL)")
+                self._conn.execute("INSERT INTO cost_cache_size (id, total_bytes) SELECT 1, COALESCE(SUM(size), 0) FROM cost_cache")
+                self._conn.execute(
+                    "CREATE TRIGGER cost_cache_size_insert AFTER INSERT ON cost_cache"
+                    " BEGIN UPDATE cost_cache_size SET total_bytes = total_bytes + NEW.size WHERE id = 1; END"
+                )
+                self._conn.execute(
+                    "CREATE TRIGGER cost_cache_size_update AFTER UPDATE OF size ON cost_cache"
+                    " BEGIN UPDATE cost_cache_size SET total_bytes = total_bytes + NEW.size - OLD.size WHERE id = 1; END"
+                )
+                self._conn.execute(
+                    "CREATE TRIGGER cost_cache_size_delete AFTER DELETE ON cost_cache"
+                    " BEGIN UPDATE cost_cache_size SET total_bytes = total_bytes - OLD.size WHERE id = 1; END"
+                )
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT payload, expires_at FROM cost_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            payload, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                self._conn.execute("DELETE FROM cost_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE cost_cache SET last_access = ? WHERE key = ?", (now, key))
+            return payload
+
+    def set(self, key: str, payload: str, ttl_seconds: Optional[float]) -> None:
+        if len(payload) > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds is not None else None
+        with self._lock:
+            # An upsert (not INSERT OR REPLACE) so the size triggers see a replaced entry as an update.
+            self._conn.execute(
+                "INSERT INTO cost_cache (key, payload, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET payload = excluded.payload, size = excluded.size,"
+                " expires_at = excluded.expires_at, last_access = excluded.last_access",
+                (key, payload, len(payload), expires_at, now)
+            )
+            self._evict(now)
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT total_bytes FROM cost_cache_size WHERE id = 1").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        if self._total_bytes() <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM cost_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total_bytes = self._total_bytes()
+        if total_bytes <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM cost_cache ORDER BY last_access").fetchall():
+            self._conn.execute("DELETE FROM cost_cache WHERE key = ?", (key,))
+            self.evictions += 1
+            total_bytes -= size
+            if total_bytes <= self.max_bytes:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM cost_cache").fetchone()[0]
+            total_bytes = self._total_bytes()
+        return {"path": self.path, "entries": entries, "bytes": total_bytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RedisCacheBackend(CostCacheBackend):
+    """
+    Store on any server speaking the Redis protocol (Redis, Valkey, KeyDB, ...), shared by all workers and hosts.
+    Expiry is native; size-based eviction is left to the server's maxmemory policy (e.g. allkeys-lru).
+    A pre-built client (e.g. a local stand-in) can be passed instead of a URL.
+    """
+    name = "redis"
+    blocking = True
+
+    def __init__(self, url: Optional[str] = None, key_prefix: str = "cost:", client: Any = None):
+        if client is None:
+            if redis is None:
+                raise RuntimeError("COST_CACHE_BACKEND=redis requires the 'redis' package to be installed.")
+            if not url:
+                raise ValueError("COST_CACHE_REDIS_URL must be configured for COST_CACHE_BACKEND=redis.")
+            client = redis.Redis.from_url(url)
+        self._client = client
+        self.key_prefix = key_prefix
+
+    def get(self, key: str) -> Optional[str]:
+        payload = self._client.get(self.key_prefix + key)
+        if payload is None:
+            return None
+        return payload.decode("utf-8") if isinstance(payload, bytes) else payload
+
+    def set(self, key: str, payload: str, ttl_seconds: Optional[float]) -> None:
+        if ttl_seconds is None:
+            self._client.set(self.key_prefix + key, payload)
+        else:
+            self._client.set(self.key_prefix + key, payload, ex=max(1, int(ttl_seconds)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"key_prefix": self.key_prefix}
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class CostResultCache:
+    """
+    Cache for parsed cost query results in front of a pluggable CostCacheBackend.
+    Values must be JSON-serializable. Blocking backends are called off the event loop.
+    """
+    def __init__(self, backend: CostCacheBackend, enabled: bool = True):
+        self.backend = backend
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        try:
+            payload = await asyncio.to_thread(self.backend.get, key) if self.backend.blocking else self.backend.get(key)
+        except Exception as e:
+            # A broken cache must never fail the request; fall through to Azure.
+            self.errors += 1
+            logger.warning(f"Cost cache ({self.backend.name}) read failed for {key}: {e}")
+            payload = None
+        if payload is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(payload)
+
+    async def set(self, key: str, value: Any, ttl_seconds: Optional[float]) -> None:
+        if not self.enabled:
+            return
+        payload = json.dumps(value, default=str)
+        try:
+            if self.backend.blocking:
+                await asyncio.to_thread(self.backend.set, key, payload, ttl_seconds)
+            else:
+                self.backend.set(key, payload, ttl_seconds)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Cost cache ({self.backend.name}) write failed for {key}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "errors": self.errors,
+            **self.backend.stats(),
+        }
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def create_cost_cache_backend() -> CostCacheBackend:
+    """Builds the backend selected by COST_CACHE_BACKEND ("memory", "sqlite" or "redis")."""
+    backend = settings.COST_CACHE_BACKEND.lower()
+    if backend == "memory":
+        return InMemoryCacheBackend(max_bytes=settings.COST_CACHE_MAX_BYTES)
+    if backend == "sqlite":
+        return SQLiteCacheBackend(path=settings.COST_CACHE_SQLITE_PATH, max_bytes=settings.COST_CACHE_MAX_BYTES)
+    if backend == "redis":
+        return RedisCacheBackend(url=settings.COST_CACHE_REDIS_URL, key_prefix=settings.COST_CACHE_KEY_PREFIX)
+    raise ValueError(f"Unsupported COST_CACHE_BACKEND '{settings.COST_CACHE_BACKEND}'. Choose 'memory', 'sqlite' or 'redis'.")
+
+
+cost_result_cache = CostResultCache(backend=create_cost_cache_backend(), enabled=settings.COST_CACHE_ENABLED)
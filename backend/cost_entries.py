@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+import sys
+import zlib
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+try:
+    import pyarrow as pa
+except ImportError:  # Optional dependency, only needed for the parquet / arrow report formats
+    pa = None
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+# Per-entry keys in the order the parsers produce them (internal / cache / report column order).
+ENTRY_KEYS = ("amount", "currency", "entry_type", "resourceGroupName", "resourceId", "date")
+_STRING_KEYS = ENTRY_KEYS[1:]
+_JSON_CHUNK_ROWS = 20_000
+CSV_CHUNK_ROWS = 20_000
+
+
+class _EncodedColumn:
+    """Dictionary-encoded string column: each distinct value is stored (interned) once, rows hold int codes."""
+    __slots__ = ("codes", "values", "_index")
+
+    def __init__(self):
+        self.codes = array("q")
+        self.values: List[Optional[str]] = []
+        self._index: Dict[Optional[str], int] = {}
+
+    def _code_for(self, value: Optional[str]) -> int:
+        code = self._index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+            self._index[value] = code
+        return code
+
+    def append(self, value: Optional[str]) -> None:
+        self.codes.append(self._code_for(value))
+
+    def extend_encoded(self, codes: np.ndarray, values: Sequence[Optional[str]]) -> None:
+        """Appends rows given as (codes, values) from another encoding, e.g. pd.factorize output."""
+        mapping = np.array([self._code_for(value) for value in values], dtype=np.int64)
+        self.codes.extend(mapping[codes].tolist() if len(mapping) else [])
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self.values[self.codes[row]]
+
+    def row_values(self) -> List[Optional[str]]:
+        values = self.values
+        return [values[code] for code in self.codes]
+
+
+class CostEntryTable:
+    """
+    Compact, column-oriented container for parsed cost entries (detailed_entries, yearly_daily_breakdown).
+    Amounts are kept in a float array and string columns are dictionary-encoded, so repeated resource IDs,
+    RG names, dates and currencies cost one int per row instead of one dict slot and string reference each.
+    Iterating yields the same dicts the parsers used to return; routes serialize it with `to_json()` instead
+    of building one CostEntry model per row.
+    """
+    __slots__ = ("amounts", "currency", "entry_type", "resourceGroupName", "resourceId", "date")
+
+    def __init__(self):
+        self.amounts = array("d")
+        for key in _STRING_KEYS:
+            setattr(self, key, _EncodedColumn())
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CostEntryTable):
+            return NotImplemented
+        return self.amounts == other.amounts and all(
+            getattr(self, key).row_values() == getattr(other, key).row_values() for key in _STRING_KEYS
+        )
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        columns = [self.amounts] + [getattr(self, key).row_values() for key in _STRING_KEYS]
+        return (dict(zip(ENTRY_KEYS, row)) for row in zip(*columns))
+
+    def append(self, entry: Mapping[str, Any]) -> None:
+        self.amounts.append(float(entry["amount"]))
+        for key in _STRING_KEYS:
+            getattr(self, key).append(entry.get(key))
+
+    @classmethod
+    def from_records(cls, entries: Iterable[Mapping[str, Any]]) -> "CostEntryTable":
+        table = cls()
+        for entry in entries:
+            table.append(entry)
+        return table
+
+    def to_columns(self) -> Dict[str, Any]:
+        """JSON-serializable columnar form (used for the result cache); inverse of from_columns()."""
+        columns: Dict[str, Any] = {"amount": self.amounts.tolist()}
+        for key in _STRING_KEYS:
+            column = getattr(self, key)
+            columns[key] = {"values": column.values, "codes": column.codes.tolist()}
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, Any]) -> "CostEntryTable":
+        table = cls()
+        table.amounts.extend(columns["amount"])
+        for key in _STRING_KEYS:
+            getattr(table, key).extend_encoded(np.asarray(columns[key]["codes"], dtype=np.int64), columns[key]["values"])
+        return table
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """DataFrame with one column per entry key (same columns as a DataFrame built from the entry dicts)."""
+        data: Dict[str, Any] = {"amount": np.array(self.amounts, dtype=np.float64)}
+        for key in _STRING_KEYS:
+            column = getattr(self, key)
+            data[key] = np.asarray(column.values, dtype=object)[np.array(column.codes, dtype=np.int64)]
+        return pd.DataFrame(data, columns=list(ENTRY_KEYS))
+
+    def to_json(self) -> str:
+        """
+        Serializes the entries as a JSON array of CostEntry objects (by alias). Each distinct string is JSON-encoded
+        once and rows are written in chunks, so no per-row model or dict is created.
+        """
+        encoded = {key: [json.dumps(value) for value in getattr(self, key).values] for key in _STRING_KEYS}
+        parts: List[str] = []
+        for start in range(0, len(self), _JSON_CHUNK_ROWS):
+            stop = start + _JSON_CHUNK_ROWS
+            dates, currencies, rg_names, resource_ids, entry_types = (
+                map(encoded[key].__getitem__, getattr(self, key).codes[start:stop])
+                for key in ("date", "currency", "resourceGroupName", "resourceId", "entry_type")
+            )
+            parts.append(",".join(
+                f'{{"date":{date},"amount":{float.__repr__(amount)},"currency":{currency},'
+                f'"resourceGroupName":{rg_name},"resourceId":{resource_id},"entry_type":{entry_type}}}'
+                for date, amount, currency, rg_name, resource_id, entry_type
+                in zip(dates, self.amounts[start:stop], currencies, rg_names, resource_ids, entry_types)
+            ))
+        return "[" + ",".join(parts) + "]"
+
+    def to_arrow(self) -> "pa.Table":
+        """
+        Arrow table with the same columns as to_dataframe(). String columns become dictionary arrays built directly
+        from the existing codes (no re-encoding), missing values (None) become nulls. Requires pyarrow.
+        """
+        if pa is None:
+            raise RuntimeError("The parquet / arrow report formats require the 'pyarrow' package to be installed.")
+        arrays = [pa.array(np.frombuffer(self.amounts, dtype=np.float64) if len(self) else [], type=pa.float64())]
+        for key in _STRING_KEYS:
+            column = getattr(self, key)
+            codes = np.frombuffer(column.codes, dtype=np.int64) if len(self) else np.empty(0, dtype=np.int64)
+            null_code = column._index.get(None)
+            indices = pa.array(codes.astype(np.int32), mask=codes == null_code if null_code is not None else None)
+            dictionary = pa.array(["" if value is None else value for value in column.values], type=pa.string())
+            arrays.append(pa.DictionaryArray.from_arrays(indices, dictionary))
+        return pa.Table.from_arrays(arrays, names=list(ENTRY_KEYS))
+
+    def iter_csv(self, chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[str]:
+        """
+        Yields the entries as CSV text (header first, same columns and values as to_dataframe().to_csv(index=False))
+        in chunks of `chunk_rows` rows, so only one chunk of text exists at a time whatever the row count.
+        """
+        yield ",".join(ENTRY_KEYS) + "\n"
+        string_columns = [getattr(self, key) for key in _STRING_KEYS]
+        for start in range(0, len(self), chunk_rows):
+            stop = start + chunk_rows
+            columns = [self.amounts[start:stop]] + [map(column.values.__getitem__, column.codes[start:stop]) for column in string_columns]
+            yield _csv_text(zip(*columns))
+
+
+def _csv_text(rows: Iterable[Sequence[Any]]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(rows)
+    return buffer.getvalue()
+
+def iter_entries_csv(entries: Iterable[Mapping[str, Any]], chunk_rows: int = CSV_CHUNK_ROWS) -> Iterator[str]:
+    """CSV chunks for a CostEntryTable or any iterable of entry dicts (e.g. a row generator), without a DataFrame."""
+    if isinstance(entries, CostEntryTable):
+        yield from entries.iter_csv(chunk_rows)
+        return
+    yield ",".join(ENTRY_KEYS) + "\n"
+    chunk: List[Tuple[Any, ...]] = []
+    for entry in entries:
+        chunk.append(tuple(entry.get(key) for key in ENTRY_KEYS))
+        if len(chunk) >= chunk_rows:
+            yield _csv_text(chunk)
+            chunk = []
+    if chunk:
+        yield _csv_text(chunk)
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """Gzip-compresses a stream of text chunks incrementally (one gzip member, UTF-8)."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def render_model_json(model: BaseModel, entry_tables: Mapping[str, CostEntryTable]) -> str:
+    """
+    JSON for a response model whose entry-list fields are held in CostEntryTables: the model is dumped by alias
+    without those fields and each table's to_json() is spliced in under its field name.
+    """
+    payload = model.model_dump(mode="json", by_alias=True, exclude=set(entry_tables))
+    body = json.dumps(payload)
+    if not entry_tables:
+        return body
+    fields = ",".join(f'{json.dumps(name)}:{table.to_json()}' for name, table in entry_tables.items())
+    return body[:-1] + ("," if payload else "") + fields + "}"
@@ -0,0 +1,169 @@
+import calendar
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.cost_parser import RG_PREFIX_FILTER
+from app.core.cost_warehouse import day_from_key, day_key
+
+logger = logging.getLogger(__name__)
+
+FORECAST_METHODS = ("run_rate", "weekday_seasonal", "linear_trend")
+
+# Counters for /metrics/cost-forecast. Cross-checks compare the local end-of-month projection with Azure's.
+forecast_stats = {"local_forecasts": 0, "azure_forecasts": 0, "cross_checks": 0, "cross_check_abs_deviation_pct_sum": 0.0}
+
+
+def forecast_daily(history: np.ndarray, first_forecast_day: date, horizon_days: int, method: str) -> np.ndarray:
+    """
+    Forecasts (groups x horizon_days) for the days from `first_forecast_day`, continuing `history` (groups x days,
+    one column per day, the last one the day before first_forecast_day):
+    - run_rate: mean daily cost of the history
+    - weekday_seasonal: mean cost of the same weekday in the history (the run rate for weekdays without history)
+    - linear_trend: least-squares line through the history, extrapolated and floored at 0
+    """
+    groups, days = history.shape
+    if horizon_days <= 0 or days == 0:
+        return np.zeros((groups, max(horizon_days, 0)))
+    run_rate = history.mean(axis=1)
+    if method == "run_rate":
+        return np.repeat(run_rate[:, None], horizon_days, axis=1)
+    if method == "weekday_seasonal":
+        history_weekdays = (np.arange(days) + (first_forecast_day - timedelta(days=days)).weekday()) % 7
+        forecast_weekdays = (np.arange(horizon_days) + first_forecast_day.weekday()) % 7
+        weekday_means = np.repeat(run_rate[:, None], 7, axis=1)
+        for weekday in range(7):
+            mask = history_weekdays == weekday
+            if mask.any():
+                weekday_means[:, weekday] = history[:, mask].mean(axis=1)
+        return weekday_means[:, forecast_weekdays]
+    if method == "linear_trend":
+        x = np.arange(days, dtype=float) - (days - 1) / 2
+        denominator = float((x ** 2).sum())
+        slope = (history - run_rate[:, None]) @ x / denominator if denominator else np.zeros(groups)
+        future_x = np.arange(days, days + horizon_days, dtype=float) - (days - 1) / 2
+        return np.maximum(run_rate[:, None] + slope[:, None] * future_x[None, :], 0.0)
+    raise ValueError(f"Unknown forecast method '{method}'. Choose from: {', '.join(FORECAST_METHODS)}.")
+
+
+def projection_window(timeframe: str, window_first: date, window_last: date, today: date) -> Optional[Tuple[str, date, date, bool]]:
+    """
+    What the dynamic projection of a timeframe covers: (label, first and last forecast day, whether the window's
+    actual costs are added). To-date timeframes project to the end of their month / quarter / year, rolling ones
+    the next window of the same length, and Custom windows ending in the future their remaining days.
+    Closed windows have no projection (None).
+    """
+    tomorrow = today + timedelta(days=1)
+    timeframe = timeframe.lower()
+    if timeframe in ("monthtodate", "billingmonthtodate"):
+        return "Projected end of month", tomorrow, today.replace(day=calendar.monthrange(today.year, today.month)[1]), True
+    if timeframe == "quartertodate":
+        quarter_end_month = ((today.month - 1) // 3 + 1) * 3
+        return "Projected end of quarter", tomorrow, date(today.year, quarter_end_month, calendar.monthrange(today.year, quarter_end_month)[1]), True
+    if timeframe == "yeartodate":
+        return "Projected end of year", tomorrow, date(today.year, 12, 31), True
+    if timeframe in ("thelast7days", "thelast30days"):
+        length = (window_last - window_first).days + 1
+        return f"Projected next {length} days", tomorrow, today + timedelta(days=length), False
+    if timeframe == "custom" and window_last > today:
+        return f"Projected through {window_last.isoformat()}", tomorrow, window_last, True
+    return None
+
+
+class CostProjection:
+    """
+    Local cost projection of one subscription. Daily actual costs per resource group from `first_day` to today
+    (rows as returned by azure_client.fetch_daily_cost_rows) are continued by forecast_daily, fitted on the last
+    `lookback_days` complete days (today's costs are still incomplete), up to `horizon_end`. All resource groups
+    are forecast at once as one matrix.
+    """
+    def __init__(
+        self,
+        rows: Sequence[Sequence[Any]],
+        first_day: date,
+        today: date,
+        horizon_end: date,
+        method: str,
+        lookback_days: int
+    ):
+        self.first_day = first_day
+        self.today = today
+        self.method = method
+        self.currency = next((str(row[3]) for row in rows if row[3]), "USD")
+        group_index: Dict[Optional[str], int] = {}
+        codes, offsets, costs = [], [], []
+        first_key, today_key = day_key(first_day), day_key(today)
+        for usage_date, resource_group, _, _, cost in rows:
+            if first_key <= usage_date <= today_key:
+                codes.append(group_index.setdefault(resource_group, len(group_index)))
+                offsets.append((day_from_key(usage_date) - first_day).days)
+                costs.append(float(cost))
+        self.resource_groups: List[Optional[str]] = list(group_index)
+        days = (today - first_day).days + 1
+        self.actuals = np.zeros((len(self.resource_groups), days))
+        np.add.at(self.actuals, (np.array(codes, dtype=int), np.array(offsets, dtype=int)), np.array(costs, dtype=float))
+        # The history ends yesterday, so it is continued from today; today's forecast is dropped for its actuals.
+        history = self.actuals[:, max(0, days - 1 - lookback_days):days - 1]
+        self.forecast = forecast_daily(history, today, (horizon_end - today).days + 1, method)[:, 1:]
+
+    def _actual_sums(self, first: date, last: date) -> np.ndarray:
+        start, end = max((first - self.first_day).days, 0), (min(last, self.today) - self.first_day).days + 1
+        return self.actuals[:, start:end].sum(axis=1) if end > start else np.zeros(len(self.resource_groups))
+
+    def _forecast_sums(self, first: date, last: date) -> np.ndarray:
+        start, end = max((first - self.today).days - 1, 0), (last - self.today).days
+        return self.forecast[:, start:end].sum(axis=1) if end > start else np.zeros(len(self.resource_groups))
+
+    def daily_entries(self, first: date, last: date) -> List[Dict[str, Any]]:
+        """Subscription totals per day, shaped like the entries of the Azure forecast (actual up to today, then forecast)."""
+        actual_totals, forecast_totals = self.actuals.sum(axis=0), self.forecast.sum(axis=0)
+        entries = []
+        day = max(first, self.first_day)
+        while day <= last:
+            if day <= self.today:
+                amount, entry_type = actual_totals[(day - self.first_day).days], "actual"
+            else:
+                offset = (day - self.today).days - 1
+                if offset >= len(forecast_totals):
+                    break
+                amount, entry_type = forecast_totals[offset], "forecast"
+            entries.append({
+                "amount": round(float(amount), 2), "currency": self.currency, "entry_type": entry_type,
+                "resourceGroupName": "N/A", "resourceId": None, "date": day.isoformat()
+            })
+            day += timedelta(days=1)
+        return entries
+
+    def dynamic_projection(self, timeframe: str, window_first: date, window_last: date) -> Optional[Dict[str, Any]]:
+        """The projected_*_dynamic fields of SubscriptionCostDetails for a timeframe (None when it has no projection)."""
+        window = projection_window(timeframe, window_first, window_last, self.today)
+        if window is None:
+            return None
+        label, forecast_first, forecast_last, include_actuals = window
+        projected = self._forecast_sums(forecast_first, forecast_last)
+        if include_actuals:
+            projected = projected + self._actual_sums(window_first, window_last)
+        by_resource_group: Dict[str, float] = {}
+        for resource_group, amount in zip(self.resource_groups, projected.tolist()):
+            if resource_group and resource_group.startswith(RG_PREFIX_FILTER):
+                by_resource_group[resource_group] = round(by_resource_group.get(resource_group, 0.0) + amount, 2)
+        return {
+            "projected_cost_dynamic": round(float(projected.sum()), 2),
+            "projected_cost_dynamic_label": label,
+            "projected_costs_by_resource_group_dynamic": by_resource_group,
+        }
+
+
+def cross_check(subscription_id: str, local_projection: Optional[float], azure_projection: Optional[float]) -> None:
+    """Logs and counts how far the local end-of-month projection is from Azure's forecast (COST_FORECAST_ENGINE=both)."""
+    if local_projection is None or not azure_projection:
+        return
+    deviation_pct = abs(local_projection - azure_projection) / abs(azure_projection) * 100
+    forecast_stats["cross_checks"] += 1
+    forecast_stats["cross_check_abs_deviation_pct_sum"] += deviation_pct
+    logger.info(
+        f"Forecast cross-check for subscription {subscription_id}: local end of month {local_projection:.2f}, "
+        f"Azure {azure_projection:.2f} ({deviation_pct:.1f}% apart)."
+    )
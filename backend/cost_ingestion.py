@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import IO, Optional
+
+from app.core.azure_client import fetch_daily_cost_rows
+from app.core.config import settings
+from app.core.cost_warehouse import CostWarehouse, contiguous_windows, cost_warehouse
+
+try:
+    import fcntl
+except ImportError:  # Windows has no advisory file locks: every worker ingests
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class CostWarehouseIngestor:
+    """
+    Background task that keeps the cost warehouse filled. Every COST_WAREHOUSE_INGEST_INTERVAL_SECONDS it walks the
+    enrolled subscriptions and (re)fetches the days after the subscription's watermark (within the last
+    COST_WAREHOUSE_HISTORY_DAYS) that are missing or stale,
+    using a still-valid token of a user who recently queried that subscription. Subscriptions without such a token
+    are skipped until someone with access uses the app again.
+
+    Only one worker per host ingests: the one holding an exclusive lock on `lock_path`. The others retry each
+    cycle, so another worker takes over when it stops. Only the ingesting worker keeps user tokens
+    (CostWarehouse.keep_tokens).
+    """
+    def __init__(self, warehouse: CostWarehouse, interval_seconds: float, history_days: int, lock_path: str):
+        self.warehouse = warehouse
+        self.interval_seconds = interval_seconds
+        self.history_days = history_days
+        self.lock_path = lock_path
+        self._lock_file: Optional[IO[str]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._lock_file is not None:
+            self.warehouse.keep_tokens = False
+            self._lock_file.close()  # Releases the lock
+            self._lock_file = None
+
+    def _acquire_ingestion_lock(self) -> bool:
+        """Whether this worker is (now) the one that ingests."""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        self.warehouse.keep_tokens = True
+        logger.info("This worker runs the cost warehouse ingestion.")
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                if self._acquire_ingestion_lock():
+                    await self.run_once()
+            except Exception as e:
+                logger.warning(f"Cost warehouse ingestion cycle failed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    async def run_once(self) -> None:
+        for subscription_id in await asyncio.to_thread(self.warehouse.subscriptions):
+            await self.ingest_subscription(subscription_id)
+
+    async def ingest_subscription(self, subscription_id: str) -> int:
+        """Fetches the missing / stale days of one subscription. Returns the number of days stored."""
+        access_token = self.warehouse.token_for(subscription_id)
+        if access_token is None:
+            logger.debug(f"No valid user token for subscription {subscription_id}; skipping warehouse ingestion.")
+            return 0
+        today = datetime.now(timezone.utc).date()
+        due_days = await asyncio.to_thread(self.warehouse.days_to_ingest, subscription_id, today - timedelta(days=self.history_days), today)
+        stored = 0
+        try:
+            for first_day, last_day in contiguous_windows(due_days):
+                rows = await fetch_daily_cost_rows(access_token, subscription_id, first_day, last_day)
+                await asyncio.to_thread(self.warehouse.store_days, subscription_id, first_day, last_day, rows)
+                stored += (last_day - first_day).days + 1
+        except Exception as e:
+            logger.warning(f"Warehouse ingestion failed for subscription {subscription_id} after {stored} days: {e}", exc_info=True)
+            await asyncio.to_thread(self.warehouse.mark_ingested, subscription_id, str(e))
+            return stored
+        await asyncio.to_thread(self.warehouse.mark_ingested, subscription_id)
+        if stored:
+            logger.info(f"Ingested {stored} days of cost data for subscription {subscription_id} into the warehouse.")
+        return stored
+
+
+cost_warehouse_ingestor = CostWarehouseIngestor(
+    cost_warehouse,
+    interval_seconds=settings.COST_WAREHOUSE_INGEST_INTERVAL_SECONDS,
+    history_days=settings.COST_WAREHOUSE_HISTORY_DAYS,
+    lock_path=f"{settings.COST_WAREHOUSE_PATH}.ingest.lock",
+) if cost_warehouse is not None and settings.COST_WAREHOUSE_INGESTION_ENABLED else None
@@ -1,34 +1,377 @@
+import asyncio
+import json
 import logging
 import os
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, HTTPException, Query, Body, Depends, BackgroundTasks, Request, Security
-from fastapi.responses import FileResponse
-from datetime import date
-import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Any, Awaitable, Callable, Tuple, TypeVar
+from fastapi import APIRouter, HTTPException, Query, Body, Depends, Request, Security
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from datetime import date, datetime, timezone
 import random
+import time
 
 from app.core.azure_client import (
-    list_accessible_subscriptions,
     query_subscription_costs,
+    query_subscription_costs_with_baseline,
     query_resource_group_costs,
+    query_scope_costs_by_subscription,
+    query_scope_forecast_histories,
+    resolve_aggregation_scope,
+    _determine_time_period,
     generate_cost_report_file,
     GENERATED_REPORTS_DIR,
-    list_available_tags_for_subscription
+    parse_cost_sections,
+    single_flight_stats,
+    COST_SECTIONS
 )
+from app.core.client_pool import azure_client_pool
+from app.core.cost_cache import cost_result_cache
+from app.core.cost_forecast import forecast_stats
+from app.core.cost_entries import CostEntryTable, arrow_available, gzip_chunks, iter_entries_csv, render_model_json
+from app.core.cost_warehouse import cost_warehouse
+from app.core.query_planner import query_planner_stats
+from app.core.rate_limiter import azure_request_scheduler
+from app.core.subscription_directory import subscription_directory
+from app.core.tag_catalog import tag_catalog_cache
+from app.core.report_jobs import ReportJob, ReportJobQueueFull, report_job_queue
+from app.core.report_store import build_report_key, report_store, report_ttl_for_query, sign_report_download, verify_report_download
 from app.models.cost import (
     AzureSubscription,
     SubscriptionCostDetails,
     ResourceGroupCostDetails,
     CostQueryRequest,
     ReportCreationResponse,
-    CostEntry,
-    TagDetailsResponse
+    ReportJobStatus,
+    TagDetailsResponse,
+    TagValueDetails
 )
-from app.core.security import oauth2_scheme
+from app.core.config import settings
+from app.core.security import get_token_tenant_id, get_verified_identity_hash, scope_permissions, token_verifier, verified_token
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+T = TypeVar("T")
+
+# Per-tenant limit on concurrent subscription fetches made by the batch endpoint. Shared across requests
+# so several users loading the overview at once still stay within one tenant's Cost Management quota.
+# Keyed by the tid claim of the (verified_token) caller; at most BATCH_COSTS_MAX_TENANTS semaphores are kept,
+# least recently used dropped first.
+_tenant_batch_semaphores: "OrderedDict[str, asyncio.Semaphore]" = OrderedDict()
+
+def _get_tenant_batch_semaphore(token: str) -> asyncio.Semaphore:
+    tenant_id = get_token_tenant_id(token)
+    semaphore = _tenant_batch_semaphores.get(tenant_id)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.BATCH_COSTS_MAX_CONCURRENCY_PER_TENANT)
+        _tenant_batch_semaphores[tenant_id] = semaphore
+        while len(_tenant_batch_semaphores) > settings.BATCH_COSTS_MAX_TENANTS:
+            _tenant_batch_semaphores.popitem(last=False)
+    else:
+        _tenant_batch_semaphores.move_to_end(tenant_id)
+    return semaphore
+
+def _caller_identity(token: str) -> str:
+    """Identity hash of a verified_token caller: the owner of its report jobs and stored reports."""
+    identity_hash = get_verified_identity_hash(token)
+    if identity_hash is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired access token.", headers={"WWW-Authenticate": "Bearer"})
+    return identity_hash
+
+_INCLUDE_DESCRIPTION = f"Comma-separated sections to return: {', '.join(COST_SECTIONS)}. Default: all. Sections not requested are not queried."
+
+def _parse_include(include: Optional[str]) -> frozenset:
+    try:
+        return parse_cost_sections(include)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _is_rate_limit_error(e: Exception) -> bool:
+    if isinstance(e, HTTPException):
+        return e.status_code == 429
+    return "429" in str(e) or "too many requests" in str(e).lower()
+
+def _retry_after_seconds(e: Exception) -> Optional[float]:
+    """Reads the Retry-After value azure_client attaches to 429 HTTPExceptions, if present."""
+    headers = getattr(e, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("Retry-After", 0))
+    except (TypeError, ValueError):
+        return None
+    return retry_after if retry_after > 0 else None
+
+def _empty_subscription_cost_details(
+        subscription_id: str, timeframe: str, granularity: str, error: str, subscription_name: Optional[str] = None
+) -> SubscriptionCostDetails:
+    return SubscriptionCostDetails(
+        subscription_id=subscription_id,
+        subscription_name=subscription_name or subscription_id,
+        total_cost=0.0,
+        currency="USD",
+        costs_by_resource_group={},
+        detailed_entries=[],
+        timeframe_used=timeframe,
+        from_date_used=None,
+        to_date_used=None,
+        granularity_used=granularity,
+        projected_cost_current_month=0.0,
+        yearly_monthly_breakdown=[],
+        yearly_daily_breakdown=[],
+        error=error
+    )
+
+async def _retry_rate_limited(description: str, fetch: Callable[[], Awaitable[T]]) -> T:
+    """
+    Runs `fetch`, retrying 429s with exponential backoff (honouring Retry-After when Azure sends one).
+    Other errors, and the 429 of the last attempt, are raised.
+    """
+    max_retries = settings.BATCH_COSTS_MAX_RETRIES
+    base_delay = 1  # Base delay in seconds for exponential backoff
+    for attempt in range(1, max_retries + 1):
+        try:
+            return await fetch()
+        except Exception as e:
+            if not _is_rate_limit_error(e) or attempt == max_retries:
+                raise
+            delay = _retry_after_seconds(e) or base_delay * (2 ** (attempt - 1))
+            delay += random.uniform(0, 0.1 * base_delay)
+            logger.warning(f"429 error for {description}. Retrying after {delay:.2f} seconds (attempt {attempt}/{max_retries})")
+            await asyncio.sleep(delay)
+
+def _batch_error_message(subscription_id: str, e: Exception) -> str:
+    error_message = e.detail if isinstance(e, HTTPException) else str(e)
+    if _is_rate_limit_error(e):
+        logger.error(f"Max retries reached for subscription {subscription_id}. Returning error entry.")
+    else:
+        logger.warning(f"Failed to fetch cost data for subscription {subscription_id}: {error_message}")
+    return error_message
+
+def _subscription_cost_details(
+    subscription_id: str,
+    subscription_name: str,
+    timeframe: str,
+    granularity: str,
+    sections: Optional[frozenset],
+    actual_total: Optional[float],
+    currency: Optional[str],
+    by_rg: Optional[Dict[str, float]],
+    time_period: Any,
+    projected_eom_cost: Optional[float],
+    yearly_breakdown: Optional[List[Dict[str, Any]]],
+    dynamic_projection: Optional[Dict[str, Any]] = None,
+    baseline: Optional[Dict[str, Any]] = None
+) -> SubscriptionCostDetails:
+    if projected_eom_cost is None and (sections is None or "yearly_forecast" in sections):
+        projected_eom_cost = 0.0
+    return SubscriptionCostDetails(
+        subscription_id=subscription_id,
+        subscription_name=subscription_name,
+        total_cost=actual_total if actual_total is not None else 0.0,
+        currency=currency if currency else "USD",
+        costs_by_resource_group=by_rg if by_rg else {},
+        timeframe_used=timeframe,
+        from_date_used=time_period.from_property.date().isoformat() if time_period.from_property else None,
+        to_date_used=time_period.to.date().isoformat() if time_period.to else None,
+        granularity_used=granularity,
+        projected_cost_current_month=projected_eom_cost,
+        yearly_monthly_breakdown=yearly_breakdown if yearly_breakdown else [],
+        **(dynamic_projection or {}),
+        **(baseline or {})
+    )
+
+async def _fetch_subscription_cost_details(
+    token: str,
+    subscription_id: str,
+    timeframe: str,
+    granularity: str,
+    from_date: Optional[date],
+    to_date: Optional[date],
+    semaphore: asyncio.Semaphore,
+    sections: Optional[frozenset] = None,
+    tag_filters: Optional[List[Dict[str, Any]]] = None,
+    include_baseline: bool = False
+) -> Tuple[SubscriptionCostDetails, Dict[str, CostEntryTable]]:
+    """
+    Fetches one subscription for the batch endpoint. Retries 429s with exponential backoff
+    (honouring Retry-After when Azure sends one) without holding the tenant slot while waiting.
+    With include_baseline the unfiltered baseline_* fields are fetched along with the tag-filtered costs
+    (query_subscription_costs_with_baseline).
+    Failures are returned as an entry with `error` set rather than raised.
+    Returns the details plus their entry tables, which are serialized with render_model_json.
+    """
+    # The name comes from the caller's cached subscription directory (one subscriptions.list() per identity).
+    name_task = asyncio.create_task(subscription_directory.display_name(token, subscription_id))
+
+    async def fetch():
+        async with semaphore:
+            query_kwargs = dict(
+                access_token=token,
+                subscription_id=subscription_id,
+                timeframe=timeframe,
+                granularity=granularity,
+                tag_filters=tag_filters or None,
+                from_date=from_date,
+                to_date=to_date,
+                include=sections
+            )
+            if include_baseline:
+                return await query_subscription_costs_with_baseline(**query_kwargs)
+            return await query_subscription_costs(**query_kwargs), None
+
+    try:
+        result, baseline = await _retry_rate_limited(f"subscription {subscription_id}", fetch)
+        actual_total, currency, by_rg, entries, time_period, projected_eom_cost, yearly_breakdown, yearly_daily_breakdown, dynamic_projection = result
+        details = _subscription_cost_details(
+            subscription_id, await name_task, timeframe, granularity, sections,
+            actual_total, currency, by_rg, time_period, projected_eom_cost, yearly_breakdown, dynamic_projection, baseline
+        )
+        return details, {"detailed_entries": entries, "yearly_daily_breakdown": yearly_daily_breakdown}
+    except Exception as e:
+        error_message = _batch_error_message(subscription_id, e)
+        return _empty_subscription_cost_details(subscription_id, timeframe, granularity, error_message, await name_task), {}
+
+async def _fetch_scope_cost_details(
+    token: str,
+    scope: str,
+    subscription_ids: List[str],
+    timeframe: str,
+    granularity: str,
+    from_date: Optional[date],
+    to_date: Optional[date],
+    semaphore: asyncio.Semaphore,
+    sections: frozenset
+) -> List[Tuple[SubscriptionCostDetails, Dict[str, CostEntryTable]]]:
+    """
+    Batch mode "scope": the actual costs of all `subscription_ids` come from one query at a management group /
+    billing scope (query_scope_costs_by_subscription) instead of one query per subscription. yearly_forecast, when
+    requested, is projected locally per subscription from one scope-level daily history
+    (query_scope_forecast_histories). Only the "azure" forecast engine, or a failed history query, falls back to
+    one forecast query per subscription (the forecast API cannot group by subscription). Results are in the order
+    of `subscription_ids`.
+    """
+    if not subscription_ids:
+        return []
+    names_task = asyncio.gather(*[subscription_directory.display_name(token, subscription_id) for subscription_id in subscription_ids])
+    actual_sections = sections - {"yearly_forecast"}
+
+    async def fetch_actuals():
+        async with semaphore:
+            return await query_scope_costs_by_subscription(
+                access_token=token,
+                scope=scope,
+                subscription_ids=subscription_ids,
+                timeframe=timeframe,
+                granularity=granularity,
+                from_date=from_date,
+                to_date=to_date,
+                include=actual_sections
+            )
+
+    async def fetch_histories() -> Dict[str, List[Any]]:
+        if settings.COST_FORECAST_ENGINE.lower() not in ("local", "both"):
+            return {}
+
+        async def fetch():
+            async with semaphore:
+                return await query_scope_forecast_histories(
+                    access_token=token, scope=scope, subscription_ids=subscription_ids,
+                    timeframe=timeframe, from_date=from_date, to_date=to_date
+                )
+        try:
+            return await _retry_rate_limited(f"scope {scope}", fetch)
+        except Exception as e:
+            logger.warning(f"Could not fetch the forecast history at scope {scope}, fetching it per subscription: {e}")
+            return {}
+
+    async def fetch_forecast(subscription_id: str, history: Optional[List[Any]]):
+        async def fetch():
+            async with semaphore:
+                return await query_subscription_costs(
+                    access_token=token, subscription_id=subscription_id, timeframe=timeframe, granularity=granularity,
+                    from_date=from_date, to_date=to_date, include=frozenset({"yearly_forecast"}), forecast_history=history
+                )
+        try:
+            _, _, _, _, _, projected_eom_cost, yearly_breakdown, yearly_daily_breakdown, dynamic_projection = await _retry_rate_limited(f"subscription {subscription_id}", fetch)
+            return projected_eom_cost, yearly_breakdown, yearly_daily_breakdown, dynamic_projection
+        except Exception as e:
+            logger.warning(f"Could not fetch the yearly forecast of subscription {subscription_id}: {e}")
+            return None, [], CostEntryTable(), None
+
+    async def fetch_forecasts():
+        histories = await fetch_histories()
+        return await asyncio.gather(*[fetch_forecast(subscription_id, histories.get(subscription_id.lower())) for subscription_id in subscription_ids])
+
+    forecasts_task = asyncio.create_task(fetch_forecasts()) if "yearly_forecast" in sections else None
+    try:
+        if actual_sections:
+            actuals, time_period = await _retry_rate_limited(f"scope {scope}", fetch_actuals)
+        else:
+            actuals, time_period = {}, _determine_time_period(timeframe, from_date, to_date)
+    except Exception as e:
+        if forecasts_task is not None:
+            forecasts_task.cancel()
+        names = await names_task
+        return [
+            (_empty_subscription_cost_details(subscription_id, timeframe, granularity, _batch_error_message(subscription_id, e), name), {})
+            for subscription_id, name in zip(subscription_ids, names)
+        ]
+    forecasts = await forecasts_task if forecasts_task is not None else [(None, [], CostEntryTable(), None)] * len(subscription_ids)
+    names = await names_task
+
+    results = []
+    for subscription_id, name, (projected_eom_cost, yearly_breakdown, yearly_daily_breakdown, dynamic_projection) in zip(subscription_ids, names, forecasts):
+        actual_total, currency, by_rg, entries = actuals.get(subscription_id.lower(), (0.0, "USD", {}, CostEntryTable()))
+        details = _subscription_cost_details(
+            subscription_id, name, timeframe, granularity, sections,
+            actual_total, currency, by_rg, time_period, projected_eom_cost, yearly_breakdown, dynamic_projection
+        )
+        results.append((details, {"detailed_entries": entries, "yearly_daily_breakdown": yearly_daily_breakdown}))
+    return results
+
+_BatchResult = Tuple[SubscriptionCostDetails, Dict[str, CostEntryTable]]
+
+def _batch_cost_groups(
+    token: str,
+    subscription_ids: List[str],
+    timeframe: str,
+    granularity: str,
+    from_date: Optional[date],
+    to_date: Optional[date],
+    sections: frozenset,
+    mode: str,
+    scope: Optional[str],
+    tag_filters: Optional[List[Dict[str, Any]]],
+    include_baseline: bool
+) -> List[Tuple[List[int], Awaitable[List[_BatchResult]]]]:
+    """
+    Validates the options shared by batch-costs and its streaming variant and returns the batch's work as
+    (positions in `subscription_ids`, awaitable of their results) groups: one per subscription in mode
+    "subscriptions", a single group for the one scope query in mode "scope".
+    """
+    for tf in tag_filters or []:
+        if not isinstance(tf.get("name"), str) or not tf["name"] or str(tf.get("operator")).lower() not in ("in", "notin") or not isinstance(tf.get("values"), list):
+            raise HTTPException(status_code=400, detail=f'Invalid tag filter {tf}. Expected {{"name": ..., "operator": "In" or "NotIn", "values": [...]}}.')
+    if mode == "scope" and (tag_filters or include_baseline):
+        raise HTTPException(status_code=400, detail='tag_filters and include_baseline are only supported with mode "subscriptions".')
+    semaphore = _get_tenant_batch_semaphore(token)
+    if mode == "scope":
+        try:
+            aggregation_scope = resolve_aggregation_scope(scope or settings.BATCH_COSTS_AGGREGATION_SCOPE or "")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return [(list(range(len(subscription_ids))), _fetch_scope_cost_details(
+            token, aggregation_scope, subscription_ids, timeframe, granularity, from_date, to_date, semaphore, sections
+        ))]
+    if mode != "subscriptions":
+        raise HTTPException(status_code=400, detail=f"Unknown batch mode '{mode}'. Use \"subscriptions\" or \"scope\".")
+
+    async def fetch_one(subscription_id: str) -> List[_BatchResult]:
+        return [await _fetch_subscription_cost_details(
+            token, subscription_id, timeframe, granularity, from_date, to_date, semaphore, sections, tag_filters, include_baseline
+        )]
+
+    return [([index], fetch_one(subscription_id)) for index, subscription_id in enumerate(subscription_ids)]
+
 @router.post("/subscriptions/batch-costs", response_model=List[SubscriptionCostDetails])
 async def get_batch_subscription_costs(
     subscription_ids: List[str] = Body(..., description="List of subscription IDs to fetch costs for"),
@@ -36,100 +379,113 @@ async def get_batch_subscription_costs(
     from_date_str: Optional[str] = Body(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
     to_date_str: Optional[str] = Body(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
     granularity: str = Body("None", description="Granularity (Daily, Monthly, None for total)"),
-    token: str = Security(oauth2_scheme)
+    include: Optional[str] = Body(None, description=_INCLUDE_DESCRIPTION),
+    mode: str = Body("subscriptions", description='"subscriptions" (one query per subscription) or "scope" (one query at `scope` for all of them)'),
+    scope: Optional[str] = Body(None, description="Management group id or management group / billing account scope for mode \"scope\" (default: BATCH_COSTS_AGGREGATION_SCOPE)"),
+    tag_filters: Optional[List[Dict[str, Any]]] = Body(None, description='Tag filters, ANDed: [{"name": "env", "operator": "In" or "NotIn", "values": ["prod"]}] (mode "subscriptions")'),
+    include_baseline: bool = Body(False, description="Also return the unfiltered baseline_* totals of the same window (mode \"subscriptions\")"),
+    token: str = Security(verified_token)
 ):
     """
     Fetch cost data for multiple subscriptions in a single batch request.
-    Implements exponential backoff for handling 429 Too Many Requests errors from Azure API.
+    Subscriptions are fetched concurrently, bounded per tenant by BATCH_COSTS_MAX_CONCURRENCY_PER_TENANT,
+    with async exponential backoff on 429 Too Many Requests errors from the Azure API.
+    With mode "scope", their actual costs come from a single query at a management group or billing scope,
+    grouped by subscription (see _fetch_scope_cost_details).
+    With tag_filters and include_baseline, each subscription carries both its filtered costs and the unfiltered
+    baseline; filters on a single tag key are answered by one query grouped by that key.
+    Results are returned in the order of `subscription_ids`; failed subscriptions carry an `error` message.
     """
-    results = []
-    max_retries = 3  # Maximum number of retries for 429 errors
-    base_delay = 1    # Base delay in seconds for exponential backoff
+    parsed_from_date, parsed_to_date = _parse_batch_dates(from_date_str, to_date_str)
+    groups = _batch_cost_groups(
+        token, subscription_ids, timeframe, granularity, parsed_from_date, parsed_to_date, _parse_include(include),
+        mode, scope, tag_filters, include_baseline
+    )
+    results: List[Optional[_BatchResult]] = [None] * len(subscription_ids)
+    for (indices, _), group_results in zip(groups, await asyncio.gather(*[work for _, work in groups])):
+        for index, result in zip(indices, group_results):
+            results[index] = result
+    content = "[" + ",".join(render_model_json(details, entry_tables) for details, entry_tables in results) + "]"
+    return Response(content=content, media_type="application/json")
 
-    for subscription_id in subscription_ids:
-        attempt = 0
-        while attempt < max_retries:
-            try:
-                # Fetch cost data for each subscription
-                actual_total, currency, by_rg, entries, time_period, projected_eom_cost, yearly_breakdown, yearly_daily_breakdown = await query_subscription_costs(
-                    access_token=token,
-                    subscription_id=subscription_id,
-                    timeframe=timeframe,
-                    granularity=granularity,
-                    from_date=date.fromisoformat(from_date_str) if from_date_str else None,
-                    to_date=date.fromisoformat(to_date_str) if to_date_str else None
-                )
-                results.append(SubscriptionCostDetails(
-                    subscription_id=subscription_id,
-                    subscription_name=subscription_id,  # Replace with actual name if available
-                    total_cost=actual_total if actual_total is not None else 0.0,
-                    currency=currency if currency else "USD",
-                    costs_by_resource_group=by_rg if by_rg else {},
-                    detailed_entries=[CostEntry.model_validate(e) for e in entries] if entries else [],
-                    timeframe_used=timeframe,
-                    from_date_used=time_period.from_property.date().isoformat() if time_period.from_property else None,
-                    to_date_used=time_period.to.date().isoformat() if time_period.to else None,
-                    granularity_used=granularity,
-                    projected_cost_current_month=projected_eom_cost if projected_eom_cost is not None else 0.0,
-                    yearly_monthly_breakdown=yearly_breakdown if yearly_breakdown else [],
-                    yearly_daily_breakdown=yearly_daily_breakdown if yearly_daily_breakdown else []
-                ))
-                break  # Success, move to next subscription
-            except Exception as e:
-                attempt += 1
-                if "429" in str(e) or "Too many requests" in str(e).lower():
-                    retry_after = 0
-                    # Extract retry-after from exception if available (depends on how azure_client.py handles it)
-                    # For simplicity, we'll use exponential backoff with jitter
-                    delay = base_delay * (2 ** (attempt - 1)) + random.uniform(0, 0.1 * base_delay)
-                    logger.warning(f"429 error for subscription {subscription_id}. Retrying after {delay:.2f} seconds (attempt {attempt}/{max_retries})")
-                    time.sleep(delay)
-                    if attempt == max_retries:
-                        logger.error(f"Max retries reached for subscription {subscription_id}. Returning default response.")
-                        results.append(SubscriptionCostDetails(
-                            subscription_id=subscription_id,
-                            subscription_name=subscription_id,
-                            total_cost=0.0,
-                            currency="USD",
-                            costs_by_resource_group={},
-                            detailed_entries=[],
-                            timeframe_used=timeframe,
-                            from_date_used=None,
-                            to_date_used=None,
-                            granularity_used=granularity,
-                            projected_cost_current_month=0.0,
-                            yearly_monthly_breakdown=[],
-                            yearly_daily_breakdown=[]
-                        ))
-                else:
-                    logger.warning(f"Failed to fetch cost data for subscription {subscription_id}: {e}")
-                    results.append(SubscriptionCostDetails(
-                        subscription_id=subscription_id,
-                        subscription_name=subscription_id,
-                        total_cost=0.0,
-                        currency="USD",
-                        costs_by_resource_group={},
-                        detailed_entries=[],
-                        timeframe_used=timeframe,
-                        from_date_used=None,
-                        to_date_used=None,
-                        granularity_used=granularity,
-                        projected_cost_current_month=0.0,
-                        yearly_monthly_breakdown=[],
-                        yearly_daily_breakdown=[]
-                    ))
-                    break  # Non-429 error, don't retry
-    return results
+@router.post("/subscriptions/batch-costs/stream")
+async def stream_batch_subscription_costs(
+    subscription_ids: List[str] = Body(..., description="List of subscription IDs to fetch costs for"),
+    timeframe: str = Body("MonthToDate", description="Timeframe (MonthToDate, TheLast7Days, Custom)"),
+    from_date_str: Optional[str] = Body(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
+    to_date_str: Optional[str] = Body(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
+    granularity: str = Body("None", description="Granularity (Daily, Monthly, None for total)"),
+    include: Optional[str] = Body(None, description=_INCLUDE_DESCRIPTION),
+    mode: str = Body("subscriptions", description='"subscriptions" (one query per subscription) or "scope" (one query at `scope` for all of them)'),
+    scope: Optional[str] = Body(None, description="Management group id or management group / billing account scope for mode \"scope\" (default: BATCH_COSTS_AGGREGATION_SCOPE)"),
+    tag_filters: Optional[List[Dict[str, Any]]] = Body(None, description='Tag filters, ANDed: [{"name": "env", "operator": "In" or "NotIn", "values": ["prod"]}] (mode "subscriptions")'),
+    include_baseline: bool = Body(False, description="Also return the unfiltered baseline_* totals of the same window (mode \"subscriptions\")"),
+    token: str = Security(verified_token)
+):
+    """
+    Streaming variant of /subscriptions/batch-costs, with the same parameters. Returns NDJSON (one JSON object
+    per line), emitting each subscription as soon as it completes (in mode "scope", all of them once the scope
+    query is done):
+    - `{"type": "result", "index": i, "data": SubscriptionCostDetails}` for a successful subscription
+    - `{"type": "error", "index": i, "subscription_id": ..., "error": ..., "data": SubscriptionCostDetails}` for a failed one
+    - `{"type": "progress", "completed": n, "total": N}` after every subscription (and once up front)
+    `index` is the position in `subscription_ids`, so clients can restore the request order.
+    """
+    parsed_from_date, parsed_to_date = _parse_batch_dates(from_date_str, to_date_str)
+    groups = _batch_cost_groups(
+        token, subscription_ids, timeframe, granularity, parsed_from_date, parsed_to_date, _parse_include(include),
+        mode, scope, tag_filters, include_baseline
+    )
+
+    async def fetch_indexed(indices: List[int], work: Awaitable[List[_BatchResult]]):
+        return indices, await work
+
+    async def frames():
+        total = len(subscription_ids)
+        tasks = [asyncio.create_task(fetch_indexed(indices, work)) for indices, work in groups]
+        try:
+            yield _ndjson_frame({"type": "progress", "completed": 0, "total": total})
+            completed = 0
+            for next_done in asyncio.as_completed(tasks):
+                indices, group_results = await next_done
+                for index, (details, entry_tables) in zip(indices, group_results):
+                    data_json = render_model_json(details, entry_tables)
+                    if details.error:
+                        yield _ndjson_frame({"type": "error", "index": index, "subscription_id": details.subscription_id, "error": details.error}, data_json)
+                    else:
+                        yield _ndjson_frame({"type": "result", "index": index}, data_json)
+                    completed += 1
+                    yield _ndjson_frame({"type": "progress", "completed": completed, "total": total})
+        finally:
+            # Client went away (or we finished): don't leave upstream queries running for nobody.
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(frames(), media_type="application/x-ndjson")
+
+def _parse_batch_dates(from_date_str: Optional[str], to_date_str: Optional[str]) -> Tuple[Optional[date], Optional[date]]:
+    try:
+        parsed_from_date = date.fromisoformat(from_date_str) if from_date_str and from_date_str.lower() != "null" else None
+        parsed_to_date = date.fromisoformat(to_date_str) if to_date_str and to_date_str.lower() != "null" else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date format: {from_date_str} / {to_date_str}. Expected YYYY-MM-DD.")
+    return parsed_from_date, parsed_to_date
+
+def _ndjson_frame(frame: Dict[str, Any], data_json: Optional[str] = None) -> str:
+    """One NDJSON line; `data_json` (already serialized) is added as the frame's "data" member."""
+    if data_json is None:
+        return json.dumps(frame) + "\n"
+    return json.dumps(frame)[:-1] + ',"data":' + data_json + "}\n"
 
 @router.get("/subscriptions", response_model=List[AzureSubscription])
-async def get_subscriptions_list(token: str = Security(oauth2_scheme)):
+async def get_subscriptions_list(token: str = Security(verified_token)):
     """Lists all Azure subscriptions accessible to the application."""
     # The 'token' is the user's bearer token.
     # The CustomStaticBearerTokenCredential in azure_client.py will use this token.
-    # For now, we are not passing token_expires_on, so the custom credential will use its default.
-    # TODO: Consider passing token_expires_on from frontend if more precise expiry handling is needed.
+    # The list comes from the caller's cached subscription directory; only the first call (or one after
+    # SUBSCRIPTION_DIRECTORY_TTL_SECONDS) walks subscriptions.list(), later ones refresh in the background.
     try:
-        subscriptions = await list_accessible_subscriptions(access_token=token)
+        subscriptions = await subscription_directory.list_subscriptions(token)
         if not subscriptions:
             # This is not an error, just no subscriptions found or accessible
             logger.info("No subscriptions found or accessible by the service principal.")
@@ -150,11 +506,13 @@ async def get_subscription_costs_summary(
     from_date_str: Optional[str] = Query(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
     to_date_str: Optional[str] = Query(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
     granularity: str = Query("None", description="Granularity (Daily, Monthly, None for total)"),
-    token: str = Security(oauth2_scheme)
+    include: Optional[str] = Query(None, description=_INCLUDE_DESCRIPTION),
+    token: str = Security(verified_token)
 ):
     """
     Get overall spending for a specific subscription, with adjustable time frames
     and granularity. Returns data including breakdown by resource group.
+    Use `include` (e.g. `include=totals,resource_groups`) to fetch only the sections you need.
     Supports filtering by tags passed as query parameters, e.g.:
     - `tag_Environment=Production`
     - `tag_CostCenter_ne=123` (for not equals)
@@ -200,37 +558,41 @@ async def get_subscription_costs_summary(
             raise HTTPException(status_code=400, detail="from_date and to_date are required for Custom timeframe.")
         if parsed_from_date > parsed_to_date:
             raise HTTPException(status_code=400, detail="from_date cannot be after to_date.")
+    sections = _parse_include(include)
 
+    name_task = asyncio.create_task(subscription_directory.display_name(token, subscription_id))
     try:
-        actual_total, currency, by_rg, entries, time_period, projected_eom_cost, yearly_breakdown, yearly_daily_breakdown = await query_subscription_costs(
+        actual_total, currency, by_rg, entries, time_period, projected_eom_cost, yearly_breakdown, yearly_daily_breakdown, dynamic_projection = await query_subscription_costs(
             access_token=token,
             subscription_id=subscription_id,
             timeframe=timeframe,
             granularity=granularity,
             from_date=parsed_from_date,
             to_date=parsed_to_date,
-            tag_filters=tag_filters # Pass parsed tag filters
+            tag_filters=tag_filters, # Pass parsed tag filters
+            include=sections
         )
 
-        # Find subscription display name (optional, could be done on frontend)
-        # For now, just use ID. Could fetch all subs once and cache.
-        sub_name = subscription_id
+        # Display name from the caller's cached subscription directory (resolved while the costs were queried)
+        sub_name = await name_task
 
-        return SubscriptionCostDetails(
+        details = SubscriptionCostDetails(
             subscription_id=subscription_id,
             subscription_name=sub_name,
             total_cost=actual_total,
             currency=currency,
             costs_by_resource_group=by_rg,
-            detailed_entries=[CostEntry.model_validate(e) for e in entries], # Validate against Pydantic model
             timeframe_used=timeframe, # Use the direct timeframe parameter
             from_date_used=time_period.from_property.date().isoformat() if time_period.from_property else None,
             to_date_used=time_period.to.date().isoformat() if time_period.to else None,
             granularity_used=granularity, # Use the direct granularity parameter
             projected_cost_current_month=projected_eom_cost,
             yearly_monthly_breakdown=yearly_breakdown,
-            yearly_daily_breakdown=yearly_daily_breakdown
+            **(dynamic_projection or {})
         )
+        # Entry lists are serialized straight from their CostEntryTables instead of one CostEntry model per row.
+        content = render_model_json(details, {"detailed_entries": entries, "yearly_daily_breakdown": yearly_daily_breakdown})
+        return Response(content=content, media_type="application/json")
     except HTTPException:
         raise
     except Exception as e:
@@ -246,7 +608,8 @@ async def get_single_resource_group_costs(
     from_date_str: Optional[str] = Query(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
     to_date_str: Optional[str] = Query(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
     granularity: str = Query("None", description="Granularity (Daily, Monthly, None for total)"),
-    token: str = Security(oauth2_scheme)
+    include: Optional[str] = Query(None, description=_INCLUDE_DESCRIPTION),
+    token: str = Security(verified_token)
 ):
     """Get spending for a specific resource group within a subscription."""
     # Manually parse date strings, handling "null"
@@ -258,6 +621,7 @@ async def get_single_resource_group_costs(
     if to_date_str and to_date_str.lower() != "null":
         try: parsed_to_date_rg = date.fromisoformat(to_date_str)
         except ValueError: raise HTTPException(status_code=400, detail=f"Invalid to_date format: {to_date_str}. Expected YYYY-MM-DD.")
+    sections = _parse_include(include)
     try:
         logger.info(f"Fetching costs for RG: {resource_group_name} in sub: {subscription_id}, timeframe: {timeframe}, granularity: {granularity}")
         total, currency, entries, time_period = await query_resource_group_costs(
@@ -267,39 +631,49 @@ async def get_single_resource_group_costs(
             timeframe=timeframe,
             granularity=granularity,
             from_date=parsed_from_date_rg, 
-            to_date=parsed_to_date_rg 
+            to_date=parsed_to_date_rg,
+            include=sections
         )
-        return ResourceGroupCostDetails(
+        details = ResourceGroupCostDetails(
             subscription_id=subscription_id,
             resource_group_name=resource_group_name,
             total_cost=total,
             currency=currency,
-            detailed_entries=[CostEntry.model_validate(e) for e in entries],
             timeframe_used=timeframe, # Use the direct timeframe parameter
             from_date_used=time_period.from_property.date().isoformat() if time_period.from_property else None,
             to_date_used=time_period.to.date().isoformat() if time_period.to else None,
             granularity_used=granularity # Use the direct granularity parameter
         )
+        return Response(content=render_model_json(details, {"detailed_entries": entries}), media_type="application/json")
     except HTTPException:
         raise
     except Exception as e:
         logger.warning(f"API Error fetching RG costs for {resource_group_name} in {subscription_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
-@router.post("/subscriptions/{subscription_id}/costs/generate-report", response_model=ReportCreationResponse)
+def _download_url(request: Request, file_name: str) -> str:
+    # Note: This assumes the /download-report/{file_name} route is correctly set up
+    # and that the API is accessible at request.base_url.
+    # Only handed to the report's owner; the signature is what authorizes the (header-less) download.
+    expires_at = int(time.time()) + settings.REPORT_DOWNLOAD_URL_TTL_SECONDS
+    signature = sign_report_download(file_name, expires_at)
+    return f"{request.base_url}api/v1/cost/download-report/{file_name}?expires={expires_at}&signature={signature}"
+
+@router.post("/subscriptions/{subscription_id}/costs/generate-report", response_model=ReportCreationResponse, status_code=202)
 async def create_cost_report_for_subscription(
     subscription_id: str,
-    request: Request, # To construct download URL
+    request: Request, # To construct status / download URLs
     timeframe: str = Body("MonthToDate", description="Timeframe (MonthToDate, TheLast7Days, Custom)"),
     from_date_str: Optional[str] = Body(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
     to_date_str: Optional[str] = Body(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
     granularity: str = Body("None", description="Granularity (Daily, Monthly, None for total)"),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
-    file_format: str = Query("csv", enum=["csv", "excel"]),
-    token: str = Security(oauth2_scheme)):
+    file_format: str = Query("csv", enum=["csv", "excel", "parquet", "arrow"]),
+    compress: bool = Query(False, description="gzip the CSV report (.csv.gz)"),
+    token: str = Security(verified_token)):
     """
-    Generates a cost report file (CSV or Excel) for a subscription and returns a download link.
-    The actual file generation is done via query_subscription_costs then generate_cost_report_file.
+    Queues a cost report (CSV, Excel, Parquet or Arrow IPC) for a subscription and returns its job id right away (202).
+    A report worker fetches the data via query_subscription_costs and renders it with generate_cost_report_file;
+    poll GET /reports/{job_id} for progress, its download_url is set once the file is ready.
     """
     try:
         # Manually parse date strings from body, handling "null"
@@ -346,79 +720,238 @@ async def create_cost_report_for_subscription(
             if parsed_from_date > parsed_to_date:
                 raise HTTPException(status_code=400, detail="from_date cannot be after to_date.")
 
+        if file_format in ("parquet", "arrow") and not arrow_available():
+            raise HTTPException(status_code=400, detail=f"The {file_format} report format is not available on this server (pyarrow is not installed).")
+
         logger.info(f"Request to generate {file_format} report for sub: {subscription_id}, timeframe: {timeframe}, granularity: {granularity}")
-        # 1. Fetch the data (similar to get_subscription_costs_summary)
-        _, _, _, entries, _, _, _ = await query_subscription_costs( # Adjusted for new return values
-            access_token=token,
-            subscription_id=subscription_id,
-            timeframe=timeframe,
-            granularity=granularity, # Use specified granularity for the report
-            from_date=parsed_from_date,
-            to_date=parsed_to_date,
-            tag_filters=tag_filters # Apply tag filters to data fetching for report
+        identity_hash = _caller_identity(token)
+        description = f"{file_format} report for {subscription_id} ({timeframe}, {granularity})"
+        report_key = build_report_key(
+            identity_hash, subscription_id, timeframe, granularity, parsed_from_date, parsed_to_date, tag_filters, file_format, compress
         )
 
-        if not entries:
-            raise HTTPException(status_code=404, detail="No cost data found for the selected criteria to generate a report.")
-
-        # 2. Generate file (can be run in background if very large)
-        # For now, direct call. For very large reports, background_tasks.add_task is good.
-        file_path = await generate_cost_report_file(
-            subscription_id=subscription_id,
-            cost_data_entries=entries,
-            timeframe_str=timeframe,
-            granularity_str=granularity,
-            file_format=file_format
+        # An identical report of this caller that is still fresh is served as is.
+        existing_path = await asyncio.to_thread(
+            report_store.lookup, report_key, report_ttl_for_query(timeframe, parsed_from_date, parsed_to_date)
         )
-        file_name = os.path.basename(file_path)
+        if existing_path is not None:
+            job = report_job_queue.add_completed(identity_hash, description, existing_path)
+            file_name = os.path.basename(existing_path)
+            return ReportCreationResponse(
+                message=f"{file_format.upper()} report is ready (reused).",
+                file_name=file_name,
+                download_url=_download_url(request, file_name),
+                job_id=job.job_id,
+                status_url=f"{request.base_url}api/v1/cost/reports/{job.job_id}"
+            )
 
-        # Construct download URL
-        # Note: This assumes the /download-report/{file_name} route is correctly set up
-        # and that the API is accessible at request.base_url
-        download_url = f"{request.base_url}api/v1/cost/download-report/{file_name}"
+        async def build_report(job: ReportJob) -> str:
+            # 1. Fetch the data. Only the detailed entries go into the report, so the yearly forecast query is skipped.
+            job.set_progress(10, "Fetching cost data")
+            _, _, _, entries, _, _, _, _, _ = await query_subscription_costs(
+                access_token=token,
+                subscription_id=subscription_id,
+                timeframe=timeframe,
+                granularity=granularity, # Use specified granularity for the report
+                from_date=parsed_from_date,
+                to_date=parsed_to_date,
+                tag_filters=tag_filters, # Apply tag filters to data fetching for report
+                include=["detailed_entries"]
+            )
+            if not entries:
+                raise ValueError("No cost data found for the selected criteria to generate a report.")
+
+            # 2. Render the file
+            job.set_progress(60, f"Writing {len(entries)} rows")
+            file_path = await generate_cost_report_file(
+                subscription_id=subscription_id,
+                cost_data_entries=entries,
+                timeframe_str=timeframe,
+                granularity_str=granularity,
+                file_format=file_format,
+                compress=compress,
+                report_key=report_key
+            )
+            report_store.store(report_key, file_path)
+            return file_path
+
+        try:
+            job = report_job_queue.submit(identity_hash, description, build_report, key=report_key)
+        except ReportJobQueueFull as e:
+            raise HTTPException(status_code=503, detail=f"Too many reports are being generated, please retry shortly. {e}")
 
         return ReportCreationResponse(
-            message=f"{file_format.upper()} report generated successfully.",
-            file_name=file_name,
-            download_url=download_url
+            message=f"{file_format.upper()} report queued.",
+            job_id=job.job_id,
+            status_url=f"{request.base_url}api/v1/cost/reports/{job.job_id}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning(f"API Error queuing report for {subscription_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An error occurred while queuing the report: {str(e)}")
+
+@router.get("/reports/{job_id}", response_model=ReportJobStatus)
+async def get_report_job_status(job_id: str, request: Request, token: str = Security(verified_token)):
+    """
+    Status and progress of a report job submitted by the caller. Once it is completed, download_url points
+    to the download-report route for the file.
+    """
+    job = await asyncio.to_thread(report_job_queue.get, job_id, _caller_identity(token))
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report job not found or expired.")
+    file_name = os.path.basename(job.file_path) if job.file_path else None
+    return ReportJobStatus(
+        job_id=job.job_id,
+        status=job.status,
+        progress=job.progress,
+        stage=job.stage,
+        queue_position=await asyncio.to_thread(report_job_queue.queue_position, job),
+        created_at=datetime.fromtimestamp(job.created_at, tz=timezone.utc),
+        started_at=datetime.fromtimestamp(job.started_at, tz=timezone.utc) if job.started_at else None,
+        finished_at=datetime.fromtimestamp(job.finished_at, tz=timezone.utc) if job.finished_at else None,
+        file_name=file_name,
+        download_url=_download_url(request, file_name) if job.status == "completed" and file_name else None,
+        error=job.error
+    )
+
+def _parse_tag_filters(request: Request) -> List[Dict[str, Any]]:
+    """Tag filters from `tag_<name>=<value>` (In) and `tag_<name>_ne=<value>` (NotIn) query parameters."""
+    tag_filters: List[Dict[str, Any]] = []
+    for key, value in request.query_params.items():
+        if key.startswith("tag_") and len(key) > 4:
+            tag_key_full = key[4:]
+            if tag_key_full.endswith("_ne"):
+                tag_filters.append({"name": tag_key_full[:-3], "operator": "NotIn", "values": [value]})
+            else:
+                tag_filters.append({"name": tag_key_full, "operator": "In", "values": [value]})
+    return tag_filters
+
+@router.get("/subscriptions/{subscription_id}/costs/export")
+async def export_subscription_cost_entries(
+    subscription_id: str,
+    request: Request, # To access query_params for tags
+    timeframe: str = Query("MonthToDate", description="Timeframe (MonthToDate, TheLast7Days, Custom)"),
+    from_date_str: Optional[str] = Query(None, alias="from_date", description="Start date for Custom timeframe (YYYY-MM-DD)"),
+    to_date_str: Optional[str] = Query(None, alias="to_date", description="End date for Custom timeframe (YYYY-MM-DD)"),
+    granularity: str = Query("Daily", description="Granularity (Daily, Monthly, None for total)"),
+    compress: bool = Query(False, description="gzip the CSV stream"),
+    token: str = Security(verified_token)
+):
+    """
+    Streams the subscription's detailed cost entries as CSV (optionally gzip-compressed) without writing a report
+    file: rows are rendered chunk by chunk as the response is sent. Tag filters work as on the costs summary.
+    """
+    parsed_from_date, parsed_to_date = _parse_batch_dates(from_date_str, to_date_str)
+    if timeframe.lower() == "custom":
+        if not parsed_from_date or not parsed_to_date:
+            raise HTTPException(status_code=400, detail="from_date and to_date are required for Custom timeframe.")
+        if parsed_from_date > parsed_to_date:
+            raise HTTPException(status_code=400, detail="from_date cannot be after to_date.")
+    try:
+        _, _, _, entries, _, _, _, _, _ = await query_subscription_costs(
+            access_token=token,
+            subscription_id=subscription_id,
+            timeframe=timeframe,
+            granularity=granularity,
+            from_date=parsed_from_date,
+            to_date=parsed_to_date,
+            tag_filters=_parse_tag_filters(request),
+            include=["detailed_entries"]
         )
     except HTTPException:
         raise
-    except IOError as e: # Catch file generation errors
-        logger.warning(f"File I/O error generating report for {subscription_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"Failed to generate report file: {str(e)}")
     except Exception as e:
-        logger.warning(f"API Error generating report for {subscription_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"An error occurred while generating the report: {str(e)}")
+        logger.warning(f"API Error exporting cost entries for {subscription_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    file_name = f"cost_entries_{subscription_id.replace('-', '')}_{timeframe.lower()}_{granularity.lower()}.csv"
+    chunks = iter_entries_csv(entries)
+    if compress:
+        return StreamingResponse(
+            gzip_chunks(chunks), media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{file_name}.gz"'}
+        )
+    return StreamingResponse(chunks, media_type="text/csv", headers={"Content-Disposition": f'attachment; filename="{file_name}"'})
 
 @router.get("/subscriptions/{subscription_id}/available-tags", response_model=List[TagDetailsResponse])
 async def get_available_tags(
     subscription_id: str,
-    token: str = Security(oauth2_scheme)
+    response: Response,
+    search: Optional[str] = Query(None, description="Case-insensitive tag name prefix"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Max tags to return (all when omitted)"),
+    values_limit: Optional[int] = Query(None, ge=0, description="Max values per tag, most used first (all when omitted)"),
+    token: str = Security(verified_token)
 ):
     """
     Retrieves a list of tag names and their values available within the specified subscription.
+    Served from the caller's cached tag catalog; X-Total-Count holds the number of tags matching `search`.
     """
     try:
-        logger.info(f"Fetching available tags for subscription: {subscription_id}")
-        tags = await list_available_tags_for_subscription(access_token=token, subscription_id=subscription_id)
-        logger.info(f"Successfully fetched {len(tags)} tag details for subscription: {subscription_id}")
-        return tags
+        catalog = await tag_catalog_cache.get(token, subscription_id)
+        matches = catalog.search_tags(search)
+        page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        response.headers["X-Total-Count"] = str(len(matches))
+        return [
+            TagDetailsResponse(
+                tagName=tag.tag_name,
+                values=tag.values[:values_limit] if values_limit is not None else tag.values,
+                count=tag.count,
+                valueCount=len(tag.values),
+            )
+            for tag in page
+        ]
     except HTTPException:
         raise
     except Exception as e:
         logger.warning(f"API Error fetching available tags for {subscription_id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"An error occurred while fetching available tags: {str(e)}")
 
+@router.get("/subscriptions/{subscription_id}/available-tags/{tag_name}/values", response_model=List[TagValueDetails])
+async def get_available_tag_values(
+    subscription_id: str,
+    tag_name: str,
+    response: Response,
+    search: Optional[str] = Query(None, description="Case-insensitive tag value prefix"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    token: str = Security(verified_token)
+):
+    """
+    Values of one tag with their resource counts, most used first, for incremental lookup in the filter UI.
+    X-Total-Count holds the number of values matching `search`.
+    """
+    try:
+        tag = (await tag_catalog_cache.get(token, subscription_id)).get(tag_name)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.warning(f"API Error fetching values of tag {tag_name} for {subscription_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"An error occurred while fetching tag values: {str(e)}")
+    if tag is None:
+        raise HTTPException(status_code=404, detail=f"Tag '{tag_name}' not found in subscription {subscription_id}.")
+    ranks = tag.search_values(search)
+    response.headers["X-Total-Count"] = str(len(ranks))
+    return [TagValueDetails(tagValue=tag.values[rank], count=tag.value_counts[rank]) for rank in ranks[offset:offset + limit]]
+
 @router.get("/download-report/{file_name}")
-async def download_generated_report(file_name: str):
+async def download_generated_report(
+    file_name: str,
+    expires: Optional[int] = Query(None, description="Expiry of the download link (epoch seconds)"),
+    signature: Optional[str] = Query(None, description="Signature of the download link")
+):
     """
-    Allows downloading a previously generated report file.
+    Allows downloading a previously generated report file through the signed download_url that generate-report
+    and GET /reports/{job_id} return to the report's owner (the link is opened without a bearer token).
     Ensure file_name is sanitized or validated to prevent directory traversal.
     """
     # Basic sanitization: ensure filename doesn't try to access parent directories
-    if ".." in file_name or file_name.startswith("/"):
+    # Hidden files (the report job database, the signing key) are never served.
+    if ".." in file_name or file_name.startswith(("/", ".")):
         raise HTTPException(status_code=400, detail="Invalid file name.")
+    if expires is None or signature is None or not verify_report_download(file_name, expires, signature):
+        raise HTTPException(status_code=403, detail="Invalid or expired download link. Request the report status again for a new one.")
 
     file_path = os.path.join(GENERATED_REPORTS_DIR, file_name)
     logger.info(f"Attempting to serve file: {file_path}")
@@ -431,7 +964,74 @@ async def download_generated_report(file_name: str):
     media_type = "application/octet-stream" # Default
     if file_name.lower().endswith(".csv"):
         media_type = "text/csv"
+    elif file_name.lower().endswith(".csv.gz"):
+        media_type = "application/gzip"
+    elif file_name.lower().endswith(".parquet"):
+        media_type = "application/vnd.apache.parquet"
+    elif file_name.lower().endswith(".arrow"):
+        media_type = "application/vnd.apache.arrow.file"
     elif file_name.lower().endswith(".xlsx"):
         media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
 
-    return FileResponse(path=file_path, filename=file_name, media_type=media_type)
\ No newline at end of file
+    return FileResponse(path=file_path, filename=file_name, media_type=media_type)
+
+@router.get("/metrics/azure-scheduler")
+async def get_azure_scheduler_metrics(token: str = Security(verified_token)):
+    """
+    Queue depth, wait-time and throttling metrics of the shared Azure request scheduler. Overall counters are
+    aggregates; the per-tenant and per-scope sections only cover the caller's (verified) tenant.
+    """
+    return azure_request_scheduler.metrics(tenant_id=get_token_tenant_id(token))
+
+@router.get("/metrics/azure-clients")
+async def get_azure_client_pool_metrics(token: str = Security(verified_token)):
+    """Pooled SDK clients and their reuse counters."""
+    return azure_client_pool.stats()
+
+@router.get("/metrics/token-verifier")
+async def get_token_verifier_metrics(token: str = Security(verified_token)):
+    """Bearer tokens currently verified with Azure, plus the cached scope permissions used for request coalescing."""
+    return {**token_verifier.stats(), "scope_permissions": scope_permissions.stats()}
+
+@router.get("/metrics/subscription-directory")
+async def get_subscription_directory_metrics(token: str = Security(verified_token)):
+    """Cached subscription directories and their hit / refresh counters."""
+    return subscription_directory.stats()
+
+@router.get("/metrics/tag-catalog")
+async def get_tag_catalog_metrics(token: str = Security(verified_token)):
+    """Cached tag catalogs and their hit / miss counters."""
+    return tag_catalog_cache.stats()
+
+@router.get("/metrics/cost-cache")
+async def get_cost_cache_metrics(token: str = Security(verified_token)):
+    """Size and hit/miss counters of the cost result cache, plus request coalescing and query planner counters."""
+    return {**cost_result_cache.stats(), "single_flight": dict(single_flight_stats), "query_planner": dict(query_planner_stats)}
+
+@router.get("/metrics/cost-forecast")
+async def get_cost_forecast_metrics(token: str = Security(verified_token)):
+    """Forecast engine and method, local / Azure forecast counters and the mean deviation of the cross-checks."""
+    cross_checks = forecast_stats["cross_checks"]
+    return {
+        "engine": settings.COST_FORECAST_ENGINE,
+        "method": settings.COST_FORECAST_METHOD,
+        **forecast_stats,
+        "cross_check_mean_abs_deviation_pct": forecast_stats["cross_check_abs_deviation_pct_sum"] / cross_checks if cross_checks else None,
+    }
+
+@router.get("/metrics/cost-warehouse")
+async def get_cost_warehouse_metrics(token: str = Security(verified_token)):
+    """Size, ingestion state and local-query counters of the cost warehouse."""
+    if cost_warehouse is None or not cost_warehouse.is_open:
+        return {"enabled": False}
+    return {"enabled": True, **await asyncio.to_thread(cost_warehouse.stats)}
+
+@router.get("/metrics/report-jobs")
+async def get_report_job_metrics(token: str = Security(verified_token)):
+    """Worker, queue and outcome counters of the report job queue."""
+    return report_job_queue.stats()
+
+@router.get("/metrics/report-store")
+async def get_report_store_metrics(token: str = Security(verified_token)):
+    """Bytes stored, reuse rate and eviction counters of the generated report store."""
+    return await asyncio.to_thread(report_store.stats)
@@ -0,0 +1,259 @@
+import logging
+from datetime import datetime, timezone, date as DateObject
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.core.cost_entries import CostEntryTable
+
+logger = logging.getLogger(__name__)
+
+RG_PREFIX_FILTER = "caz-"
+DATE_COLUMN_NAMES_PRIORITY = ["usagedate", "billingmonth"]
+
+
+def parse_usage_date(date_val: Any) -> Tuple[Optional[datetime], Optional[str]]:
+    """
+    Parses one UsageDate/BillingMonth cell (YYYYMMDD int, YYYYMMDD string or ISO string).
+    Returns (datetime, "YYYY-MM-DD") or (None, None) when the value cannot be parsed.
+    """
+    try:
+        if isinstance(date_val, int):
+            parsed = datetime.strptime(str(date_val), "%Y%m%d")
+            return parsed, parsed.strftime("%Y-%m-%d")
+        if isinstance(date_val, str):
+            date_str_to_parse = date_val.split("T")[0]
+            if len(date_str_to_parse) == 10 and date_str_to_parse.count('-') == 2:
+                return datetime.strptime(date_str_to_parse, "%Y-%m-%d"), date_str_to_parse
+            if len(date_str_to_parse) == 8 and date_str_to_parse.isdigit():
+                parsed = datetime.strptime(date_str_to_parse, "%Y%m%d")
+                return parsed, parsed.strftime("%Y-%m-%d")
+            parsed = datetime.fromisoformat(date_val.replace("Z", "+00:00").split("T")[0])
+            return parsed, parsed.strftime("%Y-%m-%d")
+    except ValueError:
+        logger.debug(f"Could not parse date string {date_val} into YYYY-MM-DD format.")
+    return None, None
+
+
+def _factorize(values: Sequence[Any]) -> Tuple[np.ndarray, List[Any]]:
+    """Returns (codes, uniques) in order of first appearance; None gets code -1."""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=True)
+    return codes, list(uniques)
+
+
+def _take(labels: List[Any], codes: np.ndarray, na_label: Any) -> np.ndarray:
+    """Maps factorized codes back to per-row labels, using `na_label` for code -1."""
+    lookup = np.empty(len(labels) + 1, dtype=object)
+    lookup[:len(labels)] = labels
+    lookup[len(labels)] = na_label
+    return lookup[codes]
+
+
+def _with_na_value(codes: np.ndarray, labels: List[Any], na_label: Any) -> Tuple[np.ndarray, List[Any]]:
+    """Turns factorized (codes, labels) with -1 for missing into codes/values where missing maps to `na_label`."""
+    return np.where(codes >= 0, codes, len(labels)), list(labels) + [na_label]
+
+
+def _round_amounts(costs: np.ndarray) -> List[float]:
+    """
+    round(cost, 2) for every cost, identical to Python's round(). np.round is used for the bulk; values whose
+    scaled fraction sits near .5 (where np.round's scale-and-rint can disagree with Python's exact rounding)
+    are recomputed with round().
+    """
+    rounded = np.round(costs, 2)
+    scaled = np.abs(costs * 100.0)
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    result = rounded.tolist()
+    for idx in np.flatnonzero(near_half).tolist():
+        result[idx] = round(float(costs[idx]), 2)
+    return result
+
+
+def _costs_as_float(cost_values: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Converts the cost column to float64. Returns (costs, valid_mask); cells float() rejects are invalid."""
+    array = np.asarray(cost_values)
+    if array.dtype.kind in "biuf":
+        return array.astype(np.float64), np.ones(len(array), dtype=bool)
+    costs = np.zeros(len(cost_values), dtype=np.float64)
+    valid = np.ones(len(cost_values), dtype=bool)
+    for idx, value in enumerate(cost_values):
+        try:
+            costs[idx] = float(value)
+        except (TypeError, ValueError):
+            valid[idx] = False
+    return costs, valid
+
+
+class ColumnarCostAccumulator:
+    """
+    Columnar (NumPy/pandas) implementation of azure_client._parse_cost_management_query_result that consumes a
+    query result page by page (see azure_client._iter_query_result_pages), so only one page of raw rows is held
+    at a time. Column indices are resolved once per page, each column is converted in bulk, dates / flags /
+    strings are parsed once per distinct value, and RG / monthly totals are aggregated with np.add.at.
+    All sums continue sequentially across rows and pages, so results are bit-identical to the row-by-row parser.
+    """
+    def __init__(self, include_resource_group_in_parsing: bool = True, expected_granularity: str = "None", entry_type: str = "actual"):
+        self.include_resource_group_in_parsing = include_resource_group_in_parsing
+        self.expected_granularity = expected_granularity.lower()
+        self.entry_type = entry_type
+        self.total_overall_cost = 0.0
+        self.currency = "USD"
+        self.costs_by_rg: Dict[str, float] = {}  # Unrounded running sums
+        self.monthly_aggregated_costs: Dict[Tuple[int, int], float] = {}
+        self.detailed_entries = CostEntryTable()
+        self.row_count = 0
+        self.page_count = 0
+
+    @property
+    def _returns_monthly(self) -> bool:
+        return not self.include_resource_group_in_parsing and self.expected_granularity == 'monthly'
+
+    def add_page(self, columns_meta: Sequence[Any], rows: Sequence[Sequence[Any]]) -> None:
+        """
+        Adds one page of rows. Raises ValueError if the essential Cost/Currency columns are missing.
+        Rows too short to hold cost and currency are skipped; other missing cells count as None (as in the row parser).
+        """
+        self.page_count += 1
+        if not rows:
+            return
+        column_map = {col.name.lower(): idx for idx, col in enumerate(columns_meta)}
+        cost_idx = column_map.get("cost")
+        currency_idx = column_map.get("currency")
+        if cost_idx is None or currency_idx is None:
+            original_column_names = [col.name for col in columns_meta]
+            raise ValueError(f"Essential columns missing in query result. Cannot parse costs. Found: {original_column_names}")
+        rg_idx = column_map.get("resourcegroupname") if self.include_resource_group_in_parsing else None
+        resource_id_idx = column_map.get("resourceid")
+        is_actual_cost_idx = column_map.get("isactualcost")
+        date_idx = next((column_map[name] for name in DATE_COLUMN_NAMES_PRIORITY if name in column_map), None)
+
+        column_count = len(columns_meta)
+        row_lengths = set(map(len, rows))
+        if row_lengths != {column_count}:
+            # Ragged page: skip rows missing cost/currency, pad the rest with None.
+            min_length = max(cost_idx, currency_idx) + 1
+            rows = [list(row[:column_count]) + [None] * (column_count - len(row)) for row in rows if len(row) >= min_length]
+            if not rows:
+                return
+        columns = list(zip(*rows))
+
+        costs, valid = _costs_as_float(columns[cost_idx])
+        if not valid.all():
+            logger.warning(f"Skipping {int((~valid).sum())} malformed rows with non-numeric cost values.")
+            keep_positions = np.flatnonzero(valid)
+            costs = costs[keep_positions]
+            columns = [[column[i] for i in keep_positions.tolist()] for column in columns]
+        row_count = len(costs)
+        if row_count == 0:
+            return
+        self.row_count += row_count
+
+        # Running sum in row order, exactly like `total += cost` in the row parser.
+        self.total_overall_cost = float(np.add.accumulate(np.concatenate(([self.total_overall_cost], costs)))[-1])
+
+        # Currency: str() of each cell; the result currency is the first non-empty one other than "USD".
+        currency_codes, currency_uniques = _factorize(columns[currency_idx])
+        currency_labels = [str(value) for value in currency_uniques]
+        if self.currency == "USD":
+            for code in pd.unique(currency_codes).tolist():
+                label = currency_labels[code] if code >= 0 else "None"
+                if label and label != "USD":
+                    self.currency = label
+                    break
+
+        # Dates: parsed once per distinct value.
+        if date_idx is not None:
+            date_codes, date_uniques = _factorize(columns[date_idx])
+            parsed_uniques = [parse_usage_date(value) for value in date_uniques]
+        else:
+            date_codes, parsed_uniques = np.full(row_count, -1, dtype=np.int64), []
+
+        if self._returns_monthly and parsed_uniques:
+            month_keys = [(parsed[0].year, parsed[0].month) if parsed[0] else None for parsed in parsed_uniques]
+            has_month = np.array([key is not None for key in month_keys] + [False])[date_codes]
+            if has_month.any():
+                month_codes, month_uniques = _factorize(_take([str(key) for key in month_keys], date_codes[has_month], None))
+                key_by_label = {str(key): key for key in month_keys if key is not None}
+                month_sums = np.array([self.monthly_aggregated_costs.get(key_by_label[label], 0.0) for label in month_uniques], dtype=np.float64)
+                np.add.at(month_sums, month_codes, costs[has_month])
+                for code, label in enumerate(month_uniques):
+                    self.monthly_aggregated_costs[key_by_label[label]] = float(month_sums[code])
+                # Monthly totals replace the detailed entries in the result, so stop collecting them.
+                self.detailed_entries = CostEntryTable()
+        if self._returns_monthly and self.monthly_aggregated_costs:
+            return
+
+        # Resource group: only caz- prefixed RGs are aggregated and kept when parsing by RG.
+        if rg_idx is not None:
+            rg_codes, rg_uniques = _factorize(columns[rg_idx])
+            rg_labels = [str(value) for value in rg_uniques]
+        else:
+            rg_codes, rg_labels = np.full(row_count, -1, dtype=np.int64), []
+        if self.include_resource_group_in_parsing:
+            keep = np.array([label.startswith(RG_PREFIX_FILTER) for label in rg_labels] + [False])[rg_codes]
+            if keep.any():
+                rg_sums = np.array([self.costs_by_rg.get(label, 0.0) for label in rg_labels], dtype=np.float64)
+                np.add.at(rg_sums, rg_codes[keep], costs[keep])
+                for code in pd.unique(rg_codes[keep]).tolist():
+                    self.costs_by_rg[rg_labels[code]] = float(rg_sums[code])
+        else:
+            keep = np.ones(row_count, dtype=bool)
+        keep_positions = np.flatnonzero(keep)
+        if len(keep_positions) == 0:
+            return
+
+        # Entry type: IsActualCost when present, otherwise future dates are forecasts for daily granularity.
+        entry_types = np.full(row_count, self.entry_type, dtype=object)
+        has_actual_flag = np.zeros(row_count, dtype=bool)
+        if is_actual_cost_idx is not None:
+            flag_codes, flag_uniques = _factorize(columns[is_actual_cost_idx])
+            has_actual_flag = flag_codes >= 0
+            entry_types[has_actual_flag] = _take(["actual" if flag else "forecast" for flag in flag_uniques], flag_codes[has_actual_flag], None)
+        if self.expected_granularity == 'daily' and parsed_uniques:
+            today = datetime.now(timezone.utc).date()
+            future_uniques = np.array([parsed[1] is not None and DateObject.fromisoformat(parsed[1]) > today for parsed in parsed_uniques] + [False])
+            entry_types[future_uniques[date_codes] & ~has_actual_flag] = "forecast"
+
+        # Entries go straight into the dictionary-encoded table, reusing the per-page factorization.
+        if resource_id_idx is None:
+            resource_id_codes, resource_id_labels = np.full(row_count, -1, dtype=np.int64), []
+        else:
+            resource_id_codes, resource_id_uniques = _factorize(columns[resource_id_idx])
+            resource_id_labels = [str(value) for value in resource_id_uniques]
+        entry_type_codes, entry_type_labels = _factorize(entry_types[keep_positions])
+        table = self.detailed_entries
+        table.amounts.extend(_round_amounts(costs[keep_positions]))
+        table.currency.extend_encoded(*_with_na_value(currency_codes[keep_positions], currency_labels, "None"))
+        table.entry_type.extend_encoded(entry_type_codes, entry_type_labels)
+        # Missing or empty RG names are reported as "N/A", as in the row parser.
+        table.resourceGroupName.extend_encoded(*_with_na_value(rg_codes[keep_positions], [label if label else "N/A" for label in rg_labels], "N/A"))
+        table.resourceId.extend_encoded(*_with_na_value(resource_id_codes[keep_positions], resource_id_labels, None))
+        table.date.extend_encoded(*_with_na_value(date_codes[keep_positions], [parsed[1] for parsed in parsed_uniques], None))
+
+    def result(self) -> Tuple[float, str, Dict[Any, float], CostEntryTable]:
+        """Returns: total_cost, currency, costs_by_rg (or monthly totals, see the row parser), detailed_entries."""
+        if self.row_count == 0:
+            logger.debug("Query returned no data rows for this specific parsing context.")
+        if self._returns_monthly and self.monthly_aggregated_costs:
+            logger.info(f"Returning monthly aggregated costs dictionary: {self.monthly_aggregated_costs}")
+            return round(self.total_overall_cost, 2), self.currency, dict(self.monthly_aggregated_costs), CostEntryTable()
+        costs_by_rg = {rg: round(val, 2) for rg, val in self.costs_by_rg.items()}
+        return round(self.total_overall_cost, 2), self.currency, costs_by_rg, self.detailed_entries
+
+
+def parse_query_result_columnar(
+        query_result: Any,
+        include_resource_group_in_parsing: bool = True,
+        expected_granularity: str = "None",
+        entry_type: str = "actual"
+) -> Optional[Tuple[float, str, Dict[Any, float], CostEntryTable]]:
+    """
+    Parses a single-page query result with ColumnarCostAccumulator.
+    Returns None for empty or malformed results; the caller then falls back to the row parser, which reports those cases.
+    """
+    if not query_result or not hasattr(query_result, 'rows') or not hasattr(query_result, 'columns') or not query_result.rows:
+        return None
+    accumulator = ColumnarCostAccumulator(include_resource_group_in_parsing, expected_granularity, entry_type)
+    accumulator.add_page(query_result.columns, query_result.rows)
+    return accumulator.result()
@@ -0,0 +1,372 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.core.security import get_token_expiry, get_verified_identity_hash
+
+logger = logging.getLogger(__name__)
+
+# One warehouse row: (usage_date as YYYYMMDD int, resource group, resource id, currency, cost)
+WarehouseRow = Tuple[int, Optional[str], Optional[str], str, float]
+
+
+def day_key(day: date) -> int:
+    """Warehouse day key, YYYYMMDD as an int (the same format Azure returns in UsageDate)."""
+    return day.year * 10000 + day.month * 100 + day.day
+
+def day_from_key(key: int) -> date:
+    return date(key // 10000, key // 100 % 100, key % 100)
+
+def iter_days(first_day: date, last_day: date) -> Iterable[date]:
+    for offset in range((last_day - first_day).days + 1):
+        yield first_day + timedelta(days=offset)
+
+def contiguous_windows(days: List[date]) -> List[Tuple[date, date]]:
+    """Groups sorted days into contiguous (first, last) windows that never cross a calendar month, one Azure query each."""
+    windows: List[Tuple[date, date]] = []
+    for day in days:
+        if windows and windows[-1][1] + timedelta(days=1) == day and windows[-1][1].month == day.month:
+            windows[-1] = (windows[-1][0], day)
+        else:
+            windows.append((day, day))
+    return windows
+
+def history_floor() -> date:
+    """Oldest day the warehouse keeps filled (COST_WAREHOUSE_HISTORY_DAYS back); the watermark run starts here."""
+    return datetime.now(timezone.utc).date() - timedelta(days=settings.COST_WAREHOUSE_HISTORY_DAYS)
+
+def settled_at(day: date) -> float:
+    """Epoch time from which Azure no longer revises `day`'s costs (COST_WAREHOUSE_UNSETTLED_DAYS after it ends)."""
+    settled_day = day + timedelta(days=settings.COST_WAREHOUSE_UNSETTLED_DAYS + 1)
+    return datetime(settled_day.year, settled_day.month, settled_day.day, tzinfo=timezone.utc).timestamp()
+
+
+class CostWarehouse:
+    """
+    Local SQLite store of daily, untagged ActualCost rows per subscription, grouped by ResourceGroupName + ResourceID.
+    Data is partitioned by (subscription, day): a day is stored (replaced) as a whole and tracked in `cost_days`,
+    so a query can tell whether every day of its window is present and fresh enough to be answered locally.
+
+    A day ingested after it settled (settled_at) is final and never fetched again. Each subscription has a watermark,
+    the last day of the unbroken run of final days starting at the history floor, so within the history only days
+    after the watermark (normally just the trailing unsettled ones) are ever checked or re-fetched.
+
+    Access control: rows are only returned to identities that recently ran a successful Azure query for the same
+    subscription (`warehouse_access`). Identities come from tokens token_verifier has seen Azure accept; any other
+    token has no access. Only while `keep_tokens` is set (by the worker running the background ingestion,
+    cost_ingestion.py) the user token valid the longest is kept in memory per subscription (at most
+    COST_WAREHOUSE_MAX_TOKENS subscriptions, least recently used dropped first) to keep the subscription filled
+    while it is valid.
+
+    The database is opened by `open` (from the startup hook), never at import.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.keep_tokens = False
+        self._lock = threading.Lock()
+        self._tokens: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()  # subscription -> (token, expires_at)
+        self.local_queries = 0
+        self.stored_days = 0
+        self.incremental_refreshes = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def is_open(self) -> bool:
+        return self._conn is not None
+
+    def open(self) -> None:
+        if self._conn is not None:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cost_rows ("
+            " subscription_id TEXT NOT NULL, usage_date INTEGER NOT NULL, resource_group TEXT, resource_id TEXT,"
+            " currency TEXT, cost REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cost_rows_partition ON cost_rows (subscription_id, usage_date)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cost_days ("
+            " subscription_id TEXT NOT NULL, usage_date INTEGER NOT NULL, ingested_at REAL NOT NULL,"
+            " PRIMARY KEY (subscription_id, usage_date))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS warehouse_subscriptions ("
+            " subscription_id TEXT PRIMARY KEY, registered_at REAL NOT NULL, last_ingested_at REAL, last_error TEXT)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS warehouse_access ("
+            " identity_hash TEXT NOT NULL, subscription_id TEXT NOT NULL, verified_at REAL NOT NULL,"
+            " PRIMARY KEY (identity_hash, subscription_id))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS warehouse_watermarks (subscription_id TEXT PRIMARY KEY, settled_through INTEGER NOT NULL)"
+        )
+        self._conn = conn
+
+    # --- Access and tokens ---
+    def _remember_token(self, subscription_id: str, access_token: str) -> None:
+        if not self.keep_tokens:
+            return
+        expires_at = get_token_expiry(access_token)
+        current = self._tokens.get(subscription_id)
+        if current is None or (expires_at or 0) >= (current[1] or 0):
+            self._tokens[subscription_id] = (access_token, expires_at)
+        self._tokens.move_to_end(subscription_id)
+        while len(self._tokens) > settings.COST_WAREHOUSE_MAX_TOKENS:
+            self._tokens.popitem(last=False)
+
+    def register_access(self, access_token: str, subscription_id: str) -> None:
+        """Records that the caller just queried `subscription_id` successfully and enrolls the subscription for ingestion."""
+        identity_hash = get_verified_identity_hash(access_token)
+        if identity_hash is None:
+            return
+        subscription_id = subscription_id.lower()
+        now = time.time()
+        self._remember_token(subscription_id, access_token)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO warehouse_access (identity_hash, subscription_id, verified_at) VALUES (?, ?, ?)",
+                (identity_hash, subscription_id, now)
+            )
+            self._conn.execute(
+                "INSERT OR IGNORE INTO warehouse_subscriptions (subscription_id, registered_at) VALUES (?, ?)",
+                (subscription_id, now)
+            )
+
+    def has_access(self, access_token: str, subscription_id: str) -> bool:
+        identity_hash = get_verified_identity_hash(access_token)
+        if identity_hash is None:
+            return False
+        verified_after = time.time() - settings.COST_WAREHOUSE_ACCESS_TTL_SECONDS
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM warehouse_access WHERE identity_hash = ? AND subscription_id = ? AND verified_at >= ?",
+                (identity_hash, subscription_id.lower(), verified_after)
+            ).fetchone()
+        return row is not None
+
+    def token_for(self, subscription_id: str) -> Optional[str]:
+        """The remembered user token for the subscription, if it stays valid for COST_WAREHOUSE_TOKEN_MIN_VALIDITY_SECONDS."""
+        subscription_id = subscription_id.lower()
+        remembered = self._tokens.get(subscription_id)
+        if remembered is None:
+            return None
+        token, expires_at = remembered
+        if expires_at is not None and expires_at < time.time() + settings.COST_WAREHOUSE_TOKEN_MIN_VALIDITY_SECONDS:
+            del self._tokens[subscription_id]
+            return None
+        return token
+
+    def subscriptions(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT subscription_id FROM warehouse_subscriptions ORDER BY subscription_id")]
+
+    def mark_ingested(self, subscription_id: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            if error is None:
+                self._conn.execute(
+                    "UPDATE warehouse_subscriptions SET last_ingested_at = ?, last_error = NULL WHERE subscription_id = ?",
+                    (time.time(), subscription_id.lower())
+                )
+            else:
+                self._conn.execute("UPDATE warehouse_subscriptions SET last_error = ? WHERE subscription_id = ?", (error, subscription_id.lower()))
+
+    # --- Partitions ---
+    def store_days(self, subscription_id: str, first_day: date, last_day: date, rows: Iterable[WarehouseRow]) -> None:
+        """
+        Replaces the (subscription, day) partitions from first_day to last_day with `rows` in one transaction.
+        Days without rows are stored as empty partitions, so they count as loaded (zero cost) afterwards.
+        """
+        subscription_id = subscription_id.lower()
+        first_key, last_key = day_key(first_day), day_key(last_day)
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "DELETE FROM cost_rows WHERE subscription_id = ? AND usage_date BETWEEN ? AND ?",
+                    (subscription_id, first_key, last_key)
+                )
+                self._conn.executemany(
+                    "INSERT INTO cost_rows (subscription_id, usage_date, resource_group, resource_id, currency, cost) VALUES (?, ?, ?, ?, ?, ?)",
+                    ((subscription_id, *row) for row in rows if first_key <= row[0] <= last_key)
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO cost_days (subscription_id, usage_date, ingested_at) VALUES (?, ?, ?)",
+                    ((subscription_id, day_key(day), now) for day in iter_days(first_day, last_day))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._advance_watermark(subscription_id)
+        self.stored_days += (last_day - first_day).days + 1
+
+    def _watermark_key(self, subscription_id: str) -> Optional[int]:
+        row = self._conn.execute("SELECT settled_through FROM warehouse_watermarks WHERE subscription_id = ?", (subscription_id,)).fetchone()
+        return row[0] if row else None
+
+    def _advance_watermark(self, subscription_id: str) -> None:
+        """Moves the watermark forward over the final days stored right after it. Called with the lock held."""
+        current = self._watermark_key(subscription_id)
+        expected = day_from_key(current) + timedelta(days=1) if current else history_floor()
+        stored = self._conn.execute(
+            "SELECT usage_date, ingested_at FROM cost_days WHERE subscription_id = ? AND usage_date >= ? ORDER BY usage_date",
+            (subscription_id, day_key(expected))
+        ).fetchall()
+        settled_through = current
+        for key, ingested_at in stored:
+            day = day_from_key(key)
+            if day != expected or ingested_at < settled_at(day):
+                break
+            settled_through = key
+            expected = day + timedelta(days=1)
+        if settled_through != current:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO warehouse_watermarks (subscription_id, settled_through) VALUES (?, ?)",
+                (subscription_id, settled_through)
+            )
+
+    def watermark(self, subscription_id: str) -> Optional[date]:
+        """Last day of the unbroken run of final (settled) days starting at the history floor, or None."""
+        with self._lock:
+            key = self._watermark_key(subscription_id.lower())
+        return day_from_key(key) if key else None
+
+    def days_to_ingest(self, subscription_id: str, first_day: date, last_day: date) -> List[date]:
+        """
+        Days in the window that are missing, or not final and ingested longer than COST_WAREHOUSE_FRESHNESS_SECONDS ago.
+        Days from the history floor up to the watermark are final and skipped without looking at them.
+        """
+        subscription_id = subscription_id.lower()
+        fresh_after = time.time() - settings.COST_WAREHOUSE_FRESHNESS_SECONDS
+        with self._lock:
+            watermark_key = self._watermark_key(subscription_id) or 0
+            floor_key = day_key(history_floor())
+            ingested = dict(self._conn.execute(
+                "SELECT usage_date, ingested_at FROM cost_days WHERE subscription_id = ? AND usage_date BETWEEN ? AND ?"
+                " AND NOT (usage_date BETWEEN ? AND ?)",
+                (subscription_id, day_key(first_day), day_key(last_day), floor_key, watermark_key)
+            ).fetchall())
+        due = []
+        for day in iter_days(first_day, last_day):
+            key = day_key(day)
+            if floor_key <= key <= watermark_key:
+                continue
+            ingested_at = ingested.get(key)
+            if ingested_at is None or (ingested_at < settled_at(day) and ingested_at < fresh_after):
+                due.append(day)
+        return due
+
+    def refreshable_days(self, access_token: str, subscription_id: str, first_day: date, last_day: date) -> Optional[List[date]]:
+        """
+        The days a request for this window must re-fetch before it can be answered locally, if that is an incremental
+        refresh: the caller has access and every due day lies within the last COST_WAREHOUSE_INCREMENTAL_MAX_DAYS.
+        Returns None when the gap is larger (the request goes to Azure and ingestion backfills the gap).
+        """
+        if not self.has_access(access_token, subscription_id):
+            return None
+        today = datetime.now(timezone.utc).date()
+        last_day = min(last_day, today)
+        if first_day > last_day:
+            return None
+        due = self.days_to_ingest(subscription_id, first_day, last_day)
+        if due and due[0] < today - timedelta(days=settings.COST_WAREHOUSE_INCREMENTAL_MAX_DAYS):
+            return None
+        return due
+
+    # --- Queries ---
+    def query_rows(
+        self,
+        access_token: str,
+        subscription_id: str,
+        first_day: date,
+        last_day: date,
+        granularity: str,
+        grouping: Sequence[str],
+        resource_group: Optional[str] = None
+    ) -> Optional[Tuple[List[str], List[List[Any]]]]:
+        """
+        Aggregates stored rows the way Cost Management would for a Daily / Monthly / None granularity query
+        grouped by `grouping` ("ResourceGroupName", "ResourceID"), optionally limited to one resource group.
+        Returns (column names, rows) shaped like a QueryResult, or None when the caller has no recorded access or
+        the window is not fully loaded and fresh (the caller then queries Azure).
+        """
+        if not self.has_access(access_token, subscription_id):
+            return None
+        today = datetime.now(timezone.utc).date()
+        last_day = min(last_day, today)
+        if first_day > last_day or self.days_to_ingest(subscription_id, first_day, last_day):
+            return None
+
+        columns, select = ["Cost"], ["SUM(cost)"]
+        granularity = (granularity or "none").lower()
+        if granularity == "daily":
+            columns.append("UsageDate")
+            select.append("usage_date")
+        elif granularity == "monthly":
+            columns.append("BillingMonth")
+            select.append("usage_date / 100")
+        if "ResourceGroupName" in grouping:
+            columns.append("ResourceGroupName")
+            select.append("resource_group")
+        if "ResourceID" in grouping:
+            columns.append("ResourceId")
+            select.append("resource_id")
+        columns.append("Currency")
+        select.append("currency")
+        group_by = select[1:]
+
+        sql = f"SELECT {', '.join(select)} FROM cost_rows WHERE subscription_id = ? AND usage_date BETWEEN ? AND ?"
+        params: List[Any] = [subscription_id.lower(), day_key(first_day), day_key(last_day)]
+        if resource_group is not None:
+            sql += " AND resource_group = ? COLLATE NOCASE"
+            params.append(resource_group)
+        sql += f" GROUP BY {', '.join(group_by)} ORDER BY {', '.join(group_by)}"
+        with self._lock:
+            rows = [list(row) for row in self._conn.execute(sql, params)]
+        if granularity == "monthly":
+            for row in rows:
+                row[1] = f"{row[1] // 100:04d}-{row[1] % 100:02d}-01T00:00:00"
+        self.local_queries += 1
+        return columns, rows
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            row_count = self._conn.execute("SELECT COUNT(*) FROM cost_rows").fetchone()[0]
+            day_count = self._conn.execute("SELECT COUNT(*) FROM cost_days").fetchone()[0]
+            # Totals only: subscription ids and their ingestion errors are not exposed to every caller.
+            subscriptions, failing = self._conn.execute(
+                "SELECT COUNT(*), COUNT(last_error) FROM warehouse_subscriptions"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            "rows": row_count,
+            "days": day_count,
+            "local_queries": self.local_queries,
+            "stored_days": self.stored_days,
+            "incremental_refreshes": self.incremental_refreshes,
+            "subscriptions": subscriptions,
+            "subscriptions_failing_ingestion": failing,
+            "ingestion_tokens": len(self._tokens),
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._tokens.clear()
+
+
+cost_warehouse = CostWarehouse(settings.COST_WAREHOUSE_PATH) if settings.COST_WAREHOUSE_ENABLED else None
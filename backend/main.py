@@ -5,7 +5,13 @@ from fastapi.middleware.cors import CORSMiddleware
 import logging
 
 from app.api.v1 import api_router as api_router_v1
-# from app.core.config import settings # If needed globally
+from app.core.azure_client import close_azure_client_pool, shutdown_azure_sdk_executor
+from app.core.cost_cache import cost_result_cache
+from app.core.cost_ingestion import cost_warehouse_ingestor
+from app.core.cost_warehouse import cost_warehouse
+from app.core.report_jobs import report_job_queue
+from app.core.report_store import report_store
+from app.core.config import settings
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -45,6 +51,12 @@ async def global_exception_handler(request: Request, exc: Exception):
 @app.on_event("startup")
 async def startup_event():
     logger.info("COST API starting up...")
+    report_job_queue.start()
+    report_store.start_janitor(settings.REPORT_STORE_JANITOR_INTERVAL_SECONDS)
+    if cost_warehouse is not None:
+        cost_warehouse.open()
+    if cost_warehouse_ingestor is not None:
+        cost_warehouse_ingestor.start()
     # logger.info(f"Azure App Client ID configured: {'Yes' if settings.AZURE_APP_CLIENT_ID else 'No'}")
     # logger.info(f"Azure Authority Host: {settings.AZURE_AUTHORITY_HOST}")
     # logger.info(f"Azure RM Endpoint: {settings.AZURE_RESOURCE_MANAGER_ENDPOINT}")
@@ -54,6 +66,15 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("COST API shutting down...")
+    await report_job_queue.stop()
+    await report_store.stop_janitor()
+    if cost_warehouse_ingestor is not None:
+        await cost_warehouse_ingestor.stop()
+    shutdown_azure_sdk_executor()
+    close_azure_client_pool()
+    cost_result_cache.close()
+    if cost_warehouse is not None:
+        cost_warehouse.close()
 
 # Include your API router
 app.include_router(api_router_v1, prefix="/i/api/v1")
@@ -0,0 +1,149 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.core.cost_warehouse import day_key
+
+# Counters for /metrics/cost-cache: requests answered from a superset, superset queries sent to Azure, and
+# long queries split into month shards (with the number of shard queries sent).
+query_planner_stats = {"planned_queries": 0, "superset_queries": 0, "sharded_queries": 0, "shard_queries": 0}
+
+_GRANULARITIES = ("none", "daily", "monthly")
+
+
+def superset_window(today: Optional[date] = None) -> Tuple[date, date]:
+    """
+    Days of the canonical Daily superset query: from the earlier of the first of the month and today - 29 up to
+    today, which covers MonthToDate, BillingMonthToDate, TheLast7Days and TheLast30Days (and Custom windows inside).
+    """
+    today = today or datetime.now(timezone.utc).date()
+    return min(today.replace(day=1), today - timedelta(days=29)), today
+
+
+def plan_window(first_day: date, last_day: date, granularity: str) -> Optional[Tuple[date, date]]:
+    """The superset window that covers the requested days and granularity, or None when the request needs its own query."""
+    if (granularity or "none").lower() not in _GRANULARITIES:
+        return None
+    superset_first, superset_last = superset_window()
+    if first_day < superset_first or last_day > superset_last or first_day > last_day:
+        return None
+    return superset_first, superset_last
+
+
+def superset_grouping(grouping: Sequence[str], resource_group: Optional[str] = None) -> List[str]:
+    """
+    Grouping of the superset serving a request: at least ResourceGroupName for a subscription (so totals and
+    resource group views share it), ResourceID when the request needs resources. Within a resource group
+    scope the resource group is implied.
+    """
+    needed = [] if resource_group is not None else ["ResourceGroupName"]
+    if "ResourceID" in grouping:
+        needed.append("ResourceID")
+    return needed
+
+
+def finer_grouping(grouping: Sequence[str], resource_group: Optional[str] = None) -> Optional[List[str]]:
+    """A finer superset grouping that can also serve `grouping` (checked in the cache first), if any."""
+    return None if "ResourceID" in grouping else superset_grouping(["ResourceID"], resource_group)
+
+
+def slice_rows(
+    rows: Sequence[Sequence[Any]],
+    first_day: date,
+    last_day: date,
+    granularity: str,
+    grouping: Sequence[str]
+) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Re-aggregates superset rows ((YYYYMMDD, resource group, resource id, currency, cost), see
+    azure_client.fetch_daily_cost_rows) for one window, granularity and grouping. The result is shaped like the
+    QueryResult Azure would return for that query (the same columns as CostWarehouse.query_rows).
+    """
+    granularity = (granularity or "none").lower()
+    columns = ["Cost"]
+    if granularity == "daily":
+        columns.append("UsageDate")
+    elif granularity == "monthly":
+        columns.append("BillingMonth")
+    by_resource_group = "ResourceGroupName" in grouping
+    by_resource = "ResourceID" in grouping
+    if by_resource_group:
+        columns.append("ResourceGroupName")
+    if by_resource:
+        columns.append("ResourceId")
+    columns.append("Currency")
+
+    first_key, last_key = day_key(first_day), day_key(last_day)
+    sums: Dict[Tuple[Any, ...], float] = {}
+    for usage_date, resource_group, resource_id, currency, cost in rows:
+        if usage_date < first_key or usage_date > last_key:
+            continue
+        key: List[Any] = []
+        if granularity == "daily":
+            key.append(usage_date)
+        elif granularity == "monthly":
+            key.append(usage_date // 100)
+        if by_resource_group:
+            key.append(resource_group)
+        if by_resource:
+            key.append(resource_id)
+        key.append(currency)
+        group = tuple(key)
+        sums[group] = sums.get(group, 0.0) + cost
+
+    # Ordered like the warehouse's GROUP BY / ORDER BY (missing values first).
+    result = [[cost, *group] for group, cost in sorted(sums.items(), key=lambda item: [(value is not None, value) for value in item[0]])]
+    if granularity == "monthly":
+        for row in result:
+            row[1] = f"{row[1] // 100:04d}-{row[1] % 100:02d}-01T00:00:00"
+    return columns, result
+
+
+def month_shards(first_day: date, last_day: date, min_days: int) -> List[Tuple[date, date]]:
+    """
+    Splits a window longer than `min_days` into calendar-month sub-windows (the first and last ones partial),
+    in date order. Shorter windows come back as the single window.
+    """
+    if (last_day - first_day).days + 1 <= min_days:
+        return [(first_day, last_day)]
+    shards = []
+    start = first_day
+    while start <= last_day:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        shards.append((start, min(last_day, next_month - timedelta(days=1))))
+        start = next_month
+    return shards
+
+
+class ShardRowMerger:
+    """
+    Merges the result pages (column names, rows) of the month shards of one query, fed shard by shard in date
+    order. Rows with the same non-cost values (e.g. a resource over several months with granularity None) are
+    summed. Groups keep the order they first appear in, so the merge is deterministic; only the merged groups
+    are held, not the shards' pages.
+    """
+    def __init__(self):
+        self.column_names: Optional[List[str]] = None
+        self._cost_idx: Optional[int] = None
+        self._merged: Dict[Tuple[Any, ...], List[Any]] = {}
+
+    def add_page(self, names: List[str], rows: Sequence[Sequence[Any]]) -> None:
+        if self.column_names is None:
+            self.column_names = list(names)
+            self._cost_idx = next((idx for idx, name in enumerate(names) if name.lower() == "cost"), None)
+            if self._cost_idx is None:
+                raise ValueError(f"Essential columns missing in query result. Cannot parse costs. Found: {names}")
+        column_names, cost_idx, merged = self.column_names, self._cost_idx, self._merged
+        order = None if names == column_names else [names.index(name) for name in column_names]
+        for row in rows:
+            if order is not None:
+                row = [row[idx] for idx in order]
+            key = tuple(value for idx, value in enumerate(row) if idx != cost_idx)
+            merged_row = merged.get(key)
+            if merged_row is None:
+                merged[key] = list(row)
+            else:
+                merged_row[cost_idx] = float(merged_row[cost_idx]) + float(row[cost_idx])
+
+    def result(self) -> Tuple[List[str], List[List[Any]]]:
+        return self.column_names or ["Cost", "Currency"], list(self._merged.values())
+
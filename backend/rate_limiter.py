@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import re
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, Mapping, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Headers Azure uses to tell us how long to back off. Scope-level ones block the (tenant, scope) key,
+# tenant-level ones block every scope of the tenant.
+SCOPE_RETRY_AFTER_HEADERS = (
+    "retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-entity-retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-qpu-retry-after",
+    "x-ms-ratelimit-microsoft.costmanagement-client-retry-after",
+)
+TENANT_RETRY_AFTER_HEADERS = (
+    "x-ms-ratelimit-microsoft.costmanagement-tenant-retry-after",
+)
+# Headers reporting remaining quota. Cost Management reports QPU as e.g. "QueryPerHour:50", ARM as a plain integer.
+SCOPE_REMAINING_HEADERS = (
+    "x-ms-ratelimit-microsoft.costmanagement-qpu-remaining",
+    "x-ms-ratelimit-remaining-subscription-reads",
+)
+TENANT_REMAINING_HEADERS = (
+    "x-ms-ratelimit-remaining-tenant-reads",
+)
+
+_INT_PATTERN = re.compile(r"\d+")
+_SECONDS_PATTERN = re.compile(r"\d+(\.\d+)?")
+
+
+class _ThrottleState:
+    """Quota bookkeeping for one tenant or one (tenant, scope) key."""
+    __slots__ = ("blocked_until", "remaining", "in_flight", "waiting", "throttled", "condition")
+
+    def __init__(self):
+        self.blocked_until = 0.0          # time.monotonic() before which no request may start
+        self.remaining: Optional[int] = None
+        self.in_flight = 0                # Requests holding (scope) or waiting for / holding (tenant) a slot
+        self.waiting = 0
+        self.throttled = 0
+        self.condition = asyncio.Condition()
+
+
+class AzureRequestSlot:
+    """
+    Handed out by AzureRequestScheduler.slot(). Its observe_response method is passed to the SDK as
+    raw_response_hook; it runs on the SDK executor thread, so it only records headers and the
+    scheduler applies them back on the event loop when the slot is released.
+    """
+    def __init__(self):
+        self.headers: Optional[Mapping[str, str]] = None
+        self.throttled = False
+
+    def observe_response(self, pipeline_response: Any) -> None:
+        self.headers = pipeline_response.http_response.headers
+
+    def observe_error(self, error: Any) -> None:
+        response = getattr(error, "response", None)
+        if response is not None and response.headers is not None:
+            self.headers = response.headers
+        self.throttled = getattr(error, "status_code", None) == 429
+
+
+class AzureRequestScheduler:
+    """
+    Process-wide gate in front of every Cost Management / Subscription / Resource call.
+    Tracks remaining quota and retry-after windows from Azure's rate-limit headers per tenant and
+    per (tenant, scope), and delays requests that would otherwise be sent into a known 429.
+    Retry-after waits are capped at `max_retry_after_seconds`. Once more than `max_tracked_keys` tenants or
+    scopes are tracked, the idle ones (no request waiting or running, not blocked) are forgotten.
+    """
+    def __init__(
+        self,
+        max_concurrent_per_scope: int,
+        low_quota_threshold: int,
+        low_quota_delay_seconds: float,
+        default_retry_after_seconds: float,
+        max_retry_after_seconds: float,
+        max_tracked_keys: int
+    ):
+        self.max_concurrent_per_scope = max_concurrent_per_scope
+        self.low_quota_threshold = low_quota_threshold
+        self.low_quota_delay_seconds = low_quota_delay_seconds
+        self.default_retry_after_seconds = default_retry_after_seconds
+        self.max_retry_after_seconds = max_retry_after_seconds
+        self.max_tracked_keys = max_tracked_keys
+        self._tenants: Dict[str, _ThrottleState] = {}
+        self._scopes: Dict[str, _ThrottleState] = {}
+        self._total_requests = 0
+        self._delayed_requests = 0
+        self._throttled_responses = 0
+        self._total_wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    @staticmethod
+    def _state(states: Dict[str, _ThrottleState], key: str, max_keys: int) -> _ThrottleState:
+        state = states.get(key)
+        if state is None:
+            if len(states) >= max_keys:
+                now = time.monotonic()
+                for idle_key in [k for k, s in states.items() if not s.in_flight and not s.waiting and s.blocked_until <= now]:
+                    del states[idle_key]
+            state = states[key] = _ThrottleState()
+        return state
+
+    def _tenant_state(self, tenant_id: str) -> _ThrottleState:
+        return self._state(self._tenants, tenant_id, self.max_tracked_keys)
+
+    def _scope_state(self, tenant_id: str, scope: str) -> _ThrottleState:
+        return self._state(self._scopes, f"{tenant_id}|{scope.lower()}", self.max_tracked_keys)
+
+    @asynccontextmanager
+    async def slot(self, tenant_id: str, scope: str) -> AsyncIterator[AzureRequestSlot]:
+        """Waits until the tenant and scope are clear to call Azure, then holds a concurrency slot for the scope."""
+        tenant_state = self._tenant_state(tenant_id)
+        scope_state = self._scope_state(tenant_id, scope)
+        started_waiting = time.monotonic()
+
+        # Counted from here on, so neither state is forgotten as idle while this request waits or runs.
+        tenant_state.in_flight += 1
+        scope_state.waiting += 1
+        try:
+            try:
+                async with scope_state.condition:
+                    while True:
+                        delay = max(tenant_state.blocked_until, scope_state.blocked_until) - time.monotonic()
+                        if delay <= 0 and scope_state.in_flight < self.max_concurrent_per_scope:
+                            break
+                        try:
+                            await asyncio.wait_for(scope_state.condition.wait(), timeout=delay if delay > 0 else None)
+                        except asyncio.TimeoutError:
+                            pass
+                    scope_state.in_flight += 1
+            finally:
+                scope_state.waiting -= 1
+
+            waited = time.monotonic() - started_waiting
+            self._total_requests += 1
+            self._total_wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+            if waited > 0.05:
+                self._delayed_requests += 1
+                logger.debug(f"Azure request for {scope} (tenant {tenant_id}) waited {waited:.2f}s for rate limit clearance.")
+
+            request_slot = AzureRequestSlot()
+            try:
+                yield request_slot
+            finally:
+                self._apply_headers(tenant_state, scope_state, request_slot)
+                async with scope_state.condition:
+                    scope_state.in_flight -= 1
+                    scope_state.condition.notify_all()
+        finally:
+            tenant_state.in_flight -= 1
+
+    def _apply_headers(self, tenant_state: _ThrottleState, scope_state: _ThrottleState, request_slot: AzureRequestSlot) -> None:
+        headers = {k.lower(): v for k, v in (request_slot.headers or {}).items()}
+        now = time.monotonic()
+
+        scope_retry_after = _max_retry_after(headers, SCOPE_RETRY_AFTER_HEADERS)
+        tenant_retry_after = _max_retry_after(headers, TENANT_RETRY_AFTER_HEADERS)
+        if request_slot.throttled:
+            self._throttled_responses += 1
+            scope_state.throttled += 1
+            if scope_retry_after is None and tenant_retry_after is None:
+                scope_retry_after = self.default_retry_after_seconds
+        if scope_retry_after is not None:
+            scope_retry_after = min(scope_retry_after, self.max_retry_after_seconds)
+        if tenant_retry_after is not None:
+            tenant_retry_after = min(tenant_retry_after, self.max_retry_after_seconds)
+        if scope_retry_after:
+            scope_state.blocked_until = max(scope_state.blocked_until, now + scope_retry_after)
+        if tenant_retry_after:
+            tenant_state.blocked_until = max(tenant_state.blocked_until, now + tenant_retry_after)
+
+        scope_remaining = _min_header_int(headers, SCOPE_REMAINING_HEADERS)
+        tenant_remaining = _min_header_int(headers, TENANT_REMAINING_HEADERS)
+        for state, remaining in ((scope_state, scope_remaining), (tenant_state, tenant_remaining)):
+            if remaining is None:
+                continue
+            state.remaining = remaining
+            if remaining <= self.low_quota_threshold:
+                # Nearly out of quota: space out the next requests instead of spending the rest on certain 429s.
+                state.blocked_until = max(state.blocked_until, now + self.low_quota_delay_seconds)
+
+    def metrics(self, tenant_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Queue depth, wait-time and throttling counters, overall and per tenant/scope key. With a `tenant_id`,
+        the per-key sections only list that tenant (callers must not learn other tenants or subscriptions).
+        """
+        now = time.monotonic()
+        scope_prefix = f"{tenant_id}|" if tenant_id is not None else ""
+        return {
+            "queue_depth": sum(state.waiting for state in self._scopes.values()),
+            "in_flight": sum(state.in_flight for state in self._scopes.values()),
+            "total_requests": self._total_requests,
+            "delayed_requests": self._delayed_requests,
+            "throttled_responses": self._throttled_responses,
+            "total_wait_seconds": round(self._total_wait_seconds, 3),
+            "average_wait_seconds": round(self._total_wait_seconds / self._total_requests, 3) if self._total_requests else 0.0,
+            "max_wait_seconds": round(self._max_wait_seconds, 3),
+            "tenants": {
+                tenant: {
+                    "remaining": state.remaining,
+                    "blocked_for_seconds": round(max(0.0, state.blocked_until - now), 3),
+                }
+                for tenant, state in self._tenants.items()
+                if tenant_id is None or tenant == tenant_id
+            },
+            "scopes": {
+                key: {
+                    "queue_depth": state.waiting,
+                    "in_flight": state.in_flight,
+                    "remaining": state.remaining,
+                    "throttled": state.throttled,
+                    "blocked_for_seconds": round(max(0.0, state.blocked_until - now), 3),
+                }
+                for key, state in self._scopes.items()
+                if key.startswith(scope_prefix)
+            },
+        }
+
+
+def _retry_after_seconds(raw: str) -> Optional[float]:
+    """A retry-after value in seconds: delta-seconds ("30", "1.5") or an HTTP-date (RFC 7231). None if unparsable."""
+    raw = raw.strip()
+    if _SECONDS_PATTERN.fullmatch(raw):
+        return float(raw)
+    try:
+        retry_at = parsedate_to_datetime(raw)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+def _max_retry_after(headers: Mapping[str, str], names) -> Optional[float]:
+    values = [value for value in (_retry_after_seconds(str(headers[name])) for name in names if headers.get(name)) if value is not None]
+    return max(values) if values else None
+
+def _header_ints(headers: Mapping[str, str], names) -> list:
+    values = []
+    for name in names:
+        raw = headers.get(name)
+        if raw:
+            values.extend(int(match) for match in _INT_PATTERN.findall(str(raw)))
+    return values
+
+def _min_header_int(headers: Mapping[str, str], names) -> Optional[int]:
+    values = _header_ints(headers, names)
+    return min(values) if values else None
+
+
+azure_request_scheduler = AzureRequestScheduler(
+    max_concurrent_per_scope=settings.AZURE_MAX_CONCURRENT_REQUESTS_PER_SCOPE,
+    low_quota_threshold=settings.AZURE_RATE_LIMIT_LOW_QUOTA_THRESHOLD,
+    low_quota_delay_seconds=settings.AZURE_RATE_LIMIT_LOW_QUOTA_DELAY_SECONDS,
+    default_retry_after_seconds=settings.AZURE_RATE_LIMIT_DEFAULT_RETRY_AFTER_SECONDS,
+    max_retry_after_seconds=settings.AZURE_RATE_LIMIT_MAX_RETRY_AFTER_SECONDS,
+    max_tracked_keys=settings.AZURE_RATE_LIMIT_MAX_TRACKED_KEYS,
+)
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.core.azure_client import GENERATED_REPORTS_DIR
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Job state shared by all workers; hidden, so the report store and download-report never treat it as a report.
+REPORT_JOB_DB_FILE = ".report_jobs.sqlite3"
+_JOB_COLUMNS = (
+    "job_id", "owner", "description", "key", "instance_id", "status", "progress", "stage",
+    "file_path", "error", "created_at", "started_at", "finished_at"
+)
+
+
+class ReportJobQueueFull(Exception):
+    """Raised by ReportJobQueue.submit when REPORT_JOB_QUEUE_SIZE jobs are already waiting."""
+
+
+class ReportJob:
+    """
+    State of one report job. `run` reports progress through `set_progress` and returns the report file path.
+    Every change is written to the job store, so any worker can answer a status poll; `run` only exists in
+    the worker that queued the job.
+    """
+    def __init__(
+        self,
+        owner: str,
+        description: str,
+        run: Optional[Callable[["ReportJob"], Awaitable[str]]],
+        key: Optional[str] = None,
+        store: Optional["ReportJobStore"] = None,
+        instance_id: Optional[str] = None
+    ):
+        self.job_id = uuid.uuid4().hex
+        self.owner = owner
+        self.description = description
+        self.key = key
+        self.run = run
+        self.instance_id = instance_id
+        self.status = "queued"  # queued -> running -> completed | failed
+        self.progress = 0
+        self.stage = "Queued"
+        self.file_path: Optional[str] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._store = store
+
+    @classmethod
+    def from_row(cls, row: tuple) -> "ReportJob":
+        job = cls.__new__(cls)
+        job.__dict__.update(zip(_JOB_COLUMNS, row))
+        job.run, job._store = None, None
+        return job
+
+    def set_progress(self, progress: int, stage: str) -> None:
+        self.progress = max(0, min(100, progress))
+        self.stage = stage
+        self.save()
+
+    def save(self) -> None:
+        if self._store is not None:
+            self._store.save(self)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+
+class ReportJobStore:
+    """
+    SQLite table of report jobs, next to the reports in GENERATED_REPORTS_DIR and shared by every worker on the
+    host (WAL mode, like the SQLite cost cache backend). Status polls are answered from here, so they work on
+    whichever worker receives them.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS report_jobs ("
+            " job_id TEXT PRIMARY KEY, owner TEXT NOT NULL, description TEXT NOT NULL, key TEXT, instance_id TEXT,"
+            " status TEXT NOT NULL, progress INTEGER NOT NULL, stage TEXT NOT NULL, file_path TEXT, error TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_report_jobs_owner_key ON report_jobs (owner, key)")
+
+    def save(self, job: ReportJob) -> None:
+        values = tuple(getattr(job, column) for column in _JOB_COLUMNS)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO report_jobs ({', '.join(_JOB_COLUMNS)}) VALUES ({', '.join('?' * len(_JOB_COLUMNS))})",
+                values
+            )
+
+    def get(self, job_id: str) -> Optional[ReportJob]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(_JOB_COLUMNS)} FROM report_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return ReportJob.from_row(row) if row is not None else None
+
+    def find_active(self, owner: str, key: str) -> Optional[ReportJob]:
+        """A queued or running job of `owner` for report `key`, on any worker."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(_JOB_COLUMNS)} FROM report_jobs"
+                " WHERE owner = ? AND key = ? AND status IN ('queued', 'running') ORDER BY created_at LIMIT 1",
+                (owner, key)
+            ).fetchone()
+        return ReportJob.from_row(row) if row is not None else None
+
+    def queue_position(self, job: ReportJob) -> int:
+        """Queued jobs of the worker that owns `job`'s queue, up to and including it."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM report_jobs WHERE instance_id = ? AND status = 'queued' AND created_at <= ?",
+                (job.instance_id, job.created_at)
+            ).fetchone()[0]
+
+    def fail_unfinished(self, instance_id: str, error: str) -> int:
+        """Marks the jobs a stopping worker will never finish as failed, so pollers do not wait forever."""
+        with self._lock:
+            return self._conn.execute(
+                "UPDATE report_jobs SET status = 'failed', stage = 'Failed', error = ?, finished_at = ?"
+                " WHERE instance_id = ? AND status IN ('queued', 'running')",
+                (error, time.time(), instance_id)
+            ).rowcount
+
+    def prune(self, finished_before: float) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM report_jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (finished_before,))
+
+    def status_counts(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM report_jobs GROUP BY status").fetchall())
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ReportJobQueue:
+    """
+    Bounded worker pool for report generation. `submit` returns immediately with a queued ReportJob; `workers`
+    asyncio tasks take jobs off a queue of at most `max_queued` entries and run them one at a time each, so at
+    most `workers` reports fetch and render concurrently. Job state lives in a ReportJobStore opened by `start`
+    (in the startup hook), so every worker sees every job; finished jobs are kept for `retention_seconds` so
+    their status and download link can be polled.
+    """
+    def __init__(self, workers: int, max_queued: int, retention_seconds: float, db_path: str):
+        self.workers = workers
+        self.retention_seconds = retention_seconds
+        self.db_path = db_path
+        self.instance_id = uuid.uuid4().hex
+        self.store: Optional[ReportJobStore] = None
+        self._queue: "asyncio.Queue[ReportJob]" = asyncio.Queue(maxsize=max_queued)
+        self._tasks: list = []
+        self.completed_jobs = 0
+        self.failed_jobs = 0
+
+    def start(self) -> None:
+        if self.store is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            self.store = ReportJobStore(self.db_path)
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(index)) for index in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            self.store.fail_unfinished(self.instance_id, "The server stopped before the report was ready; request it again.")
+            self.store.close()
+            self.store = None
+
+    def _require_store(self) -> ReportJobStore:
+        if self.store is None:
+            raise RuntimeError("The report job queue is not started.")
+        return self.store
+
+    def submit(self, owner: str, description: str, run: Callable[[ReportJob], Awaitable[str]], key: Optional[str] = None) -> ReportJob:
+        """
+        Queues a job. With a `key` (report_store key), a queued or running job of the same owner and key is
+        returned instead (also one queued by another worker), so repeated clicks on the same report render it once.
+        """
+        store = self._require_store()
+        self._prune()
+        if key is not None:
+            active = store.find_active(owner, key)
+            if active is not None:
+                return active
+        job = ReportJob(owner, description, run, key, store=store, instance_id=self.instance_id)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise ReportJobQueueFull(f"{self._queue.qsize()} report jobs are already queued.")
+        job.save()
+        logger.info(f"Queued report job {job.job_id}: {description}")
+        return job
+
+    def add_completed(self, owner: str, description: str, file_path: str) -> ReportJob:
+        """Registers an already available report (e.g. reused from the report store) as a completed job."""
+        store = self._require_store()
+        self._prune()
+        job = ReportJob(owner, description, None, store=store, instance_id=self.instance_id)
+        job.status, job.file_path = "completed", file_path
+        job.started_at = job.finished_at = job.created_at
+        job.set_progress(100, "Reused existing report")
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[ReportJob]:
+        """
+        The job if it exists and was submitted by `owner` (other identities cannot see it). Owners are identity
+        hashes of verified tokens (security.get_verified_identity_hash), never taken from unchecked token claims.
+        """
+        job = self._require_store().get(job_id)
+        return job if job is not None and owner and job.owner == owner else None
+
+    def queue_position(self, job: ReportJob) -> int:
+        """1-based position among the still-queued jobs of the worker running it, 0 once the job has started."""
+        if job.status != "queued":
+            return 0
+        return self._require_store().queue_position(job)
+
+    def _prune(self) -> None:
+        self._require_store().prune(time.time() - self.retention_seconds)
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status, job.started_at = "running", time.time()
+            job.set_progress(5, "Starting")
+            try:
+                job.file_path = await job.run(job)
+                job.status, job.progress, job.stage = "completed", 100, "Completed"
+                self.completed_jobs += 1
+                logger.info(f"Report job {job.job_id} completed in {time.time() - job.started_at:.1f}s: {job.file_path}")
+            except Exception as e:
+                job.status, job.error = "failed", str(getattr(e, "detail", None) or e)
+                job.stage = "Failed"
+                self.failed_jobs += 1
+                logger.warning(f"Report job {job.job_id} failed: {e}", exc_info=True)
+            finally:
+                job.finished_at = time.time()
+                job.save()
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counts by status across all workers; queue depth and outcome counters of this worker."""
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "jobs": self.store.status_counts() if self.store is not None else {},
+            "completed_jobs": self.completed_jobs,
+            "failed_jobs": self.failed_jobs,
+        }
+
+
+report_job_queue = ReportJobQueue(
+    workers=settings.REPORT_JOB_WORKERS,
+    max_queued=settings.REPORT_JOB_QUEUE_SIZE,
+    retention_seconds=settings.REPORT_JOB_RETENTION_SECONDS,
+    db_path=os.path.join(GENERATED_REPORTS_DIR, REPORT_JOB_DB_FILE),
+)
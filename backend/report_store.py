@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from app.core.azure_client import GENERATED_REPORTS_DIR, _determine_time_period
+from app.core.config import settings
+from app.core.cost_cache import cost_cache_ttl_for_period
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed report files end in _<32 hex key><extension> (see generate_cost_report_file(report_key=...)).
+_KEYED_FILE_PATTERN = re.compile(r"_([0-9a-f]{32})(\.[a-z.]+)$")
+_PARTIAL_MARKER = ".partial."
+# Download link key used when REPORT_DOWNLOAD_SIGNING_KEY is unset; hidden, so it is never served or evicted.
+DOWNLOAD_SIGNING_KEY_FILE = ".download_signing_key"
+_download_signing_key: Optional[bytes] = None
+_download_signing_key_lock = threading.Lock()
+
+
+def build_report_key(
+    identity_hash: str,
+    subscription_id: str,
+    timeframe: str,
+    granularity: str,
+    from_date: Optional[Any],
+    to_date: Optional[Any],
+    tag_filters: Optional[List[Dict[str, Any]]],
+    file_format: str,
+    compress: bool
+) -> str:
+    """
+    Key of a report: a hash of the caller's identity and the normalized query and output format. Tag filters
+    are order-insensitive and names are case-normalized, so equal reports always map to the same file.
+    """
+    normalized = json.dumps({
+        "identity": identity_hash,
+        "subscription_id": subscription_id.lower(),
+        "timeframe": timeframe.lower(),
+        "granularity": granularity.lower(),
+        "from_date": str(from_date) if from_date else None,
+        "to_date": str(to_date) if to_date else None,
+        "tag_filters": sorted(
+            [[f["name"].lower(), f.get("operator", "In"), sorted(map(str, f.get("values") or []))] for f in tag_filters or []]
+        ),
+        "file_format": file_format.lower(),
+        "compress": bool(compress) and file_format.lower() == "csv",
+    }, sort_keys=True)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+def _load_or_create_signing_key(path: str) -> bytes:
+    """
+    The key in `path`, created first if missing. The new key is written to a private (0600) temporary file and
+    hard-linked into place, so workers starting at the same time all end up loading the one that won the race.
+    """
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        temporary_path = f"{path}.{secrets.token_hex(8)}.tmp"
+        descriptor = os.open(temporary_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(descriptor, "w") as key_file:
+                key_file.write(secrets.token_hex(32))
+            os.link(temporary_path, path)
+            logger.info(f"Created the report download signing key {path}.")
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temporary_path)
+    with open(path) as key_file:
+        return key_file.read().strip().encode("utf-8")
+
+
+def _signing_key() -> bytes:
+    """REPORT_DOWNLOAD_SIGNING_KEY, else the key file in GENERATED_REPORTS_DIR shared by all workers and restarts."""
+    global _download_signing_key
+    if _download_signing_key is None:
+        with _download_signing_key_lock:
+            if _download_signing_key is None:
+                configured = (settings.REPORT_DOWNLOAD_SIGNING_KEY or "").encode("utf-8")
+                _download_signing_key = configured or _load_or_create_signing_key(
+                    os.path.join(GENERATED_REPORTS_DIR, DOWNLOAD_SIGNING_KEY_FILE)
+                )
+    return _download_signing_key
+
+
+def sign_report_download(file_name: str, expires_at: int) -> str:
+    """HMAC signature of a download link for `file_name` that works until `expires_at` (epoch seconds)."""
+    return hmac.new(_signing_key(), f"{file_name}\n{expires_at}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def verify_report_download(file_name: str, expires_at: int, signature: str) -> bool:
+    """Whether a download link was issued by sign_report_download for this file and has not expired."""
+    return expires_at >= time.time() and hmac.compare_digest(sign_report_download(file_name, expires_at), signature)
+
+
+def report_ttl_for_query(timeframe: str, from_date: Optional[Any], to_date: Optional[Any]) -> Optional[float]:
+    """How long a report stays reusable: like cached query results, forever once its window has settled."""
+    return cost_cache_ttl_for_period(_determine_time_period(timeframe, from_date, to_date).to)
+
+
+class ReportStore:
+    """
+    Index and retention manager for GENERATED_REPORTS_DIR. Reports rendered with a report key are indexed by it,
+    so an identical request reuses the existing file while it is fresh (its mtime is within the caller's TTL).
+    The key is part of the file name, so the index is a cache of the directory: a miss rescans the file names,
+    which finds reports other workers rendered. A janitor task deletes files older than `max_age_seconds`,
+    then the least recently used ones (by access time, which lookups bump) while the directory holds more than
+    `max_bytes`; files written in the last `min_age_seconds` are never evicted for size, so a report is not
+    removed right after it was rendered.
+    """
+    def __init__(self, directory: str, max_bytes: int, max_age_seconds: float, min_age_seconds: float = 300):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.min_age_seconds = min_age_seconds
+        self._lock = threading.Lock()
+        self._index: Dict[str, str] = {}          # report key -> file path
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+
+    def _rebuild_index(self) -> None:
+        index: Dict[str, str] = {}
+        for entry in self._files():
+            match = _KEYED_FILE_PATTERN.search(entry.name)
+            if match and _PARTIAL_MARKER not in entry.name:
+                index[match.group(1)] = entry.path
+        self._index = index
+
+    def lookup(self, key: str, ttl_seconds: Optional[float]) -> Optional[str]:
+        """Path of the stored report for `key` if it exists and is younger than `ttl_seconds` (None: no expiry)."""
+        with self._lock:
+            path = self._index.get(key)
+            if path is None or not os.path.exists(path):
+                self._rebuild_index()
+                path = self._index.get(key)
+            try:
+                modified_at = os.path.getmtime(path) if path else None
+            except OSError:
+                modified_at = None
+            if modified_at is None or (ttl_seconds is not None and time.time() - modified_at > ttl_seconds):
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._touch(path, modified_at)
+            return path
+
+    def store(self, key: str, path: str) -> None:
+        with self._lock:
+            previous = self._index.get(key)
+            self._index[key] = path
+        if previous and previous != path and os.path.exists(previous):
+            self._remove(previous)
+
+    @staticmethod
+    def _touch(path: str, modified_at: float) -> None:
+        """Marks a report as used for the janitor's LRU order in every worker; the mtime (its age) is kept."""
+        try:
+            os.utime(path, (time.time(), modified_at))
+        except OSError:
+            pass
+
+    def _remove(self, path: str) -> int:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return 0
+        with self._lock:
+            for key in [key for key, indexed in self._index.items() if indexed == path]:
+                del self._index[key]
+            self.evicted_files += 1
+            self.evicted_bytes += size
+        return size
+
+    def _files(self) -> List[os.DirEntry]:
+        # Hidden files are the server's own state (the report job database, the signing key), not reports.
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return []
+        return [entry for entry in entries if entry.is_file() and not entry.name.startswith(".")]
+
+    def evict(self) -> int:
+        """One janitor pass: age-based, then size-based (least recently used first) eviction. Returns files removed."""
+        now = time.time()
+        removed = 0
+        remaining = []
+        for entry in self._files():
+            stat = entry.stat()
+            if now - stat.st_mtime > self.max_age_seconds:
+                self._remove(entry.path)
+                removed += 1
+            elif _PARTIAL_MARKER not in entry.name:
+                remaining.append((max(stat.st_atime, stat.st_mtime), stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, _, size, _ in remaining)
+        for _, modified_at, size, path in sorted(remaining):
+            if total_bytes <= self.max_bytes:
+                break
+            if now - modified_at < self.min_age_seconds:
+                continue
+            self._remove(path)
+            total_bytes -= size
+            removed += 1
+        if removed:
+            logger.info(f"Report store janitor removed {removed} files; {total_bytes} bytes remain in {self.directory}.")
+        return removed
+
+    def start_janitor(self, interval_seconds: float) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self._task is None:
+            self._task = asyncio.create_task(self._janitor(interval_seconds))
+
+    async def stop_janitor(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _janitor(self, interval_seconds: float) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.evict)
+            except Exception as e:
+                logger.warning(f"Report store janitor pass failed: {e}", exc_info=True)
+            await asyncio.sleep(interval_seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        files = [entry for entry in self._files() if _PARTIAL_MARKER not in entry.name]
+        lookups = self.hits + self.misses
+        return {
+            "directory": self.directory,
+            "files": len(files),
+            "bytes_stored": sum(entry.stat().st_size for entry in files),
+            "max_bytes": self.max_bytes,
+            "indexed_reports": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "reuse_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evicted_files": self.evicted_files,
+            "evicted_bytes": self.evicted_bytes,
+        }
+
+
+report_store = ReportStore(
+    GENERATED_REPORTS_DIR,
+    max_bytes=settings.REPORT_STORE_MAX_BYTES,
+    max_age_seconds=settings.REPORT_STORE_MAX_AGE_SECONDS,
+)
@@ -1,5 +1,227 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from fastapi import HTTPException, Security
 from fastapi.security import OAuth2PasswordBearer
 
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
 # OAuth2 scheme for Bearer token authentication
 # The tokenUrl is a dummy here as token acquisition is handled by the frontend (MSAL).
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
\ No newline at end of file
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+def get_token_claims(token: str) -> Dict[str, Any]:
+    """
+    Decodes the payload of the user's bearer token WITHOUT validating it.
+    Azure validates the token on every ARM call; the claims are only trusted for identity
+    (get_identity_hash) once token_verifier has seen Azure accept the token. Returns {} for opaque tokens.
+    """
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        return claims if isinstance(claims, dict) else {}
+    except (IndexError, ValueError):
+        return {}
+
+def get_token_tenant_id(token: str) -> str:
+    """Returns the tenant ('tid' claim) the token was issued for, or 'default' if it cannot be read."""
+    return str(get_token_claims(token).get("tid") or "default")
+
+def get_token_hash(token: str) -> str:
+    """Non-reversible identifier of the bearer token itself."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+def get_identity_hash(token: str) -> str:
+    """
+    Stable, non-reversible identifier for the caller, used to partition cached cost data, reports and jobs per identity.
+    Based on the tenant + object id claims so it survives token refreshes, but only once token_verifier has seen Azure
+    accept the token: the claims are not signature-checked here, so for any other token (forged claims included)
+    this hashes the token itself and nothing cached for the claimed identity is reachable.
+    """
+    claims = get_token_claims(token)
+    if claims.get("oid") and token_verifier.is_verified(token):
+        identity = f"{claims.get('tid', '')}:{claims['oid']}"
+    else:
+        identity = token
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()[:32]
+
+def get_verified_identity_hash(token: str) -> Optional[str]:
+    """get_identity_hash of a token token_verifier has seen Azure accept; None for any other token."""
+    return get_identity_hash(token) if token_verifier.is_verified(token) else None
+
+def get_token_expiry(token: str) -> Optional[float]:
+    """Returns the token's expiry ('exp' claim, epoch seconds), or None if it cannot be read."""
+    expires_on = get_token_claims(token).get("exp")
+    return float(expires_on) if isinstance(expires_on, (int, float)) else None
+
+
+class TokenVerifier:
+    """
+    Remembers which bearer tokens Azure Resource Manager has accepted. A token is verified with one cheap ARM call
+    (GET /tenants, which checks its signature, audience and expiry) the first time it is seen and stays verified
+    until its exp claim; concurrent requests with the same new token share that call. At most `max_tokens` verified
+    tokens are kept (least recently used dropped first, they are simply verified again).
+    """
+    def __init__(self, arm_endpoint: str, max_tokens: int, timeout_seconds: float):
+        self.arm_endpoint = arm_endpoint.rstrip("/")
+        self.max_tokens = max_tokens
+        self.timeout_seconds = timeout_seconds
+        self._verified: "OrderedDict[str, float]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._session = requests.Session()
+        self.verifications = 0
+        self.rejections = 0
+
+    def is_verified(self, token: str) -> bool:
+        token_hash = get_token_hash(token)
+        expires_at = self._verified.get(token_hash)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            self._verified.pop(token_hash, None)
+            return False
+        self._verified.move_to_end(token_hash)
+        return True
+
+    def _check_with_azure(self, token: str) -> int:
+        response = self._session.get(
+            f"{self.arm_endpoint}/tenants", params={"api-version": "2022-12-01"},
+            headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout_seconds
+        )
+        return response.status_code
+
+    async def _verify(self, token: str, token_hash: str) -> None:
+        try:
+            status_code = await asyncio.to_thread(self._check_with_azure, token)
+        except requests.RequestException as e:
+            logger.warning(f"Could not verify a bearer token with Azure Resource Manager: {e}")
+            raise HTTPException(status_code=503, detail="Could not verify the access token with Azure. Please try again.")
+        self.verifications += 1
+        if status_code in (401, 403):
+            self.rejections += 1
+            raise HTTPException(status_code=401, detail="Invalid or expired access token.", headers={"WWW-Authenticate": "Bearer"})
+        if status_code >= 400:
+            logger.warning(f"Azure Resource Manager answered {status_code} while verifying a bearer token.")
+            raise HTTPException(status_code=503, detail="Could not verify the access token with Azure. Please try again.")
+        self._verified[token_hash] = get_token_expiry(token) or time.time() + 3600
+        self._verified.move_to_end(token_hash)
+        while len(self._verified) > self.max_tokens:
+            self._verified.popitem(last=False)
+
+    async def verify(self, token: str) -> None:
+        """Returns once Azure has accepted the token; raises HTTPException 401 if it rejects it, 503 if it cannot be asked."""
+        if self.is_verified(token):
+            return
+        token_hash = get_token_hash(token)
+        task = self._inflight.get(token_hash)
+        if task is None:
+            task = asyncio.create_task(self._verify(token, token_hash))
+            self._inflight[token_hash] = task
+            task.add_done_callback(lambda _: self._inflight.pop(token_hash, None))
+        await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"verified_tokens": len(self._verified), "verifications": self.verifications, "rejections": self.rejections}
+
+
+class ScopePermissions:
+    """
+    Whether a caller may run an ARM action (e.g. Microsoft.CostManagement/query/read) on a scope, judged from the
+    caller's effective permissions there (GET {scope}/providers/Microsoft.Authorization/permissions). Permissions
+    are cached per verified identity and scope for `ttl_seconds`, at most `max_entries` of them (least recently
+    used dropped first). Unverified tokens and failed lookups are never allowed.
+    """
+    def __init__(self, arm_endpoint: str, ttl_seconds: float, max_entries: int, timeout_seconds: float):
+        self.arm_endpoint = arm_endpoint.rstrip("/")
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.timeout_seconds = timeout_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+        self._session = requests.Session()
+        self.lookups = 0
+        self.denials = 0
+
+    def _fetch_permissions(self, token: str, scope: str) -> List[Dict[str, Any]]:
+        permissions: List[Dict[str, Any]] = []
+        url: Optional[str] = f"{self.arm_endpoint}{scope}/providers/Microsoft.Authorization/permissions?api-version=2022-04-01"
+        while url:
+            response = self._session.get(url, headers={"Authorization": f"Bearer {token}"}, timeout=self.timeout_seconds)
+            response.raise_for_status()
+            body = response.json()
+            permissions.extend(body.get("value") or [])
+            url = body.get("nextLink")
+        return permissions
+
+    @staticmethod
+    def _matches(pattern: str, action: str) -> bool:
+        return re.fullmatch(re.escape(pattern).replace(r"\*", ".*"), action, flags=re.IGNORECASE) is not None
+
+    @classmethod
+    def permits(cls, permissions: List[Dict[str, Any]], action: str) -> bool:
+        """Whether any permission grants `action` (wildcards allowed) without excluding it in its notActions."""
+        return any(
+            any(cls._matches(pattern, action) for pattern in permission.get("actions") or [])
+            and not any(cls._matches(pattern, action) for pattern in permission.get("notActions") or [])
+            for permission in permissions
+        )
+
+    async def allows(self, token: str, scope: str, action: str) -> bool:
+        identity_hash = get_verified_identity_hash(token)
+        if identity_hash is None:
+            return False
+        key = (identity_hash, scope.lower())
+        cached = self._entries.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            permissions = cached[1]
+        else:
+            self.lookups += 1
+            try:
+                permissions = await asyncio.to_thread(self._fetch_permissions, token, scope)
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Could not read the caller's permissions on {scope}: {e}")
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, permissions)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        allowed = self.permits(permissions, action)
+        if not allowed:
+            self.denials += 1
+        return allowed
+
+    def stats(self) -> Dict[str, int]:
+        return {"cached_scopes": len(self._entries), "lookups": self.lookups, "denials": self.denials}
+
+
+token_verifier = TokenVerifier(
+    arm_endpoint=settings.AZURE_RESOURCE_MANAGER_ENDPOINT or "https://management.azure.com",
+    max_tokens=settings.TOKEN_VERIFIER_MAX_TOKENS,
+    timeout_seconds=settings.TOKEN_VERIFIER_TIMEOUT_SECONDS,
+)
+
+scope_permissions = ScopePermissions(
+    arm_endpoint=settings.AZURE_RESOURCE_MANAGER_ENDPOINT or "https://management.azure.com",
+    ttl_seconds=settings.SCOPE_PERMISSIONS_TTL_SECONDS,
+    max_entries=settings.SCOPE_PERMISSIONS_MAX_ENTRIES,
+    timeout_seconds=settings.TOKEN_VERIFIER_TIMEOUT_SECONDS,
+)
+
+async def verified_token(token: str = Security(oauth2_scheme)) -> str:
+    """
+    Bearer token dependency for every route: like oauth2_scheme, but the token has been accepted by Azure
+    (token_verifier) before anything cached, stored or queued for its identity is looked up.
+    """
+    await token_verifier.verify(token)
+    return token
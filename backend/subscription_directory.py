@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from app.core.azure_client import list_accessible_subscriptions
+from app.core.config import settings
+from app.core.security import get_identity_hash
+from app.models.cost import AzureSubscription
+
+logger = logging.getLogger(__name__)
+
+
+class _DirectoryEntry:
+    __slots__ = ("subscriptions", "by_id", "fetched_at")
+
+    def __init__(self, subscriptions: List[AzureSubscription]):
+        self.subscriptions = subscriptions
+        self.by_id: Dict[str, AzureSubscription] = {sub.subscription_id.lower(): sub for sub in subscriptions if sub.subscription_id}
+        self.fetched_at = time.monotonic()
+
+
+class SubscriptionDirectory:
+    """
+    Per-identity cache of the subscriptions a user can access, indexed by subscription id for O(1) name/state lookups.
+    Entries younger than `refresh_after_seconds` are served as is; older ones are still served while a background
+    refresh (with the current caller's token) replaces them; entries older than `ttl_seconds` are fetched again
+    before answering. Concurrent fetches for the same identity share one subscriptions.list() walk. At most
+    `max_identities` directories are kept (least recently used dropped first).
+    """
+    def __init__(self, ttl_seconds: float, refresh_after_seconds: float, max_identities: int):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_after_seconds = refresh_after_seconds
+        self.max_identities = max_identities
+        self._entries: "OrderedDict[str, _DirectoryEntry]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._background: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.background_refreshes = 0
+
+    async def _fetch(self, identity_hash: str, access_token: str) -> _DirectoryEntry:
+        task = self._inflight.get(identity_hash)
+        if task is None:
+            task = asyncio.create_task(list_accessible_subscriptions(access_token=access_token))
+            self._inflight[identity_hash] = task
+            task.add_done_callback(lambda _: self._inflight.pop(identity_hash, None))
+        subscriptions = await asyncio.shield(task)
+        entry = _DirectoryEntry(subscriptions)
+        self._entries[identity_hash] = entry
+        self._entries.move_to_end(identity_hash)
+        while len(self._entries) > self.max_identities:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def _refresh_in_background(self, identity_hash: str, access_token: str) -> None:
+        try:
+            await self._fetch(identity_hash, access_token)
+            self.background_refreshes += 1
+        except Exception as e:
+            logger.warning(f"Background refresh of the subscription directory failed: {e}")
+
+    async def _entry(self, access_token: str) -> _DirectoryEntry:
+        identity_hash = get_identity_hash(access_token)
+        entry = self._entries.get(identity_hash)
+        age = time.monotonic() - entry.fetched_at if entry is not None else None
+        if entry is None or age > self.ttl_seconds:
+            self.misses += 1
+            return await self._fetch(identity_hash, access_token)
+        self.hits += 1
+        self._entries.move_to_end(identity_hash)
+        if age > self.refresh_after_seconds and identity_hash not in self._inflight:
+            task = asyncio.create_task(self._refresh_in_background(identity_hash, access_token))
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+        return entry
+
+    async def list_subscriptions(self, access_token: str) -> List[AzureSubscription]:
+        """The caller's accessible subscriptions (list_accessible_subscriptions), from the cache when possible."""
+        return (await self._entry(access_token)).subscriptions
+
+    async def get(self, access_token: str, subscription_id: str) -> Optional[AzureSubscription]:
+        """The caller's subscription by id, or None if it is not in their directory."""
+        return (await self._entry(access_token)).by_id.get(subscription_id.lower())
+
+    async def display_name(self, access_token: str, subscription_id: str) -> str:
+        """Display name for responses; falls back to the id when the directory is unavailable or lacks it."""
+        try:
+            subscription = await self.get(access_token, subscription_id)
+        except Exception as e:
+            logger.warning(f"Could not resolve the name of subscription {subscription_id}: {e}")
+            return subscription_id
+        return subscription.display_name if subscription and subscription.display_name else subscription_id
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "identities": len(self._entries),
+            "subscriptions": sum(len(entry.subscriptions) for entry in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "background_refreshes": self.background_refreshes,
+        }
+
+
+subscription_directory = SubscriptionDirectory(
+    ttl_seconds=settings.SUBSCRIPTION_DIRECTORY_TTL_SECONDS,
+    refresh_after_seconds=settings.SUBSCRIPTION_DIRECTORY_REFRESH_SECONDS,
+    max_identities=settings.SUBSCRIPTION_DIRECTORY_MAX_IDENTITIES,
+)
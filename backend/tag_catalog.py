@@ -0,0 +1,126 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.azure_client import list_available_tags_for_subscription
+from app.core.config import settings
+from app.core.security import get_identity_hash
+
+logger = logging.getLogger(__name__)
+
+
+def _prefix_range(keys: List[str], prefix: str) -> Tuple[int, int]:
+    """Index range of the entries of sorted `keys` that start with `prefix`."""
+    start = bisect.bisect_left(keys, prefix)
+    return start, bisect.bisect_left(keys, prefix + "\U0010ffff", lo=start)
+
+
+class TagIndex:
+    """
+    Values of one tag, most used first (resource count desc, then value), with a case-insensitive prefix index.
+    """
+    __slots__ = ("tag_name", "count", "values", "value_counts", "_value_keys", "_value_ranks")
+
+    def __init__(self, tag_name: str, count: Optional[int], values: List[Optional[str]], value_counts: List[Optional[int]]):
+        ordered = sorted(zip(values, value_counts), key=lambda item: (-(item[1] or 0), item[0] or ""))
+        self.tag_name = tag_name
+        self.count = count
+        self.values = [value for value, _ in ordered]
+        self.value_counts = [value_count for _, value_count in ordered]
+        keyed = sorted(((value or "").casefold(), rank) for rank, value in enumerate(self.values))
+        self._value_keys = [key for key, _ in keyed]
+        self._value_ranks = [rank for _, rank in keyed]
+
+    def search_values(self, prefix: Optional[str]) -> List[int]:
+        """Ranks (positions in `values`) of the values starting with `prefix`, most used first."""
+        if not prefix:
+            return list(range(len(self.values)))
+        start, end = _prefix_range(self._value_keys, prefix.casefold())
+        return sorted(self._value_ranks[start:end])
+
+
+class TagCatalog:
+    """Tags of one subscription sorted by name, with a case-insensitive prefix index over names and values."""
+    def __init__(self, tags: List[Dict[str, Any]]):
+        self.tags = sorted(
+            (TagIndex(tag["tagName"], tag.get("count"), tag.get("values") or [], tag.get("value_counts") or [None] * len(tag.get("values") or []))
+             for tag in tags),
+            key=lambda tag: (tag.tag_name.casefold(), tag.tag_name)
+        )
+        self._name_keys = [tag.tag_name.casefold() for tag in self.tags]
+        self._by_name = {key: tag for key, tag in zip(self._name_keys, self.tags)}
+        self.built_at = time.monotonic()
+
+    @property
+    def value_total(self) -> int:
+        return sum(len(tag.values) for tag in self.tags)
+
+    def search_tags(self, prefix: Optional[str]) -> List[TagIndex]:
+        if not prefix:
+            return self.tags
+        start, end = _prefix_range(self._name_keys, prefix.casefold())
+        return self.tags[start:end]
+
+    def get(self, tag_name: str) -> Optional[TagIndex]:
+        return self._by_name.get(tag_name.casefold())
+
+
+class TagCatalogCache:
+    """
+    Per (identity, subscription) TagCatalog built from one tags.list() walk and kept for `ttl_seconds`, so the filter
+    UI can search and page through tags and values without the subscription's tags being fetched and sorted again
+    on every request. Concurrent builds for the same key share one walk; at most `max_catalogs` catalogs are kept
+    (least recently used dropped first).
+    """
+    def __init__(self, ttl_seconds: float, max_catalogs: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_catalogs = max_catalogs
+        self._catalogs: "OrderedDict[Tuple[str, str], TagCatalog]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, str], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def _build(self, access_token: str, subscription_id: str) -> TagCatalog:
+        tags = await list_available_tags_for_subscription(access_token=access_token, subscription_id=subscription_id)
+        catalog = TagCatalog(tags)
+        logger.info(f"Built tag catalog for subscription {subscription_id}: {len(catalog.tags)} tags, {catalog.value_total} values.")
+        return catalog
+
+    async def get(self, access_token: str, subscription_id: str) -> TagCatalog:
+        """The caller's tag catalog of the subscription, building it when missing or older than the TTL."""
+        key = (get_identity_hash(access_token), subscription_id.lower())
+        catalog = self._catalogs.get(key)
+        if catalog is not None and time.monotonic() - catalog.built_at <= self.ttl_seconds:
+            self.hits += 1
+            self._catalogs.move_to_end(key)
+            return catalog
+        self.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._build(access_token, subscription_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        catalog = await asyncio.shield(task)
+        self._catalogs[key] = catalog
+        self._catalogs.move_to_end(key)
+        while len(self._catalogs) > self.max_catalogs:
+            self._catalogs.popitem(last=False)
+        return catalog
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "catalogs": len(self._catalogs),
+            "tags": sum(len(catalog.tags) for catalog in self._catalogs.values()),
+            "values": sum(catalog.value_total for catalog in self._catalogs.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+tag_catalog_cache = TagCatalogCache(
+    ttl_seconds=settings.COST_CACHE_TAGS_TTL_SECONDS,
+    max_catalogs=settings.TAG_CATALOG_MAX_SUBSCRIPTIONS,
+)
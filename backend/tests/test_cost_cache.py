@@ -0,0 +1,88 @@
+"""
+Tests of the cost result cache backends (cost_cache.py). Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_cost_cache.py
+"""
+import asyncio
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from app.core.cost_cache import CostCacheBackend, CostResultCache, RedisCacheBackend, SQLiteCacheBackend
+
+
+class FakeRedisClient:
+    """The subset of redis.Redis used by RedisCacheBackend; values come back as bytes like the real client."""
+    def __init__(self):
+        self.values: Dict[str, Tuple[bytes, Optional[int]]] = {}
+        self.closed = False
+
+    def get(self, name: str) -> Optional[bytes]:
+        entry = self.values.get(name)
+        return entry[0] if entry is not None else None
+
+    def set(self, name: str, value: Any, ex: Optional[int] = None) -> bool:
+        self.values[name] = (value.encode("utf-8") if isinstance(value, str) else value, ex)
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        CostCacheBackend()
+
+
+def test_redis_backend_with_injected_client():
+    client = FakeRedisClient()
+    backend = RedisCacheBackend(key_prefix="test:", client=client)
+
+    backend.set("a", '{"total": 1}', ttl_seconds=90.5)
+    backend.set("b", "[]", ttl_seconds=None)
+    backend.set("c", "[]", ttl_seconds=0.2)
+
+    assert client.values["test:a"] == (b'{"total": 1}', 90)
+    assert client.values["test:b"] == (b"[]", None)
+    assert client.values["test:c"][1] == 1  # Redis expiries are whole seconds, at least 1
+    assert backend.get("a") == '{"total": 1}'
+    assert backend.get("missing") is None
+    backend.close()
+    assert client.closed
+
+
+def test_cost_result_cache_round_trip_through_redis():
+    client = FakeRedisClient()
+    cache = CostResultCache(RedisCacheBackend(client=client))
+    value = [12.5, "USD", {"caz-a": 12.5}, {"amount": [12.5]}]
+
+    async def round_trip():
+        assert await cache.get("subscription-actuals:x:y") is None
+        await cache.set("subscription-actuals:x:y", value, ttl_seconds=3600)
+        return await cache.get("subscription-actuals:x:y")
+
+    assert asyncio.run(round_trip()) == value
+    assert list(client.values) == ["cost:subscription-actuals:x:y"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_sqlite_backend_tracks_size_and_evicts_least_recently_used(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    backend.set("a", "x" * 10, ttl_seconds=None)
+    backend.set("b", "y" * 10, ttl_seconds=None)
+    backend.set("a", "x" * 5, ttl_seconds=None)  # Replacing an entry updates the tracked size
+    assert backend.stats()["bytes"] == 15
+
+    backend.get("a")
+    backend.set("c", "z" * 10, ttl_seconds=None)  # 25 bytes: still within the budget
+    backend.set("d", "w" * 10, ttl_seconds=None)  # Over budget: "b" is the least recently used
+    assert backend.get("b") is None
+    assert backend.get("a") == "x" * 5
+    assert backend.stats()["bytes"] == 25
+    assert backend.evictions == 1
+
+    # A second connection (another worker) sees the same tracked size.
+    backend.close()
+    reopened = SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes=25)
+    assert reopened.stats()["bytes"] == 25
+    reopened.close()
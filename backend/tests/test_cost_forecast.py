@@ -0,0 +1,71 @@
+"""
+Tests of the local cost forecast (cost_forecast.py). Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_cost_forecast.py
+"""
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app.core.cost_forecast import CostProjection, forecast_daily
+from app.core.cost_warehouse import day_key
+
+TODAY = date(2024, 5, 15)  # A Wednesday
+FIRST_DAY = TODAY - timedelta(days=41)
+
+
+def weekly_cost(day: date) -> float:
+    """A strictly weekly pattern: Monday 10, Tuesday 20, ... Sunday 70."""
+    return 10.0 * (day.weekday() + 1)
+
+
+def daily_rows(cost_of_day, first_day: date = FIRST_DAY, today: date = TODAY):
+    rows = []
+    day = first_day
+    while day <= today:
+        rows.append((day_key(day), "caz-a", None, "USD", cost_of_day(day)))
+        day += timedelta(days=1)
+    return rows
+
+
+def test_weekday_seasonal_continues_weekly_pattern():
+    # Today's (incomplete) costs are deliberately off-pattern; they must not shift the forecast.
+    rows = daily_rows(lambda day: 0.5 if day == TODAY else weekly_cost(day))
+    horizon_end = TODAY + timedelta(days=14)
+    projection = CostProjection(rows, FIRST_DAY, TODAY, horizon_end, "weekday_seasonal", lookback_days=28)
+
+    expected = [weekly_cost(TODAY + timedelta(days=offset)) for offset in range(1, 15)]
+    assert projection.forecast.shape == (1, 14)
+    assert projection.forecast[0].tolist() == pytest.approx(expected)
+
+
+def test_weekday_seasonal_daily_entries_are_dated_by_forecast_day():
+    rows = daily_rows(weekly_cost)
+    horizon_end = TODAY + timedelta(days=7)
+    projection = CostProjection(rows, FIRST_DAY, TODAY, horizon_end, "weekday_seasonal", lookback_days=28)
+
+    entries = projection.daily_entries(TODAY, horizon_end)
+    assert [entry["entry_type"] for entry in entries] == ["actual"] + ["forecast"] * 7
+    for entry in entries:
+        assert entry["amount"] == pytest.approx(weekly_cost(date.fromisoformat(entry["date"])))
+
+
+def test_linear_trend_extrapolates_from_tomorrow():
+    rows = daily_rows(lambda day: 100.0 + 2.0 * (day - FIRST_DAY).days)
+    projection = CostProjection(rows, FIRST_DAY, TODAY, TODAY + timedelta(days=3), "linear_trend", lookback_days=28)
+
+    expected = [100.0 + 2.0 * ((TODAY - FIRST_DAY).days + offset) for offset in range(1, 4)]
+    assert projection.forecast[0].tolist() == pytest.approx(expected)
+
+
+def test_forecast_daily_starts_the_day_after_the_history():
+    first_forecast_day = date(2024, 5, 13)  # A Monday
+    history_days = [first_forecast_day - timedelta(days=offset) for offset in range(21, 0, -1)]
+    history = np.array([[weekly_cost(day) for day in history_days]])
+
+    forecast = forecast_daily(history, first_forecast_day, 7, "weekday_seasonal")
+    assert forecast[0].tolist() == pytest.approx([10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0])
+
+    trend = forecast_daily(np.array([[1.0, 2.0, 3.0, 4.0]]), first_forecast_day, 2, "linear_trend")
+    assert trend[0].tolist() == pytest.approx([5.0, 6.0])
@@ -0,0 +1,166 @@
+"""
+Parity tests of the columnar cost parser (cost_parser.py) against the row-by-row parser in azure_client.
+Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_cost_parser.py
+"""
+import random
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+from app.core.azure_client import RowCostAccumulator, _parse_cost_management_query_result_rows
+from app.core.cost_parser import ColumnarCostAccumulator, parse_query_result_columnar
+
+RESOURCE_GROUPS = ["caz-app", "caz-data", "CAZ-upper", "legacy", "", None]
+CURRENCIES = ["USD", "EUR", None]
+
+
+def columns(*names: str) -> List[SimpleNamespace]:
+    return [SimpleNamespace(name=name) for name in names]
+
+
+def query_result(column_names: List[str], rows: List[List[Any]]) -> SimpleNamespace:
+    return SimpleNamespace(columns=columns(*column_names), rows=rows, next_link=None)
+
+
+def daily_rows(seed: int, count: int, with_flag: bool = False) -> List[List[Any]]:
+    """Cost, UsageDate, ResourceGroupName, ResourceId, Currency[, IsActualCost] with every kind of irregular row."""
+    rng = random.Random(seed)
+    today = datetime.now(timezone.utc).date()
+    rows = []
+    for index in range(count):
+        day = today + timedelta(days=rng.randint(-40, 5))  # Some future days: forecasts for Daily granularity
+        usage_date = rng.choice([int(day.strftime("%Y%m%d")), day.isoformat(), f"{day.isoformat()}T00:00:00", day.strftime("%Y%m%d")])
+        row: List[Any] = [
+            rng.uniform(0, 50) / 3, usage_date, rng.choice(RESOURCE_GROUPS),
+            rng.choice([f"/subscriptions/s/resourcegroups/rg/providers/x/{rng.randrange(20)}", None]), rng.choice(CURRENCIES)
+        ]
+        if with_flag:
+            row.append(rng.choice([True, False, None]))
+        quirk = index % 29
+        if quirk == 1:
+            row = row[:3]  # Ragged: no resource id or currency (skipped)
+        elif quirk == 2:
+            row = row[:4] if not with_flag else row[:5]  # Ragged: trailing cells missing
+        elif quirk == 3:
+            row[0] = "n/a"  # Non-numeric cost (skipped)
+        elif quirk == 4:
+            row[0] = None
+        elif quirk == 5:
+            row[1] = "not a date"
+        elif quirk == 6:
+            row[0] = str(row[0])  # Numeric string cost
+        rows.append(row)
+    return rows
+
+
+def monthly_rows(seed: int, count: int) -> List[List[Any]]:
+    rng = random.Random(seed)
+    rows = []
+    for index in range(count):
+        month = date(2024, rng.randint(1, 12), 1)
+        row: List[Any] = [rng.uniform(0, 500), f"{month.isoformat()}T00:00:00", rng.choice(RESOURCE_GROUPS), rng.choice(CURRENCIES)]
+        if index % 17 == 1:
+            row = row[:2]
+        rows.append(row)
+    return rows
+
+
+def entries(table_or_records: Any) -> List[dict]:
+    return [dict(entry) for entry in table_or_records]
+
+
+def assert_same(columnar: Any, rows_result: Any) -> None:
+    total, currency, by_key, table = columnar
+    expected_total, expected_currency, expected_by_key, expected_entries = rows_result
+    assert total == expected_total
+    assert currency == expected_currency
+    assert by_key == expected_by_key
+    assert entries(table) == entries(expected_entries)
+
+
+DAILY_COLUMNS = ["Cost", "UsageDate", "ResourceGroupName", "ResourceId", "Currency"]
+MONTHLY_COLUMNS = ["Cost", "BillingMonth", "ResourceGroupName", "Currency"]
+
+
+@pytest.mark.parametrize("include_rg", [True, False])
+@pytest.mark.parametrize("granularity", ["Daily", "None"])
+def test_single_page_parity(include_rg: bool, granularity: str):
+    result = query_result(DAILY_COLUMNS, daily_rows(seed=1, count=3000))
+    assert_same(
+        parse_query_result_columnar(result, include_rg, granularity),
+        _parse_cost_management_query_result_rows(result, include_rg, granularity)
+    )
+
+
+@pytest.mark.parametrize("include_rg", [True, False])
+def test_monthly_parity(include_rg: bool):
+    result = query_result(MONTHLY_COLUMNS, monthly_rows(seed=2, count=1000))
+    columnar = parse_query_result_columnar(result, include_rg, "Monthly")
+    assert_same(columnar, _parse_cost_management_query_result_rows(result, include_rg, "Monthly"))
+    if not include_rg:
+        assert set(columnar[2]) <= {(2024, month) for month in range(1, 13)}  # Monthly totals, not resource groups
+
+
+def test_forecast_flag_parity():
+    result = query_result(DAILY_COLUMNS + ["IsActualCost"], daily_rows(seed=3, count=2000, with_flag=True))
+    for include_rg in (True, False):
+        assert_same(
+            parse_query_result_columnar(result, include_rg, "Daily", "forecast"),
+            _parse_cost_management_query_result_rows(result, include_rg, "Daily", "forecast")
+        )
+
+
+def test_rg_prefix_filter_and_mixed_currency():
+    rows = [
+        [1.0, 20240301, "caz-app", None, "USD"],
+        [2.0, 20240301, "CAZ-upper", None, "EUR"],  # The prefix match is case-sensitive
+        [4.0, 20240302, "legacy", None, "EUR"],
+        [8.0, 20240302, None, None, "GBP"],
+        [16.0, 20240303, "caz-data", None, "GBP"],
+    ]
+    result = query_result(DAILY_COLUMNS, rows)
+    columnar = parse_query_result_columnar(result, True, "Daily")
+    assert_same(columnar, _parse_cost_management_query_result_rows(result, True, "Daily"))
+    total, currency, by_rg, table = columnar
+    assert total == 31.0
+    assert currency == "EUR"  # The first currency other than USD
+    assert by_rg == {"caz-app": 1.0, "caz-data": 16.0}
+    assert [entry["resourceGroupName"] for entry in table] == ["caz-app", "caz-data"]
+
+
+@pytest.mark.parametrize("include_rg,granularity,column_names,make_rows", [
+    (True, "Daily", DAILY_COLUMNS, daily_rows),
+    (False, "None", DAILY_COLUMNS, daily_rows),
+    (False, "Monthly", MONTHLY_COLUMNS, monthly_rows),
+    (True, "Monthly", MONTHLY_COLUMNS, monthly_rows),
+])
+def test_paged_accumulators_match_one_result(include_rg, granularity, column_names, make_rows):
+    rows = make_rows(4, 2500)
+    expected = _parse_cost_management_query_result_rows(query_result(column_names, rows), include_rg, granularity)
+    page_sizes = [1, 700, 0, 999, 1000]  # Uneven pages, including an empty one
+    for accumulator in (ColumnarCostAccumulator(include_rg, granularity), RowCostAccumulator(include_rg, granularity)):
+        start = 0
+        for size in page_sizes:
+            accumulator.add_page(columns(*column_names), rows[start:start + size])
+            start += size
+        accumulator.add_page(columns(*column_names), rows[start:])
+        assert_same(accumulator.result(), expected)
+
+
+def test_missing_essential_columns_raise():
+    result = query_result(["Cost", "UsageDate"], [[1.0, 20240301]])
+    with pytest.raises(ValueError):
+        parse_query_result_columnar(result)
+    with pytest.raises(ValueError):
+        _parse_cost_management_query_result_rows(result)
+
+
+def test_empty_results():
+    empty = query_result(DAILY_COLUMNS, [])
+    assert parse_query_result_columnar(empty) is None  # The row parser reports empty results
+    assert _parse_cost_management_query_result_rows(empty) == (0.0, "USD", {}, [])
+    assert ColumnarCostAccumulator().result()[:3] == RowCostAccumulator().result()[:3] == (0.0, "USD", {})
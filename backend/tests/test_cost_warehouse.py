@@ -0,0 +1,118 @@
+"""
+Tests of the cost warehouse's incremental bookkeeping (cost_warehouse.py): the settled-days watermark, the days
+due for ingestion and the incremental refresh of requests. Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_cost_warehouse.py
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterator, List
+
+import pytest
+
+from app.core import cost_warehouse as warehouse_module
+from app.core.config import settings
+from app.core.cost_warehouse import CostWarehouse, contiguous_windows, day_key, history_floor, iter_days
+
+TODAY = datetime.now(timezone.utc).date()
+
+
+@pytest.fixture
+def warehouse(tmp_path, monkeypatch) -> Iterator[CostWarehouse]:
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_HISTORY_DAYS", 30)
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_UNSETTLED_DAYS", 3)
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_FRESHNESS_SECONDS", 3600)
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_INCREMENTAL_MAX_DAYS", 7)
+    # Tokens are "verified" as themselves; "stranger" never reached Azure.
+    monkeypatch.setattr(warehouse_module, "get_verified_identity_hash", lambda token: None if token == "stranger" else f"identity-{token}")
+    store = CostWarehouse(str(tmp_path / "warehouse.sqlite3"))
+    store.open()
+    yield store
+    store.close()
+
+
+def store(warehouse: CostWarehouse, first_day: date, last_day: date) -> None:
+    rows = [(day_key(day), "caz-app", None, "EUR", 1.5) for day in iter_days(first_day, last_day)]
+    warehouse.store_days("S1", first_day, last_day, rows)
+
+
+def last_settled_day() -> date:
+    return TODAY - timedelta(days=settings.COST_WAREHOUSE_UNSETTLED_DAYS + 1)
+
+
+def test_watermark_advances_over_contiguous_settled_days_only(warehouse):
+    floor = history_floor()
+    store(warehouse, floor + timedelta(days=1), floor + timedelta(days=5))
+    assert warehouse.watermark("s1") is None  # The run has to start at the history floor
+
+    store(warehouse, floor, floor)
+    assert warehouse.watermark("s1") == floor + timedelta(days=5)
+
+    store(warehouse, floor + timedelta(days=8), floor + timedelta(days=12))
+    assert warehouse.watermark("s1") == floor + timedelta(days=5)  # Days 6 and 7 are missing
+
+    store(warehouse, floor + timedelta(days=6), floor + timedelta(days=7))
+    assert warehouse.watermark("s1") == floor + timedelta(days=12)
+
+    # Days ingested before they settled are not final, so the watermark stops in front of them.
+    store(warehouse, floor + timedelta(days=13), TODAY)
+    assert warehouse.watermark("S1") == last_settled_day()
+
+
+def test_days_to_ingest_skips_final_days_and_refetches_stale_trailing_days(warehouse, monkeypatch):
+    floor = history_floor()
+    store(warehouse, floor, TODAY - timedelta(days=12))
+    store(warehouse, TODAY - timedelta(days=10), TODAY)
+    assert warehouse.days_to_ingest("s1", floor, TODAY) == [TODAY - timedelta(days=11)]  # Only the missing day
+
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_FRESHNESS_SECONDS", -1)  # Every unsettled day is now stale
+    unsettled: List[date] = list(iter_days(last_settled_day() + timedelta(days=1), TODAY))
+    assert warehouse.days_to_ingest("s1", floor, TODAY) == [TODAY - timedelta(days=11)] + unsettled
+
+    # Once the gap is filled the watermark covers everything settled; only the trailing days stay due.
+    store(warehouse, TODAY - timedelta(days=11), TODAY - timedelta(days=11))
+    assert warehouse.watermark("s1") == last_settled_day()
+    assert warehouse.days_to_ingest("s1", floor, TODAY) == unsettled
+    assert warehouse.days_to_ingest("s1", floor, last_settled_day()) == []
+
+
+def test_refreshable_days_refetches_small_gaps_incrementally(warehouse, monkeypatch):
+    floor = history_floor()
+    store(warehouse, floor, TODAY)
+    warehouse.register_access("alice", "S1")
+    window_first = TODAY - timedelta(days=20)
+
+    assert warehouse.refreshable_days("alice", "s1", window_first, TODAY) == []
+    assert warehouse.refreshable_days("stranger", "s1", window_first, TODAY) is None  # No verified access
+    assert warehouse.refreshable_days("bob", "s1", window_first, TODAY) is None  # Never queried the subscription
+    assert warehouse.refreshable_days("alice", "s1", TODAY + timedelta(days=1), TODAY + timedelta(days=5)) is None
+
+    monkeypatch.setattr(settings, "COST_WAREHOUSE_FRESHNESS_SECONDS", -1)
+    stale = warehouse.refreshable_days("alice", "s1", window_first, TODAY + timedelta(days=3))
+    assert stale == list(iter_days(last_settled_day() + timedelta(days=1), TODAY))  # The window is capped at today
+
+
+def test_refreshable_days_falls_back_to_azure_beyond_the_incremental_limit(warehouse):
+    floor = history_floor()
+    gap = TODAY - timedelta(days=settings.COST_WAREHOUSE_INCREMENTAL_MAX_DAYS + 1)
+    store(warehouse, floor, gap - timedelta(days=1))
+    store(warehouse, gap + timedelta(days=1), TODAY)
+    warehouse.register_access("alice", "s1")
+
+    assert warehouse.refreshable_days("alice", "s1", floor, TODAY) is None
+    # A window after the gap is still refreshed locally.
+    assert warehouse.refreshable_days("alice", "s1", gap + timedelta(days=1), TODAY) == []
+
+    # A subscription missing exactly the last COST_WAREHOUSE_INCREMENTAL_MAX_DAYS days refreshes them itself.
+    recent_gap = TODAY - timedelta(days=settings.COST_WAREHOUSE_INCREMENTAL_MAX_DAYS)
+    warehouse.store_days("s2", floor, recent_gap - timedelta(days=1), [])
+    warehouse.register_access("alice", "s2")
+    assert warehouse.refreshable_days("alice", "s2", floor, TODAY) == list(iter_days(recent_gap, TODAY))
+
+
+def test_contiguous_windows_split_at_gaps_and_month_ends():
+    days = [date(2024, 1, 30), date(2024, 1, 31), date(2024, 2, 1), date(2024, 2, 2), date(2024, 2, 5), date(2024, 2, 6)]
+    assert contiguous_windows(days) == [
+        (date(2024, 1, 30), date(2024, 1, 31)), (date(2024, 2, 1), date(2024, 2, 2)), (date(2024, 2, 5), date(2024, 2, 6))
+    ]
+    assert contiguous_windows([date(2024, 3, 1)]) == [(date(2024, 3, 1), date(2024, 3, 1))]
+    assert contiguous_windows([]) == []
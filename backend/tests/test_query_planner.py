@@ -0,0 +1,176 @@
+"""
+Parity tests of the query planner (query_planner.py): slicing the canonical Daily superset must give the same
+totals, resource group costs and entries as querying the window directly, and month shards merged by
+ShardRowMerger the same as the unsharded query. Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_query_planner.py
+"""
+import random
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pytest
+
+from app.core.azure_client import _determine_time_period, _parse_cost_management_query_result_rows
+from app.core.cost_warehouse import day_key, iter_days
+from app.core.query_planner import (
+    ShardRowMerger, finer_grouping, month_shards, plan_window, slice_rows, superset_grouping, superset_window
+)
+
+RESOURCE_GROUPS = ["caz-app", "caz-data", "other", None]
+RESOURCE_IDS = ["/subscriptions/s1/resourcegroups/rg/providers/x/vm1", "/subscriptions/s1/resourcegroups/rg/providers/x/vm2", None]
+GROUPINGS = [[], ["ResourceGroupName"], ["ResourceGroupName", "ResourceID"]]
+GRANULARITIES = ["None", "Daily", "Monthly"]
+
+
+def cost_rows(first_day: date, last_day: date, seed: int) -> List[Tuple[int, Optional[str], Optional[str], str, float]]:
+    """Daily (YYYYMMDD, resource group, resource id, currency, cost) rows; costs are multiples of 0.25, so sums are exact."""
+    rng = random.Random(seed)
+    rows = []
+    for day in iter_days(first_day, last_day):
+        for _ in range(rng.randint(0, 6)):
+            rows.append((day_key(day), rng.choice(RESOURCE_GROUPS), rng.choice(RESOURCE_IDS), rng.choice(["EUR", "USD"]), rng.randint(1, 400) / 4))
+    return rows
+
+
+def direct_query(rows: Sequence[Sequence[Any]], first_day: date, last_day: date, granularity: str, grouping: Sequence[str]) -> Tuple[List[str], List[List[Any]]]:
+    """What Cost Management returns for the window itself: the same aggregation, in no particular row order."""
+    granularity = granularity.lower()
+    sums: Dict[Tuple[Any, ...], float] = {}
+    for usage_date, resource_group, resource_id, currency, cost in rows:
+        if not day_key(first_day) <= usage_date <= day_key(last_day):
+            continue
+        key: Tuple[Any, ...] = ()
+        if granularity == "daily":
+            key += (usage_date,)
+        elif granularity == "monthly":
+            key += (f"{usage_date // 10000:04d}-{usage_date // 100 % 100:02d}-01T00:00:00",)
+        if "ResourceGroupName" in grouping:
+            key += (resource_group,)
+        if "ResourceID" in grouping:
+            key += (resource_id,)
+        key += (currency,)
+        sums[key] = sums.get(key, 0.0) + cost
+    columns = ["Cost"] + {"daily": ["UsageDate"], "monthly": ["BillingMonth"]}.get(granularity, [])
+    columns += [name if name != "ResourceID" else "ResourceId" for name in grouping] + ["Currency"]
+    result = [[cost, *key] for key, cost in sums.items()]
+    random.Random(len(result)).shuffle(result)
+    return columns, result
+
+
+def superset_rows(rows: Sequence[Sequence[Any]], window: Tuple[date, date], grouping: Sequence[str]) -> List[List[Any]]:
+    """The superset query's rows, as fetch_daily_cost_rows returns them (None for dimensions not grouped by)."""
+    _, daily = direct_query(rows, window[0], window[1], "Daily", grouping)
+    by_resource_group, by_resource = "ResourceGroupName" in grouping, "ResourceID" in grouping
+    return [
+        [row[1], row[2] if by_resource_group else None, row[2 + by_resource_group] if by_resource else None, row[-1], row[0]]
+        for row in daily
+    ]
+
+
+def parsed(columns: List[str], rows: List[List[Any]], granularity: str) -> Tuple[float, str, Dict[str, float], List[tuple]]:
+    result = SimpleNamespace(columns=[SimpleNamespace(name=name) for name in columns], rows=rows, next_link=None)
+    total, currency, by_rg, entries = _parse_cost_management_query_result_rows(result, True, granularity)
+    return total, currency, by_rg, sorted(tuple(sorted(dict(entry).items(), key=str)) for entry in entries)
+
+
+def assert_slice_matches_direct(rows, superset: Tuple[date, date], window: Tuple[date, date], granularity: str, grouping: List[str]) -> None:
+    sliced = slice_rows(superset_rows(rows, superset, superset_grouping(grouping)), window[0], window[1], granularity, grouping)
+    assert parsed(*sliced, granularity) == parsed(*direct_query(rows, window[0], window[1], granularity, grouping), granularity)
+
+
+def timeframe_windows(today: date) -> Dict[str, Tuple[date, date]]:
+    return {
+        "MonthToDate": (today.replace(day=1), today),
+        "TheLast7Days": (today - timedelta(days=6), today),
+        "TheLast30Days": (today - timedelta(days=29), today),
+    }
+
+
+@pytest.mark.parametrize("grouping", GROUPINGS)
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+@pytest.mark.parametrize("timeframe", ["MonthToDate", "TheLast7Days", "TheLast30Days"])
+def test_planned_timeframes_match_direct_queries(timeframe, granularity, grouping):
+    time_period = _determine_time_period(timeframe)
+    window = (time_period.from_property.date(), time_period.to.date())
+    superset = plan_window(window[0], window[1], granularity)
+    assert superset == superset_window()
+    rows = cost_rows(superset[0] - timedelta(days=5), superset[1], seed=1)  # Also days before the superset
+    assert_slice_matches_direct(rows, superset, window, granularity, grouping)
+
+
+# Month, quarter, leap-day and year boundaries: the 30-day and 7-day windows span two months.
+BOUNDARY_TODAYS = [date(2024, 3, 1), date(2024, 3, 3), date(2024, 2, 29), date(2024, 7, 31), date(2025, 1, 2)]
+
+
+@pytest.mark.parametrize("grouping", GROUPINGS)
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+@pytest.mark.parametrize("today", BOUNDARY_TODAYS)
+def test_month_boundary_windows_match_direct_queries(today, granularity, grouping):
+    superset = superset_window(today)
+    rows = cost_rows(superset[0] - timedelta(days=3), today, seed=today.toordinal())
+    for window in timeframe_windows(today).values():
+        assert superset[0] <= window[0] and window[1] == superset[1]
+        assert_slice_matches_direct(rows, superset, window, granularity, grouping)
+    # A Custom window inside the superset that crosses the month boundary.
+    assert_slice_matches_direct(rows, superset, (superset[0] + timedelta(days=1), today - timedelta(days=1)), granularity, grouping)
+
+
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+def test_finer_superset_serves_coarser_groupings(granularity):
+    today = date(2024, 3, 10)
+    superset = superset_window(today)
+    rows = cost_rows(superset[0], today, seed=7)
+    finer = superset_rows(rows, superset, finer_grouping([]))
+    for grouping in GROUPINGS[:2]:
+        for window in timeframe_windows(today).values():
+            sliced = slice_rows(finer, window[0], window[1], granularity, grouping)
+            assert parsed(*sliced, granularity) == parsed(*direct_query(rows, window[0], window[1], granularity, grouping), granularity)
+
+
+def test_superset_window_and_groupings():
+    assert superset_window(date(2024, 3, 5)) == (date(2024, 2, 5), date(2024, 3, 5))  # Back 29 days
+    assert superset_window(date(2024, 3, 31)) == (date(2024, 3, 1), date(2024, 3, 31))  # Back to the first of the month
+    assert superset_grouping([]) == superset_grouping(["ResourceGroupName"]) == ["ResourceGroupName"]
+    assert superset_grouping(["ResourceGroupName", "ResourceID"]) == ["ResourceGroupName", "ResourceID"]
+    assert superset_grouping(["ResourceID"], resource_group="caz-app") == ["ResourceID"]
+    assert superset_grouping([], resource_group="caz-app") == []
+    assert finer_grouping(["ResourceGroupName"]) == ["ResourceGroupName", "ResourceID"]
+    assert finer_grouping([], resource_group="caz-app") == ["ResourceID"]
+    assert finer_grouping(["ResourceGroupName", "ResourceID"]) is None
+
+
+def test_plan_window_rejects_uncovered_requests():
+    today = datetime.now(timezone.utc).date()
+    first, last = superset_window()
+    assert plan_window(first, last, "Daily") == (first, last)
+    assert plan_window(first - timedelta(days=1), last, "None") is None  # Starts before the superset
+    assert plan_window(first, today + timedelta(days=1), "None") is None  # Ends in the future
+    assert plan_window(last, first, "None") is None
+    assert plan_window(first, last, "Weekly") is None
+
+
+@pytest.mark.parametrize("grouping", GROUPINGS)
+@pytest.mark.parametrize("granularity", GRANULARITIES)
+def test_merged_month_shards_match_the_unsharded_query(granularity, grouping):
+    first_day, last_day = date(2024, 1, 17), date(2024, 4, 9)
+    rows = cost_rows(first_day, last_day, seed=3)
+    shards = month_shards(first_day, last_day, min_days=31)
+    assert shards[0] == (date(2024, 1, 17), date(2024, 1, 31)) and shards[-1] == (date(2024, 4, 1), date(2024, 4, 9))
+    merger = ShardRowMerger()
+    for shard_first, shard_last in shards:
+        columns, shard_rows = direct_query(rows, shard_first, shard_last, granularity, grouping)
+        half = len(shard_rows) // 2
+        merger.add_page(columns, shard_rows[:half])
+        # Later pages may list the columns in another order.
+        order = list(reversed(range(len(columns))))
+        merger.add_page([columns[idx] for idx in order], [[row[idx] for idx in order] for row in shard_rows[half:]])
+    assert parsed(*merger.result(), granularity) == parsed(*direct_query(rows, first_day, last_day, granularity, grouping), granularity)
+
+
+def test_shard_row_merger_edge_cases():
+    assert month_shards(date(2024, 1, 17), date(2024, 2, 10), min_days=31) == [(date(2024, 1, 17), date(2024, 2, 10))]
+    assert ShardRowMerger().result() == (["Cost", "Currency"], [])
+    with pytest.raises(ValueError):
+        ShardRowMerger().add_page(["UsageDate", "Currency"], [[20240101, "EUR"]])
@@ -0,0 +1,85 @@
+"""
+Tests of the Azure request scheduler (rate_limiter.py). Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_rate_limiter.py
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.rate_limiter import AzureRequestScheduler, _retry_after_seconds
+
+
+def make_scheduler(**overrides) -> AzureRequestScheduler:
+    options = dict(
+        max_concurrent_per_scope=4, low_quota_threshold=0, low_quota_delay_seconds=5.0,
+        default_retry_after_seconds=10.0, max_retry_after_seconds=300.0, max_tracked_keys=100
+    )
+    options.update(overrides)
+    return AzureRequestScheduler(**options)
+
+
+def throttled_response(headers):
+    return SimpleNamespace(status_code=429, response=SimpleNamespace(headers=headers))
+
+
+def blocked_for(scheduler: AzureRequestScheduler, key: str) -> float:
+    return scheduler.metrics()["scopes"][key]["blocked_for_seconds"]
+
+
+def test_retry_after_delta_seconds_and_http_date():
+    assert _retry_after_seconds("30") == 30.0
+    assert _retry_after_seconds(" 1.5 ") == 1.5
+    in_two_minutes = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=120), usegmt=True)
+    assert _retry_after_seconds(in_two_minutes) == pytest.approx(120, abs=2)
+    assert _retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # In the past: retry now
+    assert _retry_after_seconds("soon") is None
+
+
+def test_http_date_retry_after_blocks_until_that_date():
+    scheduler = make_scheduler()
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+
+    async def throttled_call():
+        async with scheduler.slot("tenant", "/subscriptions/a") as slot:
+            slot.observe_error(throttled_response({"Retry-After": in_a_minute}))
+
+    asyncio.run(throttled_call())
+    assert blocked_for(scheduler, "tenant|/subscriptions/a") == pytest.approx(60, abs=2)
+
+
+def test_retry_after_is_capped():
+    scheduler = make_scheduler(max_retry_after_seconds=30.0)
+
+    async def throttled_call():
+        async with scheduler.slot("tenant", "/subscriptions/a") as slot:
+            slot.observe_error(throttled_response({"x-ms-ratelimit-microsoft.costmanagement-entity-retry-after": "86400"}))
+
+    asyncio.run(throttled_call())
+    assert blocked_for(scheduler, "tenant|/subscriptions/a") <= 30.0
+
+
+def test_idle_tenants_and_scopes_are_forgotten():
+    scheduler = make_scheduler(max_tracked_keys=10)
+
+    async def calls():
+        for index in range(50):
+            async with scheduler.slot(f"tenant-{index}", f"/subscriptions/{index}"):
+                pass
+        # A blocked scope is kept however many others come after it.
+        async with scheduler.slot("tenant-blocked", "/subscriptions/blocked") as slot:
+            slot.observe_error(throttled_response({"Retry-After": "120"}))
+        for index in range(50, 100):
+            async with scheduler.slot(f"tenant-{index}", f"/subscriptions/{index}"):
+                pass
+
+    started = time.monotonic()
+    asyncio.run(calls())
+    assert time.monotonic() - started < 5
+    metrics = scheduler.metrics()
+    assert len(metrics["tenants"]) <= 11 and len(metrics["scopes"]) <= 11
+    assert "tenant-blocked|/subscriptions/blocked" in metrics["scopes"]
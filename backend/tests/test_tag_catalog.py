@@ -0,0 +1,63 @@
+"""
+Tests of the searchable tag catalogs (tag_catalog.py). Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_tag_catalog.py
+"""
+import asyncio
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from app.core import azure_client
+from app.core.tag_catalog import TagCatalogCache
+
+
+def tag_details(name: str, values: List[str]) -> SimpleNamespace:
+    return SimpleNamespace(
+        tag_name=name, count=SimpleNamespace(value=len(values)),
+        values_property=[SimpleNamespace(tag_value=value, count=SimpleNamespace(value=1)) for value in values]
+    )
+
+
+class FakeTagOperations:
+    def __init__(self):
+        self.tags = [tag_details("env", ["prod", "test"])]
+        self.calls = 0
+
+    def list(self, **kwargs):
+        self.calls += 1
+        return iter(self.tags)
+
+
+@pytest.fixture
+def fake_tags(monkeypatch) -> FakeTagOperations:
+    tags = FakeTagOperations()
+    client = SimpleNamespace(tags=tags)
+    monkeypatch.setattr(azure_client, "get_resource_management_client", lambda *args, **kwargs: client)
+    return tags
+
+
+def test_catalog_is_served_until_the_ttl_expires(fake_tags):
+    cache = TagCatalogCache(ttl_seconds=3600, max_catalogs=4)
+
+    async def twice():
+        return await cache.get("token", "s1"), await cache.get("token", "s1")
+
+    first, second = asyncio.run(twice())
+    assert first is second
+    assert [tag.tag_name for tag in first.search_tags("E")] == ["env"]
+    assert fake_tags.calls == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_expired_catalog_is_rebuilt_from_azure(fake_tags):
+    cache = TagCatalogCache(ttl_seconds=0, max_catalogs=4)
+    asyncio.run(cache.get("token", "s1"))
+    fake_tags.tags = [tag_details("env", ["prod", "test", "dev"]), tag_details("owner", ["ops"])]
+
+    # The rebuild fetches the tags again instead of reusing a cached tags.list() result.
+    catalog = asyncio.run(cache.get("token", "s1"))
+    assert fake_tags.calls == 2
+    assert [tag.tag_name for tag in catalog.tags] == ["env", "owner"]
+    assert sorted(catalog.get("ENV").values) == ["dev", "prod", "test"]
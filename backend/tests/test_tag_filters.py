@@ -0,0 +1,178 @@
+"""
+Tests of tag filtered cost queries (azure_client.tag_filters_match and query_subscription_costs_with_baseline).
+Run with the `app` package importable, e.g.:
+
+    python -m pytest tests/test_tag_filters.py
+"""
+import asyncio
+from datetime import date, datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from app.core import azure_client
+from app.core.config import settings
+from app.core.cost_cache import cost_result_cache
+
+# (resource group, value of the "env" tag or None when untagged, cost); the tag values differ in case only.
+FIXTURE_ROWS: List[Tuple[str, Optional[str], float]] = [
+    ("caz-a", "Prod", 10.0),
+    ("caz-a", "prod", 5.5),
+    ("caz-a", "test", 3.0),
+    ("caz-b", "PROD", 7.25),
+    ("caz-b", None, 2.0),
+    ("caz-c", "Test", 1.5),
+    ("other", "prod", 4.0),
+]
+
+
+def _tag_expressions(query_filter: Any) -> List[Any]:
+    if query_filter is None:
+        return []
+    if query_filter.and_property:
+        return [expression for part in query_filter.and_property for expression in _tag_expressions(part)]
+    return [query_filter.tags] if query_filter.tags is not None else []
+
+
+def _passes_azure_filter(expressions: List[Any], tag_value: Optional[str]) -> bool:
+    """Cost Management tag filters: case-insensitive values, untagged costs match no value."""
+    for expression in expressions:
+        matched = tag_value is not None and tag_value.lower() in {value.lower() for value in expression.values}
+        if matched != (expression.operator.lower() == "in"):
+            return False
+    return True
+
+
+class FakeQueryOperations:
+    """
+    query.usage over FIXTURE_ROWS, honouring ResourceGroupName / ResourceID / TagKey grouping and tag filters.
+    Daily queries put every row on yesterday, inside the local forecast's history.
+    """
+    def __init__(self):
+        self.calls: List[Dict[str, Any]] = []
+
+    def usage(self, scope: str, parameters: Any, **kwargs: Any) -> Any:
+        grouping = parameters.dataset.grouping or []
+        tag_key = next((group.name for group in grouping if group.type == "TagKey"), None)
+        dimensions = [group.name for group in grouping if group.type != "TagKey"]
+        expressions = _tag_expressions(parameters.dataset.filter)
+        daily = (parameters.dataset.granularity or "").lower() == "daily"
+        self.calls.append({"tag_key": tag_key, "filtered": bool(expressions), "daily": daily})
+        yesterday = int((datetime.now(timezone.utc).date() - timedelta(days=1)).strftime("%Y%m%d"))
+        groups: Dict[Tuple[Any, ...], float] = {}
+        for resource_group, tag_value, cost in FIXTURE_ROWS:
+            if not _passes_azure_filter(expressions, tag_value):
+                continue
+            key: Tuple[Any, ...] = (yesterday,) if daily else ()
+            if "ResourceGroupName" in dimensions:
+                key += (resource_group,)
+            if "ResourceID" in dimensions:
+                key += (f"/subscriptions/s1/resourcegroups/{resource_group}/providers/x/{tag_value}",)
+            if tag_key is not None:
+                key += (tag_key, tag_value or "")
+            groups[key] = groups.get(key, 0.0) + cost
+        column_names = ["Cost"] + (["UsageDate"] if daily else []) + dimensions + (["TagKey", "TagValue"] if tag_key is not None else []) + ["Currency"]
+        rows = [[cost, *key, "EUR"] for key, cost in groups.items()]
+        return SimpleNamespace(columns=[SimpleNamespace(name=name) for name in column_names], rows=rows, next_link=None)
+
+
+@pytest.fixture
+def fake_query(monkeypatch) -> FakeQueryOperations:
+    query = FakeQueryOperations()
+    client = SimpleNamespace(query=query)
+    monkeypatch.setattr(azure_client, "get_cost_management_client", lambda **kwargs: client)
+    monkeypatch.setattr(azure_client, "cost_warehouse", None)
+    monkeypatch.setattr(cost_result_cache, "enabled", False)
+    monkeypatch.setattr(settings, "COST_QUERY_PLANNER_ENABLED", False)
+    monkeypatch.setattr(settings, "COST_QUERY_SHARD_MIN_DAYS", 0)
+    return query
+
+
+def expected_costs(tag_filters: List[dict]) -> Tuple[float, Dict[str, float]]:
+    expressions = [SimpleNamespace(operator=tf["operator"], values=tf["values"]) for tf in tag_filters]
+    by_resource_group: Dict[str, float] = {}
+    total = 0.0
+    for resource_group, tag_value, cost in FIXTURE_ROWS:
+        if _passes_azure_filter(expressions, tag_value):
+            total += cost
+            if resource_group.startswith("caz-"):
+                by_resource_group[resource_group] = by_resource_group.get(resource_group, 0.0) + cost
+    return round(total, 2), by_resource_group
+
+
+def query_with_baseline(tag_filters: List[dict], include: List[str]):
+    return asyncio.run(azure_client.query_subscription_costs_with_baseline(
+        "token", "s1", "Custom", "None", tag_filters=tag_filters,
+        from_date=date(2024, 3, 1), to_date=date(2024, 3, 10), include=include
+    ))
+
+
+def test_tag_filters_match_ignores_case():
+    assert azure_client.tag_filters_match([{"name": "env", "operator": "In", "values": ["prod"]}], "PROD")
+    assert azure_client.tag_filters_match([{"name": "env", "operator": "In", "values": ["Prod"]}], "prod")
+    assert not azure_client.tag_filters_match([{"name": "env", "operator": "NotIn", "values": ["prod"]}], "Prod")
+    assert not azure_client.tag_filters_match([{"name": "env", "operator": "In", "values": ["prod"]}], None)
+    assert azure_client.tag_filters_match([{"name": "env", "operator": "NotIn", "values": ["prod"]}], "")
+
+
+TAG_FILTER_CASES = [
+    [{"name": "env", "operator": "In", "values": ["prod"]}],
+    [{"name": "Env", "operator": "In", "values": ["PROD", "test"]}],
+    [{"name": "env", "operator": "NotIn", "values": ["Prod"]}],
+]
+
+
+@pytest.mark.parametrize("tag_filters", TAG_FILTER_CASES)
+def test_local_tag_split_matches_azure_filter(fake_query, tag_filters):
+    result, baseline = query_with_baseline(tag_filters, ["totals", "resource_groups"])
+    assert [call["tag_key"] for call in fake_query.calls] == [tag_filters[0]["name"].lower()]  # One unfiltered grouped query
+
+    total, by_resource_group = expected_costs(tag_filters)
+    assert result[0] == total
+    assert result[1] == "EUR"
+    assert result[2] == pytest.approx(by_resource_group)
+    assert baseline["baseline_total_cost"] == expected_costs([])[0]
+    assert baseline["baseline_costs_by_resource_group"] == pytest.approx(expected_costs([])[1])
+
+
+@pytest.mark.parametrize("tag_filters", TAG_FILTER_CASES)
+def test_azure_filter_fallback_matches_local_tag_split(fake_query, tag_filters):
+    local_result, local_baseline = query_with_baseline(tag_filters, ["totals", "resource_groups"])
+    fake_query.calls.clear()
+    # Detailed entries need the per-resource rows, so the filter is applied by Azure in a second query.
+    result, baseline = query_with_baseline(tag_filters, ["totals", "resource_groups", "detailed_entries"])
+    assert sorted(call["filtered"] for call in fake_query.calls) == [False, True]
+    assert all(call["tag_key"] is None for call in fake_query.calls)
+
+    total, by_resource_group = expected_costs(tag_filters)
+    assert result[0] == local_result[0] == total
+    assert result[2] == pytest.approx(local_result[2])
+    assert result[2] == pytest.approx(by_resource_group)
+    assert baseline["baseline_total_cost"] == local_baseline["baseline_total_cost"]
+    assert baseline["baseline_costs_by_resource_group"] == pytest.approx(local_baseline["baseline_costs_by_resource_group"])
+
+
+@pytest.mark.parametrize("tag_filters", TAG_FILTER_CASES)
+def test_forecast_histories_come_from_one_tag_grouped_query(fake_query, monkeypatch, tag_filters):
+    monkeypatch.setattr(settings, "COST_FORECAST_ENGINE", "local")
+    result, baseline = query_with_baseline(tag_filters, ["totals", "yearly_forecast"])
+    # The tag grouped actuals plus one tag grouped Daily history for both forecasts.
+    assert sorted((call["tag_key"], call["daily"], call["filtered"]) for call in fake_query.calls) == [
+        (tag_filters[0]["name"].lower(), False, False), (tag_filters[0]["name"].lower(), True, False)
+    ]
+
+    # Same projections as forecasts from separately filtered histories.
+    fake_query.calls.clear()
+
+    def forecast(filters):
+        return asyncio.run(azure_client.query_subscription_costs(
+            "token", "s1", "Custom", "None", tag_filters=filters,
+            from_date=date(2024, 3, 1), to_date=date(2024, 3, 10), include=["yearly_forecast"]
+        ))
+    filtered, unfiltered = forecast(tag_filters), forecast(None)
+    assert [call["filtered"] for call in fake_query.calls] == [True, False]
+    assert result[6] and result[6] == filtered[6]  # Projected locally (the fake client has no forecast API)
+    assert result[5] == pytest.approx(filtered[5])
+    assert baseline["baseline_projected_cost_current_month"] == pytest.approx(unfiltered[5])
+    assert baseline["baseline_yearly_monthly_breakdown"] == unfiltered[6]
@@ -7,8 +7,9 @@ import ProviderBreakdownView from './components/ProviderBreakdownView';
 import SubscriptionOverviewPage from './pages/SubscriptionOverviewPage';
 import {
     fetchSubscriptionCosts,
-    fetchBatchSubscriptionCosts, // Added for batch API call
+    streamBatchSubscriptionCosts, // Overview costs, one NDJSON frame per subscription
     generateReport,
+    fetchReportJob,
     msalInstance,
     initializeMsal,
     loginPopup,
@@ -20,6 +21,11 @@ import { parseAzureResourceId } from './utils/resourceIdParser';
 import SubscriptionComparisonPage from './pages/SubscriptionComparisonPage';
 import DashboardPage from './components/dashboard/DashboardPage';
 
+const reportPollIntervalMs = 2000; // Report jobs are polled until their file is ready
+// Overview batch mode: "subscriptions" (one cost query per subscription) or "scope" (one management group query)
+const batchCostsMode = process.env.REACT_APP_BATCH_COSTS_MODE || 'subscriptions';
+const batchCostsScope = process.env.REACT_APP_BATCH_COSTS_SCOPE; // Optional; the backend defaults to BATCH_COSTS_AGGREGATION_SCOPE
+
 function App() {
     // View Management
     const [currentView, setCurrentView] = useState('initializing'); // 'initializing', 'login_redirect_in_progress', 'overview', 'detail'
@@ -240,41 +246,65 @@ function App() {
                 // Helper function to introduce a delay if needed for rate limiting
                 const delay = (ms) => new Promise(resolve => setTimeout(resolve, ms));
 
-                // Helper function for retrying API calls with exponential backoff
-                const fetchWithRetry = async (batch, params, retries = 3, baseDelay = 5000) => {
+                // Get subscription IDs for the batch request
+                const subscriptionIds = discoveredSubscriptions.map(sub => sub.subscription_id);
+
+                // Streams the costs of all subscriptions (batch-costs/stream) and hands each one to onSubscription as
+                // soon as it arrives. The backend fetches them concurrently with a per-tenant limit and backoff; in
+                // "scope" mode one management group query covers all of them. A stream that fails before any
+                // subscription arrived is retried with exponential backoff.
+                const streamWithRetry = async (params, onSubscription, retries = 3, baseDelay = 5000) => {
+                    const received = new Set();
                     for (let attempt = 0; attempt < retries; attempt++) {
                         try {
-                            const batchData = await fetchBatchSubscriptionCosts(batch, params);
-                            return batchData;
+                            await streamBatchSubscriptionCosts(subscriptionIds, params, (frame) => {
+                                if (frame.type === 'result' || frame.type === 'error') {
+                                    received.add(frame.data.subscription_id);
+                                    onSubscription(frame.data);
+                                }
+                            });
+                            return;
                         } catch (err) {
+                            if (received.size > 0) {
+                                throw err; // Part of the overview is already shown; don't fetch it all again
+                            }
                             let retryAfter = 5000; // Default retry delay
                             if (err.message.includes("429") || err.message.includes("Too Many Requests")) {
                                 // Extract Retry-After from error message if available
                                 const retryAfterMatch = err.message.match(/Retry-After: (\d+)/);
                                 retryAfter = retryAfterMatch ? parseInt(retryAfterMatch[1], 10) * 1000 : baseDelay * Math.pow(2, attempt);
                                 retryAfter += Math.random() * 100; // Add jitter
-                                console.log(`Rate limit error for batch ${batch}. Retrying after ${retryAfter}ms (attempt ${attempt + 1}/${retries})`);
+                                console.log(`Rate limit error for the overview stream. Retrying after ${retryAfter}ms (attempt ${attempt + 1}/${retries})`);
                             } else if (err.message.includes("Network Error") || err.message.includes("ERR_INSUFFICIENT_RESOURCES")) {
                                 retryAfter = baseDelay * Math.pow(2, attempt) + Math.random() * 500; // Longer delay for network errors
-                                console.log(`Network error for batch ${batch}. Retrying after ${retryAfter}ms (attempt ${attempt + 1}/${retries})`);
+                                console.log(`Network error for the overview stream. Retrying after ${retryAfter}ms (attempt ${attempt + 1}/${retries})`);
                             } else {
                                 throw err; // Non-rate-limit or non-network error, throw immediately
                             }
-                            await delay(retryAfter);
                             if (attempt === retries - 1) {
                                 throw err; // Last retry failed, throw the error
                             }
+                            await delay(retryAfter);
                         }
                     }
                 };
-
-                // Get subscription IDs for the batch request
-                const subscriptionIds = discoveredSubscriptions.map(sub => sub.subscription_id);
-                const batchSize = 1; // Reduced to 1 to minimize rate limiting issues
-                const batches = [];
-                for (let i = 0; i < subscriptionIds.length; i += batchSize) {
-                    batches.push(subscriptionIds.slice(i, i + batchSize));
-                }
+                // The overview never renders per-resource entries, so the backend can skip that query grouping
+                const overviewSections = "totals,resource_groups,yearly_forecast";
+                const overviewBatchParams = { include: overviewSections, mode: batchCostsMode, ...(batchCostsScope ? { scope: batchCostsScope } : {}) };
+                // Tag filters go to the backend in "subscriptions" mode; for MonthToDate it also returns the unfiltered
+                // baseline (baseline_* fields) of every subscription, so the aggregate section needs no second pass
+                const batchTagFilters = batchCostsMode === 'scope' ? [] : activeFilters
+                    .filter(f => f.type === 'tag' && f.key)
+                    .map(f => ({ name: f.key, operator: f.operator === '!=' ? 'NotIn' : 'In', values: [f.value] }));
+                const defaultUnfilteredTrigger = "defaultMonthToDate";
+                const baselineInFilteredFetch = batchTagFilters.length > 0 && timeframeParams.timeframe === 'MonthToDate';
+                const baselineData = (subData) => ({
+                    ...subData,
+                    total_cost: subData.baseline_total_cost ?? 0,
+                    costs_by_resource_group: subData.baseline_costs_by_resource_group || {},
+                    projected_cost_current_month: subData.baseline_projected_cost_current_month ?? null,
+                    yearly_monthly_breakdown: subData.baseline_yearly_monthly_breakdown || []
+                });
 
                 // --- Cache Key Prefix and Expiration Settings ---
                 const CACHE_KEY_PREFIX = 'subscriptionDataCache';
@@ -399,38 +429,49 @@ function App() {
                         return newCache;
                     });
 
+                    const filteredReceived = new Set();
                     try {
-                        const overviewTimeframeParams = { ...timeframeParams, granularity: "None" };
-                        // Process batches sequentially with delay to avoid rate limits
-                        const batchResults = [];
-                        for (const batch of batches) {
-                            const batchData = await fetchWithRetry(batch, overviewTimeframeParams);
-                            batchResults.push(...batchData);
-                            await delay(5000); // Increased delay between batches to avoid rate limits
-                        }
-                        // Update state only once after all batches are processed
-                        setOverviewDataCache(prev => {
-                            const newCache = { ...prev };
-                            batchResults.forEach(subData => {
-                                newCache[subData.subscription_id] = { 
-                                    isLoading: false, 
-                                    error: subData.error || null, 
-                                    data: subData.error ? null : subData, 
-                                    triggeredBy: filteredCacheKey 
-                                };
-                                // Cache data individually for each subscription
+                        const overviewTimeframeParams = {
+                            ...timeframeParams, granularity: "None", ...overviewBatchParams,
+                            ...(batchTagFilters.length > 0 ? { tag_filters: batchTagFilters, include_baseline: baselineInFilteredFetch } : {})
+                        };
+                        // Each subscription is shown as soon as its frame arrives
+                        await streamWithRetry(overviewTimeframeParams, (subData) => {
+                            filteredReceived.add(subData.subscription_id);
+                            setOverviewDataCache(prev => ({
+                                ...prev,
+                                [subData.subscription_id]: {
+                                    isLoading: false,
+                                    error: subData.error || null,
+                                    data: subData.error ? null : subData,
+                                    triggeredBy: filteredCacheKey
+                                }
+                            }));
+                            // Cache data individually for each subscription
+                            if (!subData.error) {
+                                setCachedData(subData.subscription_id, filteredCacheKey, subData);
+                            }
+                            if (baselineInFilteredFetch) {
+                                setUnfilteredOverviewDataCache(prev => ({
+                                    ...prev,
+                                    [subData.subscription_id]: {
+                                        isLoading: false,
+                                        error: subData.error || null,
+                                        data: subData.error ? null : baselineData(subData),
+                                        triggeredBy: defaultUnfilteredTrigger
+                                    }
+                                }));
                                 if (!subData.error) {
-                                    setCachedData(subData.subscription_id, filteredCacheKey, subData);
+                                    setCachedData(subData.subscription_id, defaultUnfilteredTrigger, baselineData(subData));
                                 }
-                            });
-                            return newCache;
+                            }
                         });
                     } catch (err) {
-                        console.error(`Failed to fetch batch overview data:`, err);
+                        console.error(`Failed to stream overview data:`, err);
                         setOverviewDataCache(prev => {
                             const newCache = { ...prev };
                             subscriptionIds.forEach(subId => {
-                                if (!isCacheValid(subId, filteredCacheKey)) {
+                                if (!filteredReceived.has(subId) && !isCacheValid(subId, filteredCacheKey)) {
                                     newCache[subId] = { 
                                         isLoading: false, 
                                         error: err.message || "Failed to load data", 
@@ -470,7 +511,6 @@ function App() {
 
                 // --- Handle Unfiltered Data for Aggregate Section ---
                 const isCurrentFilterDefault = areFiltersDefault(activeFilters);
-                const defaultUnfilteredTrigger = "defaultMonthToDate";
                 const shouldFetchUnfiltered = !subscriptionIds.every(subId => isCacheValid(subId, defaultUnfilteredTrigger)) || 
                                               Object.values(unfilteredOverviewDataCache).some(entry => entry.error && !entry.isLoading);
 
@@ -493,7 +533,7 @@ function App() {
                             return newCache;
                         });
                     }
-                } else if (shouldFetchUnfiltered) {
+                } else if (shouldFetchUnfiltered && !(baselineInFilteredFetch && shouldFetchFiltered)) {
                     if (subscriptionIds.every(subId => isCacheValid(subId, defaultUnfilteredTrigger))) {
                         console.log("Using cached unfiltered data for all subscriptions");
                         setUnfilteredOverviewDataCache(prev => {
@@ -527,37 +567,31 @@ function App() {
                             return newCache;
                         });
 
+                        const unfilteredReceived = new Set();
                         try {
-                            const unfilteredTimeframeParams = { timeframe: "MonthToDate", granularity: "None" };
-                            // Process batches sequentially with delay for unfiltered data
-                            const unfilteredBatchResults = [];
-                            for (const batch of batches) {
-                                const batchData = await fetchWithRetry(batch, unfilteredTimeframeParams);
-                                unfilteredBatchResults.push(...batchData);
-                                await delay(5000); // Increased delay between batches to avoid rate limits
-                            }
-                            setUnfilteredOverviewDataCache(prev => {
-                                const newUnfilteredCache = { ...prev };
-                                unfilteredBatchResults.forEach(subData => {
-                                    newUnfilteredCache[subData.subscription_id] = { 
-                                        isLoading: false, 
-                                        error: subData.error || null, 
-                                        data: subData.error ? null : subData, 
-                                        triggeredBy: defaultUnfilteredTrigger 
-                                    };
-                                    // Cache data individually for each subscription
-                                    if (!subData.error) {
-                                        setCachedData(subData.subscription_id, defaultUnfilteredTrigger, subData);
+                            const unfilteredTimeframeParams = { timeframe: "MonthToDate", granularity: "None", ...overviewBatchParams };
+                            await streamWithRetry(unfilteredTimeframeParams, (subData) => {
+                                unfilteredReceived.add(subData.subscription_id);
+                                setUnfilteredOverviewDataCache(prev => ({
+                                    ...prev,
+                                    [subData.subscription_id]: {
+                                        isLoading: false,
+                                        error: subData.error || null,
+                                        data: subData.error ? null : subData,
+                                        triggeredBy: defaultUnfilteredTrigger
                                     }
-                                });
-                                return newUnfilteredCache;
+                                }));
+                                // Cache data individually for each subscription
+                                if (!subData.error) {
+                                    setCachedData(subData.subscription_id, defaultUnfilteredTrigger, subData);
+                                }
                             });
                         } catch (err) {
-                            console.error(`Failed to fetch unfiltered batch overview data:`, err);
+                            console.error(`Failed to stream unfiltered overview data:`, err);
                             setUnfilteredOverviewDataCache(prev => {
                                 const newCache = { ...prev };
                                 subscriptionIds.forEach(subId => {
-                                    if (!isCacheValid(subId, defaultUnfilteredTrigger)) {
+                                    if (!unfilteredReceived.has(subId) && !isCacheValid(subId, defaultUnfilteredTrigger)) {
                                         newCache[subId] = { 
                                             isLoading: false, 
                                             error: err.message || "Failed to load data", 
@@ -572,7 +606,7 @@ function App() {
                     }
                 }
 
-                // Optional delay if multiple batch calls are needed in the future
+                // Optional delay if multiple stream calls are needed in the future
                 await delay(500); // Adjust delay as needed if rate limits are still an issue
                 isFetchingData.current = false; // Reset fetching flag
             };
@@ -674,7 +708,15 @@ function App() {
         try {
             const reportParams = { ...timeframeParams };
             const response = await generateReport(selectedSubscription, reportParams, fileFormat);
-            if (response.download_url) window.open(response.download_url, '_blank');
+            // The report is rendered by a background job; poll it until the file is ready
+            // (a still fresh identical report is reused and comes back completed).
+            let job = response.download_url ? { status: 'completed', download_url: response.download_url } : { status: 'queued' };
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, reportPollIntervalMs));
+                job = await fetchReportJob(response.job_id);
+            }
+            if (job.status === 'failed') throw new Error(job.error || 'Report generation failed.');
+            if (job.download_url) window.open(job.download_url, '_blank');
         } catch (err) {
             setError(err.detail || err.message || `Failed to generate report.`);
         } finally {
@@ -777,6 +819,9 @@ function App() {
                                         <button onClick={() => handleGenerateReport('excel')} disabled={isLoading}>
                                             {isLoading ? 'Processing...' : 'Download Excel'}
                                         </button>
+                                        <button onClick={() => handleGenerateReport('parquet')} disabled={isLoading}>
+                                            {isLoading ? 'Processing...' : 'Download Parquet'}
+                                        </button>
                                     </div>
                                 )}
                             </>
@@ -129,7 +129,8 @@ const AddFilterForm = ({ onAddFilter, onClose, initialTimeframe, initialGranular
               {/* Add other operators if backend supports them, e.g., Contains, DoesNotContain */}
             </Select>
           </FormControl>
-          {selectedTagKeyObject && selectedTagKeyObject.values && selectedTagKeyObject.values.length > 0 ? (
+          {selectedTagKeyObject && selectedTagKeyObject.values && selectedTagKeyObject.values.length > 0
+            && !(selectedTagKeyObject.valueCount > selectedTagKeyObject.values.length) ? (
             <FormControl fullWidth size="small">
               <InputLabel>Tag Value</InputLabel>
               <Select
@@ -183,6 +184,7 @@ const AddFilterForm = ({ onAddFilter, onClose, initialTimeframe, initialGranular
 };
 
 const DEV_SUBSCRIPTION_ID_FOR_TAGS = 'd9f0aeb8-aa43-4c0c-9bc9-31502788ee65'; // AFC-AI2C-CARAVAN-D
+const tagValuesLimit = 200; // Values per tag offered in the dropdown
 
 const FilterBar = ({ activeFilters, onAddFilter, onRemoveFilter, currentSubscriptionId }) => {
   const [anchorEl, setAnchorEl] = useState(null);
@@ -203,7 +205,8 @@ const FilterBar = ({ activeFilters, onAddFilter, onRemoveFilter, currentSubscrip
         console.log("FilterBar: Attempting to fetch available tags from DEV sub:", DEV_SUBSCRIPTION_ID_FOR_TAGS);
         setLoadingTags(true);
         // Always fetch from the DEV_SUBSCRIPTION_ID_FOR_TAGS
-        fetchAvailableTags(DEV_SUBSCRIPTION_ID_FOR_TAGS)
+        // Only the most used values of each tag; tags with more values (valueCount) take a typed value instead
+        fetchAvailableTags(DEV_SUBSCRIPTION_ID_FOR_TAGS, { values_limit: tagValuesLimit })
             .then(tags => {
                 console.log("FilterBar: Fetched tags:", tags);
                 setAvailableTags(tags || []);
@@ -193,7 +193,7 @@ export const logout = () => {
 // --- API Call Functions ---
 
 export const fetchBatchSubscriptionCosts = async (subscriptionIds, params) => {
-    // params: { timeframe, from_date, to_date, granularity }
+    // params: { timeframe, from_date, to_date, granularity, include, mode, scope, tag_filters, include_baseline }
     try {
         const response = await apiClient.post('/cost/subscriptions/batch-costs', {
             subscription_ids: subscriptionIds,
@@ -206,6 +206,46 @@ export const fetchBatchSubscriptionCosts = async (subscriptionIds, params) => {
     }
 };
 
+/**
+ * Streams batch costs as NDJSON frames from /cost/subscriptions/batch-costs/stream.
+ * onFrame is called for every frame as soon as it arrives:
+ *   { type: 'result', index, data }, { type: 'error', index, subscription_id, error, data },
+ *   { type: 'progress', completed, total }
+ * Resolves once the stream is complete.
+ */
+export const streamBatchSubscriptionCosts = async (subscriptionIds, params, onFrame) => {
+    // params: the same as for fetchBatchSubscriptionCosts
+    let consumed = 0;
+    const emitCompleteLines = (text) => {
+        const lastNewline = text.lastIndexOf('\n');
+        if (lastNewline < consumed) return;
+        text.slice(consumed, lastNewline).split('\n').forEach(line => {
+            if (line.trim()) onFrame(JSON.parse(line));
+        });
+        consumed = lastNewline + 1;
+    };
+    try {
+        const response = await apiClient.post('/cost/subscriptions/batch-costs/stream', {
+            subscription_ids: subscriptionIds,
+            ...params
+        }, {
+            responseType: 'text',
+            onDownloadProgress: (progressEvent) => emitCompleteLines(progressEvent.event.target.responseText),
+        });
+        emitCompleteLines(response.data.endsWith('\n') ? response.data : `${response.data}\n`);
+    } catch (error) {
+        console.error('Error streaming batch subscription costs:', error.response ? error.response.data : error.message);
+        // The response is read as text, so an error body (e.g. a 400 for invalid parameters) is still JSON text
+        let detail;
+        try {
+            detail = JSON.parse(error.response?.data || 'null')?.detail;
+        } catch (parseError) {
+            detail = undefined;
+        }
+        throw new Error(detail || error.message || 'Failed to stream batch subscription costs.');
+    }
+};
+
 export const fetchSubscriptions = async () => {
     try {
         const response = await apiClient.get('/cost/subscriptions');
@@ -217,7 +257,7 @@ export const fetchSubscriptions = async () => {
 };
 
 export const fetchSubscriptionCosts = async (subscriptionId, params, activeFilters = []) => {
-    // params: { timeframe, from_date, to_date, granularity }
+    // params: { timeframe, from_date, to_date, granularity, include }
     try {
         // Filter out null/undefined values from params before creating URLSearchParams
         const filteredParams = Object.fromEntries(
@@ -257,7 +297,7 @@ export const fetchSubscriptionCosts = async (subscriptionId, params, activeFilte
 };
 
 export const fetchResourceGroupCosts = async (subscriptionId, resourceGroupName, params) => {
-    // params: { timeframe, from_date, to_date, granularity }
+    // params: { timeframe, from_date, to_date, granularity, include }
     try {
         // Filter out null/undefined values from params before creating URLSearchParams
         const filteredParams = Object.fromEntries(
@@ -277,21 +317,32 @@ export const generateReport = async (subscriptionId, bodyParams, fileFormat = 'c
     // bodyParams: { timeframe, from_date, to_date, granularity }
     try {
         const response = await apiClient.post(`/cost/subscriptions/${subscriptionId}/costs/generate-report?file_format=${fileFormat}`, bodyParams);
-        return response.data; // { message, file_name, download_url }
+        return response.data; // { message, job_id, status_url } - the report is built by a background job
     } catch (error) {
         console.error(`Error generating report for subscription ${subscriptionId}:`, error.response ? error.response.data : error.message);
         throw new Error(error.response?.data?.detail || error.message || `Failed to generate report for ${subscriptionId}. Network error or server unavailable.`);
     }
 };
 
-export const fetchAvailableTags = async (subscriptionId) => {
+export const fetchReportJob = async (jobId) => {
+    try {
+        const response = await apiClient.get(`/cost/reports/${jobId}`);
+        return response.data; // { job_id, status, progress, stage, queue_position, download_url, error, ... }
+    } catch (error) {
+        console.error(`Error fetching report job ${jobId}:`, error.response ? error.response.data : error.message);
+        throw new Error(error.response?.data?.detail || error.message || `Failed to fetch report job ${jobId}. Network error or server unavailable.`);
+    }
+};
+
+export const fetchAvailableTags = async (subscriptionId, params = {}) => {
+    // params: { search, offset, limit, values_limit } - all optional, see /available-tags
     if (!subscriptionId) {
         console.warn("Subscription ID is required to fetch available tags.");
         return []; // Or throw an error
     }
     try {
-        const response = await apiClient.get(`/cost/subscriptions/${subscriptionId}/available-tags`);
-        return response.data; // Expected: List of { tagName: string, values: string[] }
+        const response = await apiClient.get(`/cost/subscriptions/${subscriptionId}/available-tags`, { params });
+        return response.data; // Expected: List of { tagName: string, values: string[], count, valueCount }
     } catch (error) {
         console.error(`Error fetching available tags for subscription ${subscriptionId}:`, error.response ? error.response.data : error.message);
         // Don't throw an error that breaks the UI, maybe return empty or a specific error structure
@@ -300,7 +351,7 @@ export const fetchAvailableTags = async (subscriptionId) => {
 };
 
 // Note: Downloading the file itself is typically handled by setting window.location or an <a> tag's href
-// to the download_url received from generateReport, as the backend will serve the file.
+// to the download_url of a completed report job (fetchReportJob), as the backend will serve the file.
 // For example:
 // const handleDownload = (downloadUrl) => {
 //   window.open(downloadUrl, '_blank'); // Opens in new tab or triggers download